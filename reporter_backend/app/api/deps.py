@@ -1,27 +1,73 @@
-from fastapi import Depends, HTTPException, status
+import asyncio
+import logging
+import threading
+import time
+from typing import AsyncIterator, Optional
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
+from app.core.cache import CacheLRU
+from app.core.cancelacion import ConsultaCancelable, consulta_actual, es_timeout
+from app.core.config import settings
 from app.core.security import SECRET_KEY, ALGORITHM
 from app.core.database import get_auth_connection
 from app.schemas.users import UserOut
+from app.reports import catalogo_sucursales
+
+logger = logging.getLogger("uvicorn.error")
 
 # Esto le dice a Swagger UI dónde obtener el token
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="No se pudieron validar las credenciales",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-        
+# ----------------- Caché de usuarios autenticados -----------------
+#
+# Cada petición resolvía al usuario con un SELECT a la BD de autenticación (el
+# dashboard hace varias a la vez). El usuario resuelto se guarda unos segundos,
+# con llave (usuario, momento de emisión del token). Al editar un usuario desde
+# administración se invalida su entrada, así que bloquearlo o cambiarle el rol
+# aplica de inmediato.
+#
+# Una búsqueda que empezó antes de la edición podría volver a guardar la fila vieja
+# después de invalidar. Por eso cada usuario lleva una generación que la invalidación
+# incrementa: la búsqueda anota la generación antes del SELECT y solo guarda si no
+# cambió (la comparación y el guardado van bajo el mismo candado que la invalidación).
+
+cache_usuarios = CacheLRU("usuarios", settings.USUARIOS_CACHE_MAX_KB * 1024)
+
+_generaciones_lock = threading.Lock()
+_generaciones: dict = {}
+
+_latencias_lock = threading.Lock()
+_latencias = {"aciertos_ms": 0.0, "fallos_ms": 0.0, "aciertos": 0, "fallos": 0}
+
+def _registrar_latencia(acierto: bool, inicio: float) -> None:
+    ms = (time.perf_counter() - inicio) * 1000
+    tipo = "aciertos" if acierto else "fallos"
+    with _latencias_lock:
+        _latencias[tipo] += 1
+        _latencias[f"{tipo}_ms"] += ms
+
+def invalidar_usuario(usuario: str) -> int:
+    """Elimina de la caché todas las entradas del usuario (cualquier token)."""
+    with _generaciones_lock:
+        _generaciones[usuario] = _generaciones.get(usuario, 0) + 1
+        return cache_usuarios.invalidar(lambda clave: clave[0] == usuario)
+
+def _guardar_usuario(clave: tuple, user: dict, generacion: int) -> None:
+    """Guarda en caché solo si el usuario no se invalidó mientras se buscaba."""
+    with _generaciones_lock:
+        if _generaciones.get(clave[0], 0) == generacion:
+            cache_usuarios.guardar(clave, user, settings.USUARIOS_CACHE_TTL_SEG)
+
+def estadisticas_usuarios() -> dict:
+    datos = cache_usuarios.estadisticas()
+    with _latencias_lock:
+        for tipo in ("aciertos", "fallos"):
+            n = _latencias[tipo]
+            datos[f"latencia_{tipo}_ms"] = round(_latencias[f"{tipo}_ms"] / n, 3) if n else 0.0
+    return datos
+
+def _buscar_usuario(username: str):
     conn = get_auth_connection()
     cursor = conn.cursor()
     try:
@@ -29,7 +75,7 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
         cursor.execute("SELECT id, usuario, nombre, apellido, rol, estatus, sucursal_registro FROM admUsuariosWeb WHERE usuario = ?", (username,))
         user = cursor.fetchone()
         if user is None:
-            raise credentials_exception
+            return None
             
         return {
             "id": user[0],
@@ -43,7 +89,112 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
     finally:
         conn.close()
 
+def get_current_user(token: str = Depends(oauth2_scheme)):
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="No se pudieron validar las credenciales",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        username: str = payload.get("sub")
+        if username is None:
+            raise credentials_exception
+    except JWTError:
+        raise credentials_exception
+
+    inicio = time.perf_counter()
+    clave = (username, payload.get("iat"))
+    encontrado, user = cache_usuarios.obtener(clave)
+    if not encontrado:
+        with _generaciones_lock:
+            generacion = _generaciones.get(username, 0)
+        user = _buscar_usuario(username)
+        if user is not None:
+            _guardar_usuario(clave, user, generacion)
+    _registrar_latencia(encontrado, inicio)
+
+    if user is None:
+        raise credentials_exception
+    if user["estatus"] == "bloqueado":
+        raise HTTPException(status_code=403, detail="Acceso denegado. Contacta al administrador.")
+    return user
+
 def get_current_active_admin(current_user: dict = Depends(get_current_user)):
     if current_user["rol"] != "admin":
         raise HTTPException(status_code=403, detail="No tienes permisos de administrador")
-    return current_user
\ No newline at end of file
+    return current_user
+
+def validar_sucursal(sucursal: Optional[str]) -> Optional[str]:
+    """
+    Rechaza (400) una sucursal que no está en el catálogo, antes de consultar SQL Server.
+    Si el catálogo no se pudo cargar, la deja pasar (el filtro usa la comparación recortada).
+    """
+    if not sucursal or not sucursal.strip():
+        return None
+    if catalogo_sucursales.sucursal_valida(sucursal) is False:
+        raise HTTPException(status_code=400, detail=f"Sucursal desconocida: {sucursal.strip()}")
+    return sucursal
+
+def sucursal_de_usuario(user: dict) -> str:
+    """
+    Sucursal fija de un usuario restringido. La asigna el servidor, así que no se
+    rechaza aunque no esté en el catálogo (renombrada o escrita distinto): se avisa
+    en la bitácora y se filtra con ella tal cual.
+    """
+    asignada = user["sucursal_registro"]
+    if catalogo_sucursales.sucursal_valida(asignada) is False:
+        logger.warning(f"SUCURSAL DE USUARIO FUERA DEL CATALOGO: {user['usuario']} -> {asignada}")
+    return asignada
+
+# ----------------- Consultas cancelables por petición -----------------
+#
+# Las rutas de reportes declaran Depends(consulta_cancelable(...), scope="function").
+# Mientras corre la ruta se vigila la conexión del cliente: si se desconecta, se
+# cancelan en SQL Server las sentencias de la petición. Cada tipo de endpoint
+# tiene además su tiempo máximo por sentencia (504 si se excede).
+
+TIMEOUTS_CONSULTA = {
+    "widget": settings.CONSULTA_TIMEOUT_WIDGETS_SEG,
+    "listado": settings.CONSULTA_TIMEOUT_LISTADOS_SEG,
+    "export": settings.CONSULTA_TIMEOUT_EXPORTS_SEG,
+}
+
+async def _vigilar_desconexion(request: Request, consulta: ConsultaCancelable) -> None:
+    # Las rutas de reportes son GET: lo único que queda por recibir del cliente es
+    # la desconexión. (request.is_disconnected() no sirve aquí: detrás del
+    # middleware HTTP nunca alcanza a leer el mensaje.)
+    while True:
+        mensaje = await request.receive()
+        if mensaje["type"] == "http.disconnect":
+            canceladas = consulta.cancelar()
+            logger.info(f"CLIENTE DESCONECTADO: {request.url.path} ({canceladas} sentencias canceladas)")
+            return
+
+def consulta_cancelable(tipo: str):
+    timeout = TIMEOUTS_CONSULTA[tipo]
+
+    async def dependencia(
+        request: Request, current_user: dict = Depends(get_current_user)
+    ) -> AsyncIterator[ConsultaCancelable]:
+        consulta = ConsultaCancelable(request.url.path, timeout, usuario=current_user["usuario"])
+        # No se restablece al salir: una descarga en streaming sigue usando la
+        # misma consulta después de que la ruta regresa la respuesta.
+        consulta_actual.set(consulta)
+        vigia = asyncio.create_task(_vigilar_desconexion(request, consulta))
+        try:
+            yield consulta
+        except Exception as e:
+            if consulta.cancelada:
+                # El cliente ya no está: 499 (convención de nginx) evita registrar un error 500
+                raise HTTPException(status_code=499, detail="Petición cancelada por el cliente")
+            if es_timeout(e):
+                raise HTTPException(
+                    status_code=504,
+                    detail=f"La consulta excedió el tiempo máximo de {timeout} segundos. Reduce el rango de fechas.",
+                )
+            raise
+        finally:
+            vigia.cancel()
+
+    return dependencia
@@ -0,0 +1,114 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from app.api.deps import estadisticas_usuarios, get_current_active_admin
+from app.core import consultas_lentas
+from app.core.admision import estadisticas_admision
+from app.core.config import settings
+from app.core.security import estadisticas_bcrypt
+from app.reports import indice_productos
+from app.reports.cache_reportes import cache_reportes, vuelos_reportes
+
+router = APIRouter()
+
+@router.get("/cache", response_model=dict)
+def estadisticas_cache(current_user: dict = Depends(get_current_active_admin)):
+    """
+    Estadísticas de la caché de reportes (aciertos, fallos, tamaño, expulsiones).
+    
+    Solo accesible por administradores. Útil para ajustar tamaño y TTLs.
+    """
+    return cache_reportes.estadisticas()
+
+@router.get("/cache/usuarios", response_model=dict)
+def estadisticas_cache_usuarios(current_user: dict = Depends(get_current_active_admin)):
+    """
+    Estadísticas de la caché de usuarios autenticados: tasa de aciertos y
+    latencia promedio de resolución (desde caché vs. consulta a la BD).
+    """
+    return estadisticas_usuarios()
+
+@router.get("/bcrypt", response_model=dict)
+def estadisticas_contrasenas(current_user: dict = Depends(get_current_active_admin)):
+    """
+    Métricas del ejecutor de bcrypt: operaciones pendientes, rechazadas (cola llena),
+    rehash por costo bajo y tiempos promedio de espera y de trabajo.
+    """
+    return estadisticas_bcrypt()
+
+@router.get("/admision", response_model=dict)
+def estadisticas_control_admision(current_user: dict = Depends(get_current_active_admin)):
+    """
+    Estado del control de admisión de reportes: turnos en uso, profundidad de la cola
+    y, por clase de endpoint, consultas en curso, en espera, rechazadas y tiempos de espera.
+    """
+    return estadisticas_admision()
+
+@router.get("/coalescencia", response_model=dict)
+def estadisticas_coalescencia(current_user: dict = Depends(get_current_active_admin)):
+    """
+    Consultas idénticas simultáneas: cuántas se ejecutaron, cuántas esperaron el
+    resultado de otra en curso (coalescidas) y la tasa de coalescencia.
+    """
+    return vuelos_reportes.estadisticas()
+
+@router.delete("/cache", response_model=dict)
+def limpiar_cache(current_user: dict = Depends(get_current_active_admin)):
+    """
+    Vacía la caché de reportes (por ejemplo, después de corregir datos en CONTPAQi).
+    """
+    eliminadas = cache_reportes.invalidar()
+    return {"message": "Caché de reportes vaciada", "entradas_eliminadas": eliminadas}
+
+@router.get("/indice-productos", response_model=dict)
+def estadisticas_indice_productos(current_user: dict = Depends(get_current_active_admin)):
+    """
+    Estado del índice en memoria del catálogo de productos (autocompletado).
+    """
+    return indice_productos.estadisticas()
+
+@router.post("/indice-productos/refrescar", response_model=dict)
+def refrescar_indice_productos(current_user: dict = Depends(get_current_active_admin)):
+    """
+    Revisa de inmediato si el catálogo cambió y, si es así, recarga el índice.
+    """
+    recargado = indice_productos.refrescar()
+    return {"recargado": recargado, **indice_productos.estadisticas()}
+
+@router.get("/consultas-lentas", response_model=dict)
+def listar_consultas_lentas(
+    limite: int = Query(100, ge=1, le=1000, description="Máximo de registros a devolver"),
+    orden: str = Query("recientes", pattern="^(recientes|lentas)$", description="'recientes' o 'lentas' (mayor duración primero)"),
+    huella: Optional[str] = Query(None, description="Solo las sentencias con esta huella"),
+    current_user: dict = Depends(get_current_active_admin),
+):
+    """
+    Sentencias que rebasaron el umbral (requiere CONSULTAS_LENTAS_HABILITADO).
+
+    Incluye un resumen por huella (veces, peor y promedio) y el detalle de cada
+    ejecución: parámetros (textos ocultos), duración, filas, endpoint y usuario.
+    """
+    return {
+        "habilitado": settings.CONSULTAS_LENTAS_HABILITADO,
+        "umbral_ms": settings.CONSULTAS_LENTAS_UMBRAL_MS,
+        "resumen": consultas_lentas.resumen(),
+        "registros": consultas_lentas.listar(limite=limite, orden=orden, huella=huella),
+    }
+
+@router.get("/consultas-lentas/planes/{huella}", response_model=dict)
+def plan_consulta_lenta(huella: str, current_user: dict = Depends(get_current_active_admin)):
+    """
+    Plan de ejecución real (XML de SET STATISTICS XML) capturado para la huella.
+    Se puede abrir como .sqlplan en SQL Server Management Studio.
+    """
+    plan = consultas_lentas.obtener_plan(huella)
+    if plan is None:
+        raise HTTPException(status_code=404, detail="No hay plan capturado para esa huella")
+    return plan
+
+@router.delete("/consultas-lentas", response_model=dict)
+def limpiar_consultas_lentas(current_user: dict = Depends(get_current_active_admin)):
+    """
+    Vacía la bitácora de consultas lentas y los planes capturados.
+    """
+    return {"message": "Bitácora de consultas lentas vaciada", "registros_eliminados": consultas_lentas.limpiar()}
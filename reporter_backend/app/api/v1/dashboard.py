@@ -6,31 +6,38 @@ from app.schemas.reports import (
     VentasPorSucursalItem,
     VentasProductoFiltros,
     VentaPorHoraItem,
-    TopProducto
+    TopProducto,
+    DashboardBundle,
 )
 from app.reports.ventas_producto_service import (
-    calcular_kpis,
-    resumen_por_sucursal_mes_actual,
-    obtener_ventas_por_hora,
-    top_productos,
+    calcular_kpis_async,
+    resumen_por_sucursal_mes_actual_async,
+    obtener_ventas_por_hora_async,
+    top_productos_async,
+    obtener_dashboard_bundle,
 )
-from app.api.deps import get_current_user
+from app.api.deps import consulta_cancelable, get_current_user, sucursal_de_usuario, validar_sucursal
+from app.core.admision import control_reportes
 
 router = APIRouter()
 
+# Cancela en SQL Server las sentencias de la petición si el cliente se desconecta
+_cancelable_widget = [Depends(consulta_cancelable("widget"), scope="function")]
+
 def aplicar_candado(sucursal_input: Optional[str], user: dict) -> Optional[str]:
     """
     Aplica reglas de seguridad para filtrar por sucursal.
     
     Si el usuario no es administrador y tiene una sucursal asignada,
     se fuerza el filtro a esa sucursal, ignorando lo que haya solicitado.
+    Una sucursal pedida que no existe en el catálogo se rechaza con 400.
     """
     if user["rol"] != "admin" and user["sucursal_registro"] != "TODAS":
-        return user["sucursal_registro"]
-    return sucursal_input
+        return sucursal_de_usuario(user)
+    return validar_sucursal(sucursal_input)
 
-@router.get("/kpis", response_model=VentasProductoKpis)
-def get_kpis(
+@router.get("/kpis", response_model=VentasProductoKpis, dependencies=_cancelable_widget)
+async def get_kpis(
     sucursal: Optional[str] = Query(None, description="Filtrar por sucursal"),
     mes: Optional[int] = Query(None, ge=1, le=12, description="Mes (1-12)"),
     anio: Optional[int] = Query(None, description="Año"),
@@ -52,10 +59,11 @@ def get_kpis(
         fecha_desde=fecha_desde,
         fecha_hasta=fecha_hasta,
     )
-    return calcular_kpis(filtros)
+    async with control_reportes.turno("widget"):
+        return await calcular_kpis_async(filtros)
 
-@router.get("/ventas-por-sucursal", response_model=List[VentasPorSucursalItem])
-def get_ventas_por_sucursal(
+@router.get("/ventas-por-sucursal", response_model=List[VentasPorSucursalItem], dependencies=_cancelable_widget)
+async def get_ventas_por_sucursal(
     sucursal: Optional[str] = Query(None),
     mes: Optional[int] = Query(None, ge=1, le=12),
     anio: Optional[int] = Query(None),
@@ -66,7 +74,8 @@ def get_ventas_por_sucursal(
     
     Si el usuario tiene permisos limitados, la lista solo contendrá su sucursal.
     """
-    datos = resumen_por_sucursal_mes_actual(mes=mes, anio=anio)
+    async with control_reportes.turno("widget"):
+        datos = await resumen_por_sucursal_mes_actual_async(mes=mes, anio=anio)
     
     if current_user["rol"] != "admin" and current_user["sucursal_registro"] != "TODAS":
         sucursal_permitida = current_user["sucursal_registro"]
@@ -74,8 +83,8 @@ def get_ventas_por_sucursal(
         
     return datos
 
-@router.get("/horas-pico", response_model=List[VentaPorHoraItem])
-def get_horas_pico(
+@router.get("/horas-pico", response_model=List[VentaPorHoraItem], dependencies=_cancelable_widget)
+async def get_horas_pico(
     sucursal: Optional[str] = Query(None),
     mes: Optional[int] = Query(None, ge=1, le=12),
     anio: Optional[int] = Query(None),
@@ -97,10 +106,11 @@ def get_horas_pico(
         fecha_desde=fecha_desde,
         fecha_hasta=fecha_hasta,
     )
-    return obtener_ventas_por_hora(filtros)
+    async with control_reportes.turno("widget"):
+        return await obtener_ventas_por_hora_async(filtros)
 
-@router.get("/top-productos", response_model=List[TopProducto])
-def get_top_productos(
+@router.get("/top-productos", response_model=List[TopProducto], dependencies=_cancelable_widget)
+async def get_top_productos(
     sucursal: Optional[str] = Query(None),
     mes: Optional[int] = Query(None, ge=1, le=12),
     anio: Optional[int] = Query(None),
@@ -116,4 +126,43 @@ def get_top_productos(
         mes=mes,
         anio=anio
     )
-    return top_productos(filtros)
\ No newline at end of file
+    async with control_reportes.turno("widget"):
+        return await top_productos_async(filtros)
+
+@router.get("/bundle", response_model=DashboardBundle, dependencies=_cancelable_widget)
+async def get_bundle(
+    sucursal: Optional[str] = Query(None, description="Filtrar por sucursal"),
+    mes: Optional[int] = Query(None, ge=1, le=12, description="Mes (1-12)"),
+    anio: Optional[int] = Query(None, description="Año"),
+    producto: Optional[str] = Query(None, description="Filtrar por producto"),
+    fecha_desde: Optional[str] = Query(None, description="Fecha inicio (YYYY-MM-DD)"),
+    fecha_hasta: Optional[str] = Query(None, description="Fecha fin (YYYY-MM-DD)"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Obtiene todos los widgets del dashboard en una sola llamada.
+    
+    KPIs, horas pico, top productos y venta por sucursal se consultan en paralelo.
+    Cada widget trae su tiempo de ejecución y, si falló, su mensaje de error sin
+    afectar a los demás.
+    """
+    sucursal_segura = aplicar_candado(sucursal, current_user)
+    
+    filtros = VentasProductoFiltros(
+        sucursal=sucursal_segura,
+        mes=mes,
+        anio=anio,
+        producto=producto,
+        fecha_desde=fecha_desde,
+        fecha_hasta=fecha_hasta,
+    )
+    # Los cuatro widgets corren a la vez: ocupan cuatro turnos
+    async with control_reportes.turno("widget", peso=4):
+        bundle = await obtener_dashboard_bundle(filtros)
+
+    if current_user["rol"] != "admin" and current_user["sucursal_registro"] != "TODAS":
+        sucursal_permitida = current_user["sucursal_registro"]
+        widget = bundle["ventas_por_sucursal"]
+        widget["data"] = [d for d in widget["data"] if d["sucursal"] == sucursal_permitida]
+
+    return bundle
@@ -1,9 +1,10 @@
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException
+from starlette.concurrency import run_in_threadpool
 from app.core.database import get_auth_connection
 from app.schemas.users import UserOut, UserUpdate
-from app.api.deps import get_current_active_admin
-from app.core.security import get_password_hash 
+from app.api.deps import get_current_active_admin, invalidar_usuario
+from app.core.security import get_password_hash_async
 
 router = APIRouter()
 
@@ -44,8 +45,27 @@ def listar_usuarios(current_user: dict = Depends(get_current_active_admin)):
     finally:
         conn.close()
 
+def _actualizar_en_bd(user_id: int, campos: List[str], valores: list) -> None:
+    conn = get_auth_connection()
+    cursor = conn.cursor()
+    try:
+        sql = f"UPDATE admUsuariosWeb SET {', '.join(campos)} WHERE id = ?"
+        cursor.execute(sql, valores + [user_id])
+        conn.commit()
+
+        # Que el cambio (bloqueo, rol, sucursal) aplique ya, sin esperar el TTL de la caché
+        cursor.execute("SELECT usuario FROM admUsuariosWeb WHERE id = ?", (user_id,))
+        fila = cursor.fetchone()
+        if fila:
+            invalidar_usuario(fila[0])
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
 @router.put("/{user_id}", response_model=dict)
-def actualizar_usuario(user_id: int, datos: UserUpdate, current_user: dict = Depends(get_current_active_admin)):
+async def actualizar_usuario(user_id: int, datos: UserUpdate, current_user: dict = Depends(get_current_active_admin)):
     """
     Actualiza la información de un usuario.
     
@@ -55,48 +75,38 @@ def actualizar_usuario(user_id: int, datos: UserUpdate, current_user: dict = Dep
     - Sucursal asignada
     - Contraseña (si se proporciona, se encripta antes de guardar)
     """
-    conn = get_auth_connection()
-    cursor = conn.cursor()
-    try:
-        campos = []
-        valores = []
-        
-        # Mapeo de campos simples
-        if datos.nombre:
-            campos.append("nombre = ?")
-            valores.append(datos.nombre)
-        if datos.apellido:
-            campos.append("apellido = ?")
-            valores.append(datos.apellido)
-        if datos.estatus:
-            campos.append("estatus = ?")
-            valores.append(datos.estatus)
-        if datos.rol:
-            campos.append("rol = ?")
-            valores.append(datos.rol)
-        if datos.sucursal_registro:
-            campos.append("sucursal_registro = ?")
-            valores.append(datos.sucursal_registro)
-            
-        # Lógica especial para Password (Reset)
-        if datos.password:
-            hashed_pwd = get_password_hash(datos.password)
-            campos.append("password_hash = ?")
-            valores.append(hashed_pwd)
-            
-        if not campos:
-            raise HTTPException(status_code=400, detail="No hay datos para actualizar")
-            
-        valores.append(user_id) # Para el WHERE
+    campos = []
+    valores = []
+    
+    # Mapeo de campos simples
+    if datos.nombre:
+        campos.append("nombre = ?")
+        valores.append(datos.nombre)
+    if datos.apellido:
+        campos.append("apellido = ?")
+        valores.append(datos.apellido)
+    if datos.estatus:
+        campos.append("estatus = ?")
+        valores.append(datos.estatus)
+    if datos.rol:
+        campos.append("rol = ?")
+        valores.append(datos.rol)
+    if datos.sucursal_registro:
+        campos.append("sucursal_registro = ?")
+        valores.append(datos.sucursal_registro)
         
-        sql = f"UPDATE admUsuariosWeb SET {', '.join(campos)} WHERE id = ?"
-        cursor.execute(sql, valores)
-        conn.commit()
+    # Lógica especial para Password (Reset): bcrypt en su ejecutor dedicado
+    if datos.password:
+        hashed_pwd = await get_password_hash_async(datos.password)
+        campos.append("password_hash = ?")
+        valores.append(hashed_pwd)
         
+    if not campos:
+        raise HTTPException(status_code=400, detail="No hay datos para actualizar")
+
+    try:
+        await run_in_threadpool(_actualizar_en_bd, user_id, campos, valores)
         return {"message": "Usuario actualizado correctamente"}
     except Exception as e:
-        conn.rollback()
         print(e)
         raise HTTPException(status_code=500, detail="Error al actualizar usuario")
-    finally:
-        conn.close()
\ No newline at end of file
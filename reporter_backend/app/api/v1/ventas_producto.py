@@ -1,16 +1,24 @@
 from datetime import date
-from typing import List, Optional
+from typing import List, Optional, Union
 from fastapi import APIRouter, Query, Depends, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse
 
-from app.schemas.reports import VentasProductoPage, ProductoOpcion
+from app.schemas.reports import VentasProductoPage, VentasProductoColumnas, VentasProductoConteo, ProductoOpcion, TrabajoExportEstado
 from app.reports import ventas_producto_service as service
-from app.api.deps import get_current_user
+from app.reports import export_jobs
+from app.api.deps import consulta_cancelable, get_current_user, sucursal_de_usuario, validar_sucursal
+from app.core.admision import StreamingConTurno, clase_listado, control_reportes
+from app.core.json_rapido import RespuestaJSONRapida
 
+import os
 import traceback 
 
 router = APIRouter()
 
+# Cancela en SQL Server las sentencias de la petición si el cliente se desconecta
+_cancelable_listado = [Depends(consulta_cancelable("listado"), scope="function")]
+_cancelable_export = [Depends(consulta_cancelable("export"), scope="function")]
+
 @router.get("/test")
 def test():
     """
@@ -18,8 +26,8 @@ def test():
     """
     return {"status": "ok"}
 
-@router.get("/rows", response_model=VentasProductoPage)
-def listar_ventas_producto(
+@router.get("/rows", response_model=Union[VentasProductoPage, VentasProductoColumnas], dependencies=_cancelable_listado)
+async def listar_ventas_producto(
     page: int = Query(1, ge=1, description="Número de página para paginación"),
     page_size: int = Query(50, ge=1, le=500, description="Cantidad de registros por página"),
     sucursal: Optional[str] = Query(None, description="Filtrar por nombre de sucursal"),
@@ -29,6 +37,9 @@ def listar_ventas_producto(
     mes: Optional[int] = Query(None, ge=1, le=12, description="Filtrar por número de mes (1-12)"),
     anio: Optional[int] = Query(None, description="Filtrar por año (ej. 2023)"),
     ejecutar: bool = Query(False, description="Si es True, ejecuta la consulta. Si es False, retorna lista vacía (útil para carga inicial)."),
+    cursor: Optional[str] = Query(None, description="Token 'next_cursor' de la página anterior. Si se envía, se pagina por llave en lugar de OFFSET."),
+    conteo: str = Query("exacto", pattern="^(exacto|diferido)$", description="'diferido' devuelve la página sin esperar el COUNT (total estimado); el exacto se pide a /rows/count."),
+    format: str = Query("items", pattern="^(items|columns)$", description="'items': un objeto por renglón. 'columns': un arreglo por columna con diccionario para los textos repetidos (respuesta más chica)."),
     current_user: dict = Depends(get_current_user),
 ):
     """
@@ -36,26 +47,84 @@ def listar_ventas_producto(
     
     Aplica reglas de seguridad:
     - Si el usuario no es admin, solo puede ver datos de su sucursal asignada.
+
+    Paginación:
+    - page/page_size: paginación clásica por número de página.
+    - cursor: paginación por llave; cuesta lo mismo sin importar la profundidad
+      (si la vista no tiene id_movimiento, el cursor pagina por OFFSET).
+
+    El total se reutiliza de caché mientras no cambien los filtros.
+    La respuesta se serializa con orjson sin pasar por el response_model
+    (que queda para la documentación).
+
+    Formato:
+    - items: lista de objetos (VentasProductoPage).
+    - columns: un arreglo por columna más un 'schema'; fecha, mes, producto,
+      unidad y sucursal van codificados con diccionario (VentasProductoColumnas).
     """
     # Seguridad: Restringir sucursal si el usuario no es admin
     if current_user["rol"] != "admin" and current_user["sucursal_registro"] != "TODAS":
-        sucursal = current_user["sucursal_registro"]
+        sucursal = sucursal_de_usuario(current_user)
+    else:
+        sucursal = validar_sucursal(sucursal)
 
-    data = service.listar_ventas_producto(
-        page=page,
-        page_size=page_size,
-        sucursal=sucursal or None,
-        producto=producto or None,
-        fecha_desde=fecha_desde,
-        fecha_hasta=fecha_hasta,
-        mes=mes,
-        anio=anio,
-        ejecutar=ejecutar,
-    )
-    return data
+    # Un cursor solo es barato en páginas profundas si pagina por llave
+    por_llave = bool(cursor) and service.paginacion_por_llave()
+    async with control_reportes.turno(clase_listado(page, cursor if por_llave else None)):
+        try:
+            data = await service.listar_ventas_producto_async(
+                page=page,
+                page_size=page_size,
+                sucursal=sucursal or None,
+                producto=producto or None,
+                fecha_desde=fecha_desde,
+                fecha_hasta=fecha_hasta,
+                mes=mes,
+                anio=anio,
+                ejecutar=ejecutar,
+                cursor=cursor or None,
+                conteo=conteo,
+                formato=format,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    # El servicio ya entrega los tipos finales: sin validar renglón por renglón
+    return RespuestaJSONRapida(data)
+
+@router.get("/rows/count", response_model=VentasProductoConteo, dependencies=_cancelable_listado)
+async def contar_ventas_producto(
+    sucursal: Optional[str] = Query(None, description="Filtrar por nombre de sucursal"),
+    producto: Optional[str] = Query(None, description="Filtrar por código o nombre de producto"),
+    fecha_desde: Optional[date] = Query(None, description="Fecha inicial del rango (YYYY-MM-DD)"),
+    fecha_hasta: Optional[date] = Query(None, description="Fecha final del rango (YYYY-MM-DD)"),
+    mes: Optional[int] = Query(None, ge=1, le=12, description="Filtrar por número de mes (1-12)"),
+    anio: Optional[int] = Query(None, description="Filtrar por año (ej. 2023)"),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Obtiene el total exacto de registros para los filtros dados.
+    
+    Complementa a /rows con conteo='diferido'. El resultado queda en caché,
+    así que las siguientes páginas con los mismos filtros ya no lo recalculan.
+    """
+    if current_user["rol"] != "admin" and current_user["sucursal_registro"] != "TODAS":
+        sucursal = sucursal_de_usuario(current_user)
+    else:
+        sucursal = validar_sucursal(sucursal)
+
+    async with control_reportes.turno("listado"):
+        total = await service.contar_ventas_producto_async(
+            sucursal=sucursal or None,
+            producto=producto or None,
+            fecha_desde=fecha_desde,
+            fecha_hasta=fecha_hasta,
+            mes=mes,
+            anio=anio,
+        )
+    return {"total_items": total}
 
 @router.get("/sucursales", response_model=List[str])
-def listar_sucursales(current_user: dict = Depends(get_current_user)):
+async def listar_sucursales(current_user: dict = Depends(get_current_user)):
     """
     Obtiene la lista de sucursales disponibles.
     
@@ -65,7 +134,7 @@ def listar_sucursales(current_user: dict = Depends(get_current_user)):
         return [current_user["sucursal_registro"]]
 
     try:
-        resultado = service.obtener_sucursales()
+        resultado = await service.obtener_sucursales_async()
         return resultado
     except Exception as e:
         print(f"Error obteniendo sucursales: {e}")
@@ -73,7 +142,7 @@ def listar_sucursales(current_user: dict = Depends(get_current_user)):
         raise e
 
 @router.get("/productos", response_model=List[ProductoOpcion])
-def listar_productos(
+async def listar_productos(
     q: Optional[str] = Query(None, description="Término de búsqueda (código o nombre)"),
     top: int = Query(50, ge=1, le=200, description="Máximo número de resultados a retornar"),
     current_user: dict = Depends(get_current_user)
@@ -81,10 +150,10 @@ def listar_productos(
     """
     Busca productos para el autocompletado de filtros.
     """
-    return service.obtener_productos(q=q, top=top)
+    return await service.obtener_productos_async(q=q, top=top)
 
-@router.get("/export/excel")
-def exportar_excel(
+@router.get("/export/excel", dependencies=_cancelable_export)
+async def exportar_excel(
     sucursal: Optional[str] = Query(None, description="Filtrar por sucursal"),
     producto: Optional[str] = Query(None, description="Filtrar por producto"),
     fecha_desde: Optional[date] = Query(None, description="Fecha inicio"),
@@ -97,11 +166,62 @@ def exportar_excel(
     Genera y descarga un archivo Excel con el reporte de ventas detallado.
     
     Aplica las mismas reglas de seguridad por sucursal que el listado.
+    El archivo se arma en disco por lotes, así que la memoria no crece con el número de filas.
+    """
+    if current_user["rol"] != "admin" and current_user["sucursal_registro"] != "TODAS":
+        sucursal = sucursal_de_usuario(current_user)
+    else:
+        sucursal = validar_sucursal(sucursal)
+
+    async with control_reportes.turno("export"):
+        archivo = await service.exportar_ventas_excel_async(
+            sucursal=sucursal or None,
+            producto=producto or None,
+            fecha_desde=fecha_desde,
+            fecha_hasta=fecha_hasta,
+            mes=mes,
+            anio=anio,
+        )
+    tamano = os.fstat(archivo.fileno()).st_size
+    
+    filename = f"Reporte_Ventas_{date.today()}.xlsx"
+    
+    # El archivo temporal se envía por bloques y se elimina al terminar de leerlo
+    return StreamingResponse(
+        service.leer_en_bloques(archivo), 
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Content-Length": str(tamano),
+        }
+    )
+
+@router.get("/export", dependencies=_cancelable_export)
+async def exportar_datos(
+    format: str = Query("csv", pattern="^(csv|ndjson)$", description="Formato de salida: csv o ndjson (un JSON por línea)"),
+    gzip: bool = Query(False, description="Comprimir la descarga con gzip"),
+    sucursal: Optional[str] = Query(None, description="Filtrar por sucursal"),
+    producto: Optional[str] = Query(None, description="Filtrar por producto"),
+    fecha_desde: Optional[date] = Query(None, description="Fecha inicio"),
+    fecha_hasta: Optional[date] = Query(None, description="Fecha fin"),
+    mes: Optional[int] = Query(None, ge=1, le=12, description="Mes"),
+    anio: Optional[int] = Query(None, description="Año"),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Descarga el detalle de ventas en crudo (CSV o NDJSON) para Power BI, pandas, etc.
+    
+    Las filas se envían conforme salen de la base de datos, sin armar el archivo en memoria.
+    Aplica las mismas reglas de seguridad por sucursal que el listado y el Excel.
     """
     if current_user["rol"] != "admin" and current_user["sucursal_registro"] != "TODAS":
-        sucursal = current_user["sucursal_registro"]
+        sucursal = sucursal_de_usuario(current_user)
+    else:
+        sucursal = validar_sucursal(sucursal)
 
-    file_stream = service.exportar_ventas_excel(
+    contenido = service.exportar_ventas_texto(
+        formato=format,
+        comprimir=gzip,
         sucursal=sucursal or None,
         producto=producto or None,
         fecha_desde=fecha_desde,
@@ -109,11 +229,97 @@ def exportar_excel(
         mes=mes,
         anio=anio,
     )
+
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    filename = f"Ventas_{date.today()}.{format}"
+    if gzip:
+        media_type = "application/gzip"
+        filename += ".gz"
+
+    # Cada bloque se lee de SQL Server en el ejecutor de reportes; el turno se
+    # toma al empezar a enviar y se conserva hasta terminar la descarga
+    return StreamingConTurno(
+        control_reportes,
+        "export",
+        service.iterar_en_bd(contenido),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+
+# --- EXPORTACIONES EN SEGUNDO PLANO ---
+
+def _trabajo_del_usuario(job_id: str, user: dict) -> export_jobs.TrabajoExport:
+    trabajo = export_jobs.obtener_trabajo(job_id)
+    if trabajo is None or (user["rol"] != "admin" and trabajo.usuario != user["usuario"]):
+        raise HTTPException(status_code=404, detail="Exportación no encontrada")
+    return trabajo
+
+@router.post("/export/jobs", response_model=TrabajoExportEstado, status_code=202)
+def crear_exportacion(
+    sucursal: Optional[str] = Query(None, description="Filtrar por sucursal"),
+    producto: Optional[str] = Query(None, description="Filtrar por producto"),
+    fecha_desde: Optional[date] = Query(None, description="Fecha inicio"),
+    fecha_hasta: Optional[date] = Query(None, description="Fecha fin"),
+    mes: Optional[int] = Query(None, ge=1, le=12, description="Mes"),
+    anio: Optional[int] = Query(None, description="Año"),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Encola la generación del Excel detallado en segundo plano.
     
-    filename = f"Reporte_Ventas_{date.today()}.xlsx"
+    Regresa de inmediato con el id del trabajo. El avance se consulta en
+    /export/jobs/{id} y el archivo se descarga en /export/jobs/{id}/download.
+    Aplica las mismas reglas de seguridad por sucursal que el Excel directo.
+    """
+    if current_user["rol"] != "admin" and current_user["sucursal_registro"] != "TODAS":
+        sucursal = sucursal_de_usuario(current_user)
+    else:
+        sucursal = validar_sucursal(sucursal)
+
+    filtros = {
+        "sucursal": sucursal or None,
+        "producto": producto or None,
+        "fecha_desde": fecha_desde,
+        "fecha_hasta": fecha_hasta,
+        "mes": mes,
+        "anio": anio,
+    }
+    try:
+        trabajo = export_jobs.enviar_trabajo(current_user["usuario"], filtros)
+    except export_jobs.LimiteTrabajosExcedido as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return trabajo.a_dict()
+
+@router.get("/export/jobs", response_model=List[TrabajoExportEstado])
+def listar_exportaciones(current_user: dict = Depends(get_current_user)):
+    """
+    Lista las exportaciones vigentes del usuario (todas, si es administrador).
+    """
+    usuario = None if current_user["rol"] == "admin" else current_user["usuario"]
+    return [t.a_dict() for t in export_jobs.listar_trabajos(usuario)]
+
+@router.get("/export/jobs/{job_id}", response_model=TrabajoExportEstado)
+def estado_exportacion(job_id: str, current_user: dict = Depends(get_current_user)):
+    """
+    Consulta el estado y avance (filas escritas) de una exportación.
+    """
+    return _trabajo_del_usuario(job_id, current_user).a_dict()
+
+@router.get("/export/jobs/{job_id}/download")
+def descargar_exportacion(job_id: str, current_user: dict = Depends(get_current_user)):
+    """
+    Descarga el Excel de una exportación terminada.
     
-    return StreamingResponse(
-        file_stream, 
+    El archivo se conserva durante el tiempo de retención configurado y luego se elimina.
+    """
+    trabajo = _trabajo_del_usuario(job_id, current_user)
+    if trabajo.estado != "terminado":
+        raise HTTPException(status_code=409, detail=f"La exportación no está lista (estado: {trabajo.a_dict()['estado']})")
+
+    filename = f"Reporte_Ventas_{trabajo.creado.date()}.xlsx"
+    return FileResponse(
+        trabajo.ruta,
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
\ No newline at end of file
+        filename=filename,
+    )
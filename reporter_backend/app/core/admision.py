@@ -0,0 +1,275 @@
+import asyncio
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.database import REPORTING_HILOS
+from app.core.metricas import Medidor
+
+# ----------------- Control de admisión de reportes -----------------
+#
+# Cuando muchos usuarios piden reportes pesados a la vez, cada petición esperaba
+# hasta pool_timeout por una conexión y todas acababan fallando juntas. Aquí las
+# peticiones pasan primero por un control de admisión:
+#
+# - Capacidad global igual a los hilos del ejecutor de reportes (una consulta por hilo).
+# - Límite propio por clase de endpoint, para que las exportaciones o la paginación
+#   profunda no acaparen todos los turnos.
+# - Cola de espera acotada y ordenada por prioridad: los widgets del dashboard,
+#   que son baratos, pasan antes que los listados, la paginación profunda y las
+#   exportaciones.
+# - Si la cola está llena o la espera excede el máximo, se responde 503 con
+#   Retry-After de inmediato en lugar de dejar la petición colgada.
+#
+# Todo el estado vive en el event loop, así que no necesita candados.
+
+
+class SaturacionReportes(Exception):
+    """No hay turno para la consulta (cola llena o espera agotada)."""
+
+    def __init__(self, mensaje: str, retry_after: int):
+        super().__init__(mensaje)
+        self.retry_after = retry_after
+
+
+@dataclass
+class ClaseAdmision:
+    nombre: str
+    prioridad: int  # menor = pasa antes
+    limite: int
+    en_curso: int = 0
+    en_cola: int = 0
+    admitidas: int = 0
+    rechazadas: int = 0
+    espera_ms_total: float = 0.0
+    espera_ms_max: float = 0.0
+
+    def a_dict(self) -> Dict[str, Any]:
+        return {
+            "prioridad": self.prioridad,
+            "limite": self.limite,
+            "en_curso": self.en_curso,
+            "en_cola": self.en_cola,
+            "admitidas": self.admitidas,
+            "rechazadas": self.rechazadas,
+            "espera_ms_promedio": round(self.espera_ms_total / self.admitidas, 1) if self.admitidas else 0.0,
+            "espera_ms_max": round(self.espera_ms_max, 1),
+        }
+
+
+@dataclass(order=True)
+class _Espera:
+    prioridad: int
+    orden: int
+    clase: ClaseAdmision = field(compare=False)
+    peso: int = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class Turno:
+    """Turno concedido; liberar() es idempotente."""
+
+    def __init__(self, control: "ControlAdmision", clase: ClaseAdmision, peso: int):
+        self._control = control
+        self.clase = clase
+        self.peso = peso
+        self.inicio = time.perf_counter()
+        self._liberado = False
+
+    def liberar(self) -> None:
+        if not self._liberado:
+            self._liberado = True
+            self._control._liberar(self)
+
+
+class ControlAdmision:
+    def __init__(self, capacidad: int, clases: List[ClaseAdmision], max_cola: int, espera_max_seg: float):
+        self.capacidad = capacidad
+        self.clases = {c.nombre: c for c in clases}
+        self.max_cola = max_cola
+        self.espera_max_seg = espera_max_seg
+        self.en_uso = 0
+        self._cola: List[_Espera] = []
+        self._orden = itertools.count()
+        # Promedio móvil de la duración de un turno, para estimar Retry-After
+        self._duracion_ms = 0.0
+
+    # --- Reglas ---
+
+    def _cabe(self, clase: ClaseAdmision, peso: int) -> bool:
+        # Un turno más pesado que la capacidad entra cuando está todo libre
+        libre = self.en_uso == 0 or self.en_uso + peso <= self.capacidad
+        return libre and clase.en_curso + peso <= max(clase.limite, peso)
+
+    def _hay_adelante(self, clase: ClaseAdmision) -> bool:
+        return any(e.prioridad <= clase.prioridad for e in self._cola)
+
+    def _retry_after(self) -> int:
+        turnos = (len(self._cola) + 1) / max(self.capacidad, 1)
+        return min(30, max(1, math.ceil(turnos * self._duracion_ms / 1000)))
+
+    def _conceder(self, clase: ClaseAdmision, peso: int, espera_ms: float) -> Turno:
+        self.en_uso += peso
+        clase.en_curso += peso
+        clase.admitidas += 1
+        clase.espera_ms_total += espera_ms
+        clase.espera_ms_max = max(clase.espera_ms_max, espera_ms)
+        return Turno(self, clase, peso)
+
+    def _rechazar(self, clase: ClaseAdmision, mensaje: str) -> SaturacionReportes:
+        clase.rechazadas += 1
+        return SaturacionReportes(mensaje, self._retry_after())
+
+    def _despachar(self) -> None:
+        """Concede turnos a la cola en orden de prioridad mientras haya capacidad."""
+        for espera in sorted(self._cola):
+            if self.en_uso >= self.capacidad:
+                break
+            if espera.future.done():
+                continue
+            if not self._cabe(espera.clase, espera.peso):
+                # Su clase está en el límite: se salta sin bloquear a las demás,
+                # pero si lo que falta es capacidad global se respeta el orden.
+                if espera.clase.en_curso + espera.peso <= max(espera.clase.limite, espera.peso):
+                    break
+                continue
+            self._quitar(espera)
+            espera.future.set_result(self._conceder(espera.clase, espera.peso, 0.0))
+
+    def _quitar(self, espera: _Espera) -> None:
+        if espera in self._cola:
+            self._cola.remove(espera)
+            espera.clase.en_cola -= 1
+
+    def _liberar(self, turno: Turno) -> None:
+        self.en_uso -= turno.peso
+        turno.clase.en_curso -= turno.peso
+        duracion = (time.perf_counter() - turno.inicio) * 1000
+        self._duracion_ms = duracion if not self._duracion_ms else 0.8 * self._duracion_ms + 0.2 * duracion
+        self._despachar()
+
+    # --- API ---
+
+    async def entrar(self, nombre: str, peso: int = 1) -> Turno:
+        """
+        Espera un turno de la clase indicada.
+        Lanza SaturacionReportes si la cola está llena o se agota la espera máxima.
+        """
+        clase = self.clases[nombre]
+        if not self._hay_adelante(clase) and self._cabe(clase, peso):
+            return self._conceder(clase, peso, 0.0)
+        if len(self._cola) >= self.max_cola:
+            raise self._rechazar(clase, "El servidor de reportes está saturado. Intenta de nuevo en unos segundos.")
+
+        espera = _Espera(clase.prioridad, next(self._orden), clase, peso, asyncio.get_running_loop().create_future())
+        self._cola.append(espera)
+        clase.en_cola += 1
+        # Puede pasar ya si lo que espera adelante está detenido por el límite de su clase
+        self._despachar()
+        inicio = time.perf_counter()
+        try:
+            turno: Turno = await asyncio.wait_for(asyncio.shield(espera.future), self.espera_max_seg)
+        except asyncio.TimeoutError:
+            self._quitar(espera)
+            self._despachar()
+            if not espera.future.done():
+                espera.future.cancel()
+                raise self._rechazar(clase, "La consulta esperó demasiado turno. Intenta de nuevo en unos segundos.")
+            turno = espera.future.result()
+        except BaseException:
+            # Petición cancelada (p. ej. el cliente se desconectó): suelta el lugar o el turno
+            self._quitar(espera)
+            if espera.future.done() and not espera.future.cancelled():
+                espera.future.result().liberar()
+            else:
+                espera.future.cancel()
+                self._despachar()
+            raise
+        espera_ms = (time.perf_counter() - inicio) * 1000
+        clase.espera_ms_total += espera_ms
+        clase.espera_ms_max = max(clase.espera_ms_max, espera_ms)
+        return turno
+
+    @asynccontextmanager
+    async def turno(self, nombre: str, peso: int = 1) -> AsyncIterator[Turno]:
+        t = await self.entrar(nombre, peso)
+        try:
+            yield t
+        finally:
+            t.liberar()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "capacidad": self.capacidad,
+            "en_uso": self.en_uso,
+            "en_cola": len(self._cola),
+            "max_cola": self.max_cola,
+            "espera_max_seg": self.espera_max_seg,
+            "duracion_ms_promedio": round(self._duracion_ms, 1),
+            "clases": {n: c.a_dict() for n, c in self.clases.items()},
+        }
+
+
+class StreamingConTurno(StreamingResponse):
+    """
+    StreamingResponse que ocupa un turno mientras se envía.
+
+    El turno se pide al empezar a enviar la respuesta, antes de los encabezados: si
+    no hay, SaturacionReportes llega a su manejador y el cliente recibe 503. Se
+    suelta al salir de __call__ pase lo que pase; si el cliente se desconecta antes
+    del primer bloque, el cuerpo nunca arranca, pero el turno se libera igual.
+    """
+
+    def __init__(self, control: ControlAdmision, clase: str, contenido: AsyncIterator[bytes], **kwargs: Any):
+        super().__init__(contenido, **kwargs)
+        self._control = control
+        self._clase = clase
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        async with self._control.turno(self._clase):
+            await super().__call__(scope, receive, send)
+
+
+control_reportes = ControlAdmision(
+    capacidad=settings.ADMISION_CAPACIDAD or REPORTING_HILOS,
+    clases=[
+        ClaseAdmision("widget", 0, settings.ADMISION_LIMITE_WIDGETS),
+        ClaseAdmision("listado", 1, settings.ADMISION_LIMITE_LISTADOS),
+        ClaseAdmision("paginacion_profunda", 2, settings.ADMISION_LIMITE_PAGINACION_PROFUNDA),
+        ClaseAdmision("export", 3, settings.ADMISION_LIMITE_EXPORTS),
+    ],
+    max_cola=settings.ADMISION_MAX_COLA,
+    espera_max_seg=settings.ADMISION_ESPERA_MAX_SEG,
+)
+
+
+def _por_clase(campo: str):
+    def leer():
+        for nombre, clase in control_reportes.clases.items():
+            yield (nombre,), getattr(clase, campo)
+    return leer
+
+Medidor("admision_en_curso", "Turnos de reportes ocupados por clase de endpoint.", ("clase",), _por_clase("en_curso"))
+Medidor("admision_en_cola", "Peticiones de reportes esperando turno.", ("clase",), _por_clase("en_cola"))
+Medidor("admision_admitidas_total", "Peticiones de reportes admitidas.", ("clase",), _por_clase("admitidas"), tipo="counter")
+Medidor("admision_rechazadas_total", "Peticiones rechazadas con 503.", ("clase",), _por_clase("rechazadas"), tipo="counter")
+Medidor("admision_espera_segundos_total", "Tiempo total de espera por turno.", ("clase",),
+        lambda: (((n,), c.espera_ms_total / 1000) for n, c in control_reportes.clases.items()), tipo="counter")
+
+
+def clase_listado(page: int, cursor: Optional[str]) -> str:
+    """Las páginas lejanas por OFFSET son caras; con cursor cuestan lo mismo que la primera."""
+    if cursor is None and page > settings.ADMISION_PAGINA_PROFUNDA:
+        return "paginacion_profunda"
+    return "listado"
+
+
+def estadisticas_admision() -> Dict[str, Any]:
+    return control_reportes.estadisticas()
@@ -0,0 +1,108 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from app.core.metricas import Medidor
+
+
+# Cachés creadas en el proceso (para /metrics)
+_instancias: List["CacheLRU"] = []
+
+
+class CacheLRU:
+    """
+    Caché en memoria del proceso, acotada por tamaño en bytes (LRU) y con TTL por entrada.
+
+    Los valores se guardan serializados (pickle): así el tamaño que se contabiliza es
+    real y cada lectura regresa una copia independiente, que el llamador puede
+    modificar sin afectar lo guardado.
+    """
+
+    def __init__(self, nombre: str, max_bytes: int):
+        self.nombre = nombre
+        self.max_bytes = max_bytes
+        self._datos: "OrderedDict[Hashable, Tuple[Optional[float], bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        self.expiraciones = 0
+        _instancias.append(self)
+
+    def obtener(self, clave: Hashable) -> Tuple[bool, Any]:
+        """Regresa (encontrado, valor)."""
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None:
+                expira, crudo = entrada
+                if expira is not None and expira < time.monotonic():
+                    self._quitar(clave)
+                    self.expiraciones += 1
+                else:
+                    self._datos.move_to_end(clave)
+                    self.aciertos += 1
+                    return True, pickle.loads(crudo)
+            self.fallos += 1
+            return False, None
+
+    def guardar(self, clave: Hashable, valor: Any, ttl: Optional[float]) -> None:
+        """Guarda un valor. ttl=None significa sin expiración (solo sale por LRU)."""
+        crudo = pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(crudo) > self.max_bytes:
+            return
+        expira = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            if clave in self._datos:
+                self._quitar(clave)
+            self._datos[clave] = (expira, crudo)
+            self._bytes += len(crudo)
+            while self._bytes > self.max_bytes:
+                viejo = next(iter(self._datos))
+                self._quitar(viejo)
+                self.expulsiones += 1
+
+    def invalidar(self, predicado: Optional[Callable[[Hashable], bool]] = None) -> int:
+        """Elimina las entradas cuya clave cumpla el predicado (todas si no se indica)."""
+        with self._lock:
+            claves = [c for c in self._datos if predicado is None or predicado(c)]
+            for c in claves:
+                self._quitar(c)
+            return len(claves)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "nombre": self.nombre,
+                "entradas": len(self._datos),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": round(self.aciertos / consultas, 4) if consultas else 0.0,
+                "expulsiones": self.expulsiones,
+                "expiraciones": self.expiraciones,
+            }
+
+    def _quitar(self, clave: Hashable) -> None:
+        _, crudo = self._datos.pop(clave)
+        self._bytes -= len(crudo)
+
+
+# --- Métricas ---
+
+def _leer(campo: str):
+    def leer():
+        for cache in list(_instancias):
+            yield (cache.nombre,), cache.estadisticas()[campo]
+    return leer
+
+Medidor("cache_entradas", "Entradas guardadas en la caché.", ("cache",), _leer("entradas"))
+Medidor("cache_bytes", "Bytes ocupados por la caché.", ("cache",), _leer("bytes"))
+Medidor("cache_max_bytes", "Límite de bytes de la caché.", ("cache",), _leer("max_bytes"))
+Medidor("cache_aciertos_total", "Lecturas encontradas en la caché.", ("cache",), _leer("aciertos"), tipo="counter")
+Medidor("cache_fallos_total", "Lecturas no encontradas o vencidas.", ("cache",), _leer("fallos"), tipo="counter")
+Medidor("cache_expulsiones_total", "Entradas expulsadas por falta de espacio.", ("cache",), _leer("expulsiones"), tipo="counter")
@@ -0,0 +1,123 @@
+import threading
+from contextvars import ContextVar
+from typing import Any, List, Optional
+
+from app.core import consultas_lentas
+
+# ----------------- Consultas cancelables -----------------
+#
+# Cada petición de reportes registra aquí su "consulta": las conexiones que pide
+# al pool reciben el tiempo máximo por sentencia de su endpoint y sus cursores
+# quedan anotados. Si el cliente se desconecta (cambió de filtros, cerró la
+# pestaña), cancelar() llama a cursor.cancel() sobre lo que esté ejecutándose en
+# SQL Server, de modo que la consulta abandonada deja de ocupar el servidor y la
+# conexión del pool.
+#
+# La consulta viaja en una contextvar; ejecutar_en_bd copia el contexto al hilo
+# del ejecutor, así que get_connection() la encuentra sin pasarla por parámetro.
+
+
+class ConsultaCancelada(Exception):
+    """La petición se canceló antes de poder ejecutar la sentencia."""
+
+
+# SQLSTATE que devuelve el driver ODBC al vencerse el tiempo de la sentencia
+SQLSTATE_TIMEOUT = "HYT00"
+
+
+def es_timeout(error: BaseException) -> bool:
+    args = getattr(error, "args", ())
+    return bool(args) and args[0] == SQLSTATE_TIMEOUT
+
+
+class ConsultaCancelable:
+    def __init__(self, nombre: str, timeout_seg: int, usuario: Optional[str] = None):
+        self.nombre = nombre
+        self.timeout_seg = timeout_seg
+        self.usuario = usuario
+        self.cancelada = False
+        self._cursores: List[Any] = []
+        self._lock = threading.Lock()
+
+    def verificar(self) -> None:
+        if self.cancelada:
+            raise ConsultaCancelada(f"Consulta '{self.nombre}' cancelada por el cliente")
+
+    def registrar(self, cursor: Any) -> None:
+        with self._lock:
+            self.verificar()
+            self._cursores.append(cursor)
+
+    def soltar(self, cursores: List[Any]) -> None:
+        with self._lock:
+            self._cursores = [c for c in self._cursores if c not in cursores]
+
+    def cancelar(self) -> int:
+        """Cancela las sentencias en curso y las que se intenten después. Regresa cuántas canceló."""
+        with self._lock:
+            self.cancelada = True
+            cursores, self._cursores = self._cursores, []
+        canceladas = 0
+        for cur in cursores:
+            try:
+                cur.cancel()
+                canceladas += 1
+            except Exception:
+                # El cursor pudo haber terminado o cerrado entre tanto
+                pass
+        return canceladas
+
+
+consulta_actual: ContextVar[Optional[ConsultaCancelable]] = ContextVar("consulta_actual", default=None)
+
+
+class ConexionVigilada:
+    """
+    Envuelve la conexión del pool: aplica el tiempo máximo por sentencia y anota
+    cada cursor en la consulta para poder cancelarlo. Con la bitácora de consultas
+    lentas activa, además cronometra cada sentencia. Lo demás se delega.
+    """
+
+    def __init__(self, conn: Any, consulta: Optional[ConsultaCancelable]):
+        self._conn = conn
+        self._consulta = consulta
+        self._cursores: List[Any] = []
+        self._medidos: List[consultas_lentas.CursorMedido] = []
+        if consulta is not None:
+            self._fijar_timeout(consulta.timeout_seg)
+
+    def _fijar_timeout(self, segundos: int) -> None:
+        # pyodbc: Connection.timeout es el tiempo máximo de cada sentencia (0 = sin límite)
+        try:
+            self._conn.driver_connection.timeout = segundos
+        except AttributeError:
+            pass
+
+    def cursor(self) -> Any:
+        cur = self._conn.cursor()
+        if self._consulta is not None:
+            try:
+                self._consulta.registrar(cur)
+            except ConsultaCancelada:
+                cur.close()
+                raise
+            self._cursores.append(cur)
+        if consultas_lentas.activo():
+            medido = consultas_lentas.CursorMedido(cur, self._consulta)
+            self._medidos.append(medido)
+            return medido
+        return cur
+
+    def close(self) -> None:
+        for medido in self._medidos:
+            medido.terminar_sentencia()
+        self._medidos = []
+        if self._consulta is not None:
+            self._consulta.soltar(self._cursores)
+            self._cursores = []
+            # La conexión regresa al pool sin el límite de esta petición
+            self._fijar_timeout(0)
+        self._conn.close()
+
+    def __getattr__(self, nombre: str) -> Any:
+        return getattr(self._conn, nombre)
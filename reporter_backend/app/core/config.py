@@ -22,4 +22,89 @@ class Settings(BaseSettings):
     SQLSERVER_AUTH_DSN: str | None = None
     AUTH_DATABASE_URL: str = "sqlite:///./auth.db"
 
+    # --- POOL DE CONEXIONES DE REPORTES ---
+    # Conexiones a SQL Server (fijas + extra) y segundos de espera por una libre.
+    # REPORTING_HILOS: hilos del ejecutor de consultas; vacío = pool_size + max_overflow.
+    REPORTING_POOL_SIZE: int = 10
+    REPORTING_POOL_MAX_OVERFLOW: int = 20
+    REPORTING_POOL_TIMEOUT: int = 30
+    REPORTING_HILOS: int | None = None
+
+    # --- CONTROL DE ADMISIÓN DE REPORTES ---
+    # ADMISION_CAPACIDAD: consultas simultáneas; vacío = hilos del ejecutor de reportes.
+    # Límite por clase de endpoint, cola de espera y espera máxima antes de responder 503.
+    # ADMISION_PAGINA_PROFUNDA: a partir de esta página (sin cursor) el listado cuenta como paginación profunda.
+    ADMISION_CAPACIDAD: int | None = None
+    ADMISION_LIMITE_WIDGETS: int = 24
+    ADMISION_LIMITE_LISTADOS: int = 16
+    ADMISION_LIMITE_PAGINACION_PROFUNDA: int = 4
+    ADMISION_LIMITE_EXPORTS: int = 4
+    ADMISION_MAX_COLA: int = 100
+    ADMISION_ESPERA_MAX_SEG: float = 10.0
+    ADMISION_PAGINA_PROFUNDA: int = 20
+
+    # --- CANCELACIÓN Y TIEMPO MÁXIMO DE CONSULTAS ---
+    # Segundos máximos por sentencia en SQL Server según el tipo de endpoint (0 = sin límite).
+    CONSULTA_TIMEOUT_WIDGETS_SEG: int = 30
+    CONSULTA_TIMEOUT_LISTADOS_SEG: int = 60
+    CONSULTA_TIMEOUT_EXPORTS_SEG: int = 600
+
+    # --- BITÁCORA DE CONSULTAS LENTAS ---
+    # Apagada por defecto. Guarda en memoria las últimas N sentencias que rebasan el umbral.
+    # CONSULTAS_LENTAS_PLAN: volver a ejecutar las peores (>= PLAN_UMBRAL) para capturar su plan real.
+    # CONSULTAS_LENTAS_MOSTRAR_TEXTO: mostrar los parámetros de texto en lugar de ocultarlos.
+    CONSULTAS_LENTAS_HABILITADO: bool = False
+    CONSULTAS_LENTAS_UMBRAL_MS: int = 1000
+    CONSULTAS_LENTAS_MAX: int = 200
+    CONSULTAS_LENTAS_PLAN: bool = False
+    CONSULTAS_LENTAS_PLAN_UMBRAL_MS: int = 5000
+    CONSULTAS_LENTAS_MOSTRAR_TEXTO: bool = False
+
+    # --- MÉTRICAS (/metrics) ---
+    # Si se define METRICAS_TOKEN, /metrics exige "Authorization: Bearer <token>";
+    # si no, solo responde a un administrador con sesión iniciada.
+    METRICAS_HABILITADAS: bool = True
+    METRICAS_TOKEN: str | None = None
+
+    # --- CONTRASEÑAS (BCRYPT) ---
+    # Costo de bcrypt (los hashes con costo menor se actualizan al iniciar sesión),
+    # hilos dedicados y máximo de operaciones pendientes antes de responder 503.
+    BCRYPT_ROUNDS: int = 12
+    BCRYPT_HILOS: int = 2
+    BCRYPT_MAX_COLA: int = 32
+
+    # --- CACHÉ DE USUARIOS AUTENTICADOS ---
+    # Segundos que se reutiliza el usuario resuelto de un token y tamaño máximo.
+    USUARIOS_CACHE_TTL_SEG: int = 60
+    USUARIOS_CACHE_MAX_KB: int = 512
+
+    # --- CACHÉ DE REPORTES ---
+    # Tamaño máximo en memoria y TTL (segundos) según el periodo consultado:
+    # ABIERTO = el rango incluye hoy, RECIENTE = mes en curso o futuro,
+    # CERRADO = meses anteriores (0 = no expira, solo sale por LRU).
+    REPORTES_CACHE_MAX_MB: int = 64
+    REPORTES_CACHE_TTL_ABIERTO: int = 60
+    REPORTES_CACHE_TTL_RECIENTE: int = 600
+    REPORTES_CACHE_TTL_CERRADO: int = 0
+
+    # --- ÍNDICE DE PRODUCTOS ---
+    # Cada cuántos segundos se revisa si el catálogo de admProductos cambió (autocompletado).
+    PRODUCTOS_INDICE_REFRESCO_SEG: int = 60
+    # Máximo de id_pro que se mandan en un IN (...) al filtrar ventas por producto;
+    # con más coincidencias se filtra con una subconsulta al catálogo.
+    PRODUCTOS_FILTRO_MAX_IDS: int = 1000
+
+    # --- CATÁLOGO DE SUCURSALES ---
+    # Segundos que se reutiliza el mapa nombre -> valores exactos en las vistas.
+    SUCURSALES_CATALOGO_TTL_SEG: int = 3600
+
+    # --- EXPORTACIONES EN SEGUNDO PLANO ---
+    # Procesos dedicados a generar Excel, límites de trabajos activos (en cola o
+    # ejecutándose) y minutos que se conservan los archivos terminados.
+    EXPORT_JOBS_PROCESOS: int = 2
+    EXPORT_JOBS_MAX_POR_USUARIO: int = 2
+    EXPORT_JOBS_MAX_GLOBAL: int = 8
+    EXPORT_JOBS_RETENCION_MIN: int = 60
+    EXPORT_JOBS_DIR: str | None = None
+
 settings = Settings()
\ No newline at end of file
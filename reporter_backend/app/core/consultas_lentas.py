@@ -0,0 +1,302 @@
+import hashlib
+import itertools
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+from app.core.config import settings
+
+logger = logging.getLogger("uvicorn.error")
+
+# ----------------- Bitácora de consultas lentas -----------------
+#
+# Opcional (CONSULTAS_LENTAS_HABILITADO). Cada sentencia que pasa por
+# get_connection() se cronometra desde el execute hasta que se deja de leer el
+# cursor. Las que rebasan el umbral se guardan en memoria (las últimas N) con:
+# huella del SQL, parámetros con los textos ocultos, duración, filas, endpoint y
+# usuario de la petición.
+#
+# Para las peores (CONSULTAS_LENTAS_PLAN_UMBRAL_MS) se puede capturar el plan de
+# ejecución real. No se activa STATISTICS XML en la consulta original (agregaría
+# conjuntos de resultados que el código no espera, p. ej. en los KPIs que usan
+# nextset()): la sentencia se vuelve a ejecutar en segundo plano, en su propia
+# conexión, una a la vez y a lo más una vez por huella cada PLAN_INTERVALO_SEG.
+
+PLAN_INTERVALO_SEG = 600
+# Las exportaciones no se repiten para sacar su plan: se leerían millones de filas
+PLAN_MAX_FILAS = 10_000
+PLAN_MAX_GUARDADOS = 50
+PARAMETROS_MAX = 20
+SQL_MAX_CARACTERES = 4000
+
+_ESPACIOS = re.compile(r"\s+")
+_LISTA_PARAMETROS = re.compile(r"\?(?:\s*,\s*\?)+")
+_NUMEROS = re.compile(r"\b\d+(?:\.\d+)?\b")
+_TIPOS_VISIBLES = (int, float, Decimal, date, datetime, bool)
+
+
+def normalizar_sql(sql: str) -> str:
+    """SQL en una línea, con las listas 'IN (?, ?, ...)' reducidas a '?, ...'."""
+    return _LISTA_PARAMETROS.sub("?, ...", _ESPACIOS.sub(" ", sql).strip())
+
+
+def huella_sql(sql: str) -> str:
+    """Identifica la forma de la sentencia sin importar valores literales ni largo de listas."""
+    forma = _NUMEROS.sub("#", normalizar_sql(sql)).casefold()
+    return hashlib.sha1(forma.encode("utf-8")).hexdigest()[:16]
+
+
+def _redactar(valor: Any) -> Any:
+    if valor is None or isinstance(valor, _TIPOS_VISIBLES):
+        return valor if not isinstance(valor, Decimal) else float(valor)
+    if isinstance(valor, str):
+        # Los textos vienen de lo que escribe el usuario (producto, sucursal)
+        return valor if settings.CONSULTAS_LENTAS_MOSTRAR_TEXTO else f"<texto:{len(valor)}>"
+    return f"<{type(valor).__name__}>"
+
+
+def redactar_parametros(params: Sequence[Any]) -> List[Any]:
+    visibles = [_redactar(p) for p in list(params)[:PARAMETROS_MAX]]
+    if len(params) > PARAMETROS_MAX:
+        visibles.append(f"... (+{len(params) - PARAMETROS_MAX})")
+    return visibles
+
+
+# --- Registro ---
+
+_lock = threading.Lock()
+_registros: Deque[Dict[str, Any]] = deque(maxlen=settings.CONSULTAS_LENTAS_MAX)
+_ids = itertools.count(1)
+_planes: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_ultima_captura: Dict[str, float] = {}
+_capturando = False
+_ejecutor_planes = ThreadPoolExecutor(max_workers=1, thread_name_prefix="plan-consultas")
+
+
+def activo() -> bool:
+    return settings.CONSULTAS_LENTAS_HABILITADO
+
+
+def registrar(sql: str, params: Sequence[Any], ms: float, filas: int, error: Optional[str], consulta: Any) -> None:
+    if ms < settings.CONSULTAS_LENTAS_UMBRAL_MS:
+        return
+    huella = huella_sql(sql)
+    registro = {
+        "id": next(_ids),
+        "momento": datetime.now(),
+        "huella": huella,
+        "sql": normalizar_sql(sql)[:SQL_MAX_CARACTERES],
+        "parametros": redactar_parametros(params),
+        "ms": round(ms, 1),
+        "filas": filas,
+        "endpoint": getattr(consulta, "nombre", None),
+        "usuario": getattr(consulta, "usuario", None),
+        "error": error,
+    }
+    with _lock:
+        _registros.append(registro)
+    logger.warning(f"CONSULTA LENTA {huella}: {registro['ms']} ms, {filas} filas, {registro['endpoint']}")
+    if error is None and filas <= PLAN_MAX_FILAS and ms >= settings.CONSULTAS_LENTAS_PLAN_UMBRAL_MS:
+        _pedir_plan(huella, sql, list(params))
+
+
+def _pedir_plan(huella: str, sql: str, params: List[Any]) -> None:
+    global _capturando
+    if not settings.CONSULTAS_LENTAS_PLAN:
+        return
+    ahora = time.monotonic()
+    with _lock:
+        ultima = _ultima_captura.get(huella)
+        if _capturando or (ultima is not None and ahora - ultima < PLAN_INTERVALO_SEG):
+            return
+        _capturando = True
+        _ultima_captura[huella] = ahora
+    _ejecutor_planes.submit(_capturar_plan, huella, sql, params)
+
+
+def leer_planes(cur: Any) -> List[str]:
+    """
+    Consume los conjuntos de resultados pendientes del cursor y regresa los XML de
+    plan que traigan (con STATISTICS XML o SHOWPLAN_XML activo).
+    """
+    planes = []
+    while True:
+        if cur.description and "Showplan" in (cur.description[0][0] or ""):
+            planes.extend(r[0] for r in cur.fetchall())
+        else:
+            while cur.fetchmany(1000):
+                pass
+        if not cur.nextset():
+            break
+    return planes
+
+
+def _capturar_plan(huella: str, sql: str, params: List[Any]) -> None:
+    global _capturando
+    # Import diferido: database depende (vía cancelacion) de este módulo.
+    # Se usa el motor directo para que esta ejecución no se registre a sí misma.
+    from app.core.database import engine_reporting
+
+    conn = None
+    try:
+        conn = engine_reporting.raw_connection()
+        conn.driver_connection.timeout = settings.CONSULTA_TIMEOUT_LISTADOS_SEG
+        cur = conn.cursor()
+        cur.execute("SET STATISTICS XML ON")
+        try:
+            cur.execute(sql, params)
+            planes = leer_planes(cur)
+        finally:
+            cur.execute("SET STATISTICS XML OFF")
+        if not planes:
+            return
+        with _lock:
+            _planes[huella] = {"huella": huella, "capturado": datetime.now(), "sql": normalizar_sql(sql), "planes": planes}
+            _planes.move_to_end(huella)
+            while len(_planes) > PLAN_MAX_GUARDADOS:
+                _planes.popitem(last=False)
+    except Exception as e:
+        logger.error(f"PLAN CONSULTA {huella} ERROR: {e}")
+    finally:
+        if conn is not None:
+            conn.driver_connection.timeout = 0
+            conn.close()
+        with _lock:
+            _capturando = False
+
+
+# --- Cursor cronometrado ---
+
+class CursorMedido:
+    """
+    Envuelve un cursor de pyodbc. Cada sentencia se cierra (y se registra si fue
+    lenta) al ejecutar la siguiente, al cerrar el cursor o al cerrar la conexión.
+    El tiempo incluye las lecturas (fetch*), que es donde SQL Server sigue trabajando.
+    """
+
+    def __init__(self, cursor: Any, consulta: Any):
+        self._cur = cursor
+        self._consulta = consulta
+        self._sql: Optional[str] = None
+        self._params: Sequence[Any] = ()
+        self._ms = 0.0
+        self._filas = 0
+        self._error: Optional[str] = None
+
+    def _medir(self, fn: Any, *args: Any) -> Any:
+        inicio = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self._ms += (time.perf_counter() - inicio) * 1000
+
+    def execute(self, sql: str, *params: Any) -> "CursorMedido":
+        self.terminar_sentencia()
+        self._sql = sql
+        # pyodbc acepta execute(sql, [p1, p2]) y execute(sql, p1, p2)
+        self._params = params[0] if len(params) == 1 and isinstance(params[0], (list, tuple)) else params
+        try:
+            self._medir(self._cur.execute, sql, *params)
+        except Exception as e:
+            self._error = f"{type(e).__name__}: {e}"[:500]
+            self.terminar_sentencia()
+            raise
+        return self
+
+    def fetchone(self) -> Any:
+        fila = self._medir(self._cur.fetchone)
+        if fila is not None:
+            self._filas += 1
+        return fila
+
+    def fetchmany(self, tamano: int) -> List[Any]:
+        filas = self._medir(self._cur.fetchmany, tamano)
+        self._filas += len(filas)
+        return filas
+
+    def fetchall(self) -> List[Any]:
+        filas = self._medir(self._cur.fetchall)
+        self._filas += len(filas)
+        return filas
+
+    def nextset(self) -> Any:
+        return self._medir(self._cur.nextset)
+
+    def __iter__(self) -> "CursorMedido":
+        return self
+
+    def __next__(self) -> Any:
+        fila = self.fetchone()
+        if fila is None:
+            raise StopIteration
+        return fila
+
+    def terminar_sentencia(self) -> None:
+        if self._sql is None:
+            return
+        try:
+            registrar(self._sql, self._params, self._ms, self._filas, self._error, self._consulta)
+        except Exception as e:
+            logger.error(f"BITACORA CONSULTAS LENTAS ERROR: {e}")
+        self._sql, self._params, self._ms, self._filas, self._error = None, (), 0.0, 0, None
+
+    def close(self) -> None:
+        self.terminar_sentencia()
+        self._cur.close()
+
+    def __getattr__(self, nombre: str) -> Any:
+        return getattr(self._cur, nombre)
+
+
+# --- Consulta (endpoint de administración) ---
+
+def listar(limite: int = 100, orden: str = "recientes", huella: Optional[str] = None) -> List[Dict[str, Any]]:
+    with _lock:
+        registros = [dict(r) for r in _registros if huella is None or r["huella"] == huella]
+        con_plan = set(_planes)
+    if orden == "lentas":
+        registros.sort(key=lambda r: r["ms"], reverse=True)
+    else:
+        registros.reverse()
+    for r in registros[:limite]:
+        r["plan_disponible"] = r["huella"] in con_plan
+    return registros[:limite]
+
+
+def resumen() -> List[Dict[str, Any]]:
+    """Agrupado por huella: cuántas veces, peor y promedio, ordenado por tiempo total."""
+    grupos: Dict[str, Dict[str, Any]] = {}
+    with _lock:
+        registros = list(_registros)
+        con_plan = set(_planes)
+    for r in registros:
+        g = grupos.setdefault(r["huella"], {"huella": r["huella"], "sql": r["sql"], "veces": 0, "ms_total": 0.0, "ms_max": 0.0})
+        g["veces"] += 1
+        g["ms_total"] += r["ms"]
+        g["ms_max"] = max(g["ms_max"], r["ms"])
+    for g in grupos.values():
+        g["ms_promedio"] = round(g["ms_total"] / g["veces"], 1)
+        g["ms_total"] = round(g["ms_total"], 1)
+        g["plan_disponible"] = g["huella"] in con_plan
+    return sorted(grupos.values(), key=lambda g: g["ms_total"], reverse=True)
+
+
+def obtener_plan(huella: str) -> Optional[Dict[str, Any]]:
+    with _lock:
+        plan = _planes.get(huella)
+        return dict(plan) if plan else None
+
+
+def limpiar() -> int:
+    with _lock:
+        eliminados = len(_registros)
+        _registros.clear()
+        _planes.clear()
+        _ultima_captura.clear()
+    return eliminados
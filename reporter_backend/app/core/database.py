@@ -1,13 +1,27 @@
+import asyncio
+import contextvars
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
 from sqlalchemy import create_engine
 from sqlalchemy.engine import URL
+from sqlalchemy.exc import TimeoutError as PoolAgotado
+from . import consultas_lentas
+from .cancelacion import ConexionVigilada, consulta_actual
 from .config import settings
+from .metricas import Medidor, conexion_espera, conexiones_agotadas, conexiones_entregadas
 
 # --- 1. MOTOR DE REPORTES (CONTPAQi) ---
 # Se utiliza para consultas de lectura pesadas (Ventas, Productos).
 url_reporting = URL.create("mssql+pyodbc", query={"odbc_connect": settings.SQLSERVER_REPORTING_DSN})
 engine_reporting = create_engine(
     url_reporting,
-    pool_size=10, max_overflow=20, pool_timeout=30, pool_recycle=1800, pool_pre_ping=True
+    pool_size=settings.REPORTING_POOL_SIZE,
+    max_overflow=settings.REPORTING_POOL_MAX_OVERFLOW,
+    pool_timeout=settings.REPORTING_POOL_TIMEOUT,
+    pool_recycle=1800, pool_pre_ping=True
 )
 
 # --- 2. MOTOR DE AUTH (Usuarios) ---
@@ -26,25 +40,87 @@ else:
         pool_size=5, max_overflow=10, pool_timeout=30, pool_recycle=1800, pool_pre_ping=True
     )
 
+# --- 3. EJECUTOR DE CONSULTAS DE REPORTES ---
+# Las rutas de reportes son async y pyodbc es bloqueante: cada consulta corre en este
+# ejecutor dedicado. Por defecto tiene tantos hilos como conexiones puede dar el pool
+# (pool_size + max_overflow), así los dos límites coinciden: una petición en espera
+# queda en la cola del ejecutor sin ocupar un hilo ni una conexión, y el pool de hilos
+# general (login, estáticos, etc.) no se ve afectado por consultas lentas.
+REPORTING_HILOS = settings.REPORTING_HILOS or (settings.REPORTING_POOL_SIZE + settings.REPORTING_POOL_MAX_OVERFLOW)
+ejecutor_reportes = ThreadPoolExecutor(max_workers=REPORTING_HILOS, thread_name_prefix="reportes-bd")
+
+# --- 4. MÉTRICAS DE LOS POOLS ---
+MOTORES = {"reporting": engine_reporting, "auth": engine_auth}
+
+def _estado_pools(metodo: str):
+    def leer():
+        for nombre, motor in MOTORES.items():
+            # No todos los pools tienen todo (p. ej. SQLite en memoria)
+            fn = getattr(motor.pool, metodo, None)
+            if fn is not None:
+                yield (nombre,), fn()
+    return leer
+
+Medidor("bd_pool_conexiones_en_uso", "Conexiones prestadas en este momento.", ("motor",), _estado_pools("checkedout"))
+Medidor("bd_pool_conexiones_libres", "Conexiones abiertas disponibles en el pool.", ("motor",), _estado_pools("checkedin"))
+Medidor("bd_pool_desborde", "Conexiones por encima de pool_size (negativo: aún no se abren todas).", ("motor",), _estado_pools("overflow"))
+Medidor("bd_pool_tamano", "pool_size configurado.", ("motor",), _estado_pools("size"))
+
 print("--- MOTORES SQL INICIALIZADOS: REPORTING + AUTH ---")
 
+async def ejecutar_en_bd(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Ejecuta una función bloqueante de acceso a reportes en el ejecutor dedicado.
+    Conserva las contextvars del llamador (p. ej. datos de la petición en curso).
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(ejecutor_reportes, functools.partial(ctx.run, fn, *args, **kwargs))
+
 def get_connection():
     """
     Obtiene una conexión directa (raw) a la base de datos de Reportes (CONTPAQi).
     Útil para ejecutar Stored Procedures o consultas complejas.
+
+    Dentro de una petición de reportes la conexión lleva el tiempo máximo por
+    sentencia del endpoint y sus cursores se pueden cancelar (ver app.core.cancelacion).
+    Con la bitácora de consultas lentas activa, sus sentencias se cronometran.
     """
+    consulta = consulta_actual.get()
+    if consulta is not None:
+        consulta.verificar()
+    inicio = time.perf_counter()
     try:
-        return engine_reporting.raw_connection()
+        conn = engine_reporting.raw_connection()
+    except PoolAgotado as e:
+        conexiones_agotadas.inc("reporting")
+        print(f"!!! POOL REPORTING AGOTADO: {e}")
+        raise e
     except Exception as e:
         print(f"!!! ERROR DB REPORTING: {e}")
         raise e
+    finally:
+        conexion_espera.observar(time.perf_counter() - inicio, "reporting")
+    conexiones_entregadas.inc("reporting")
+    if consulta is None and not consultas_lentas.activo():
+        return conn
+    return ConexionVigilada(conn, consulta)
 
 def get_auth_connection():
     """
     Obtiene una conexión directa (raw) a la base de datos de Autenticación.
     """
+    inicio = time.perf_counter()
     try:
-        return engine_auth.raw_connection()
+        conn = engine_auth.raw_connection()
+    except PoolAgotado as e:
+        conexiones_agotadas.inc("auth")
+        print(f"!!! POOL AUTH AGOTADO: {e}")
+        raise e
     except Exception as e:
         print(f"!!! ERROR DB AUTH: {e}")
-        raise e
\ No newline at end of file
+        raise e
+    finally:
+        conexion_espera.observar(time.perf_counter() - inicio, "auth")
+    conexiones_entregadas.inc("auth")
+    return conn
\ No newline at end of file
@@ -0,0 +1,37 @@
+from datetime import date, time
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+# ----------------- Respuestas JSON de alto volumen -----------------
+#
+# Con response_model, FastAPI valida cada renglón contra el modelo de pydantic,
+# lo vuelve a convertir a tipos de JSON y al final lo serializa con el módulo
+# json de la biblioteca estándar. Para páginas grandes (/rows con 500 renglones)
+# eso es casi todo el CPU de la petición, y los datos ya vienen con sus tipos
+# finales del servicio.
+#
+# Las rutas calientes regresan RespuestaJSONRapida: se omite la validación por
+# renglón (el response_model queda solo para la documentación) y se serializa con
+# orjson. La salida es la misma que la de JSONResponse: UTF-8 sin escapar y sin
+# espacios entre separadores.
+
+
+def _por_defecto(valor: Any) -> Any:
+    # Tipos que pueden venir crudos de pyodbc si una columna no pasó por su conversión
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, (date, time)):
+        return str(valor)
+    raise TypeError(f"Tipo no serializable a JSON: {type(valor).__name__}")
+
+
+def dumps(contenido: Any) -> bytes:
+    return orjson.dumps(contenido, default=_por_defecto)
+
+
+class RespuestaJSONRapida(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
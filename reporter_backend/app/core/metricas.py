@@ -0,0 +1,220 @@
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# ----------------- Métricas (formato de texto de Prometheus) -----------------
+#
+# Registro mínimo de contadores, histogramas y medidores, expuesto en /metrics.
+# Registrar una observación es tomar un candado y sumar; no hay hilos ni
+# dependencias extra. Los medidores se calculan al momento de exponer, a partir
+# de funciones que leen el estado vivo (pool, cachés, admisión).
+
+# Segundos: de 5 ms a 2 min
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Bytes: de 64 KB a 1 GB
+LIMITES_BYTES = tuple(float(64 * 1024 * 4 ** i) for i in range(8))
+
+Etiquetas = Tuple[str, ...]
+
+
+def _escapar(valor: Any) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formato_etiquetas(nombres: Sequence[str], valores: Sequence[Any]) -> str:
+    if not nombres:
+        return ""
+    return "{" + ",".join(f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)) + "}"
+
+
+def _formato_numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Registro:
+    def __init__(self) -> None:
+        self._metricas: List["_Metrica"] = []
+        self._lock = threading.Lock()
+
+    def registrar(self, metrica: "_Metrica") -> None:
+        with self._lock:
+            self._metricas.append(metrica)
+
+    def exponer(self) -> str:
+        with self._lock:
+            metricas = list(self._metricas)
+        lineas: List[str] = []
+        for m in metricas:
+            lineas.append(f"# HELP {m.nombre} {m.ayuda}")
+            lineas.append(f"# TYPE {m.nombre} {m.tipo}")
+            lineas.extend(m.lineas())
+        return "\n".join(lineas) + "\n"
+
+
+registro = Registro()
+
+
+class _Metrica:
+    tipo = "untyped"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()
+        registro.registrar(self)
+
+    def lineas(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()):
+        super().__init__(nombre, ayuda, etiquetas)
+        self._valores: Dict[Etiquetas, float] = {}
+
+    def inc(self, *etiquetas: str, valor: float = 1.0) -> None:
+        with self._lock:
+            self._valores[etiquetas] = self._valores.get(etiquetas, 0.0) + valor
+
+    def lineas(self) -> Iterable[str]:
+        with self._lock:
+            valores = list(self._valores.items())
+        for etiquetas, valor in valores:
+            yield f"{self.nombre}{_formato_etiquetas(self.etiquetas, etiquetas)} {_formato_numero(valor)}"
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (), limites: Sequence[float] = LIMITES_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.limites = tuple(limites)
+        # etiquetas -> [conteo por cubeta (no acumulado, la última es +Inf), suma]
+        self._series: Dict[Etiquetas, List[Any]] = {}
+
+    def observar(self, valor: float, *etiquetas: str) -> None:
+        cubeta = bisect_left(self.limites, valor)
+        with self._lock:
+            serie = self._series.get(etiquetas)
+            if serie is None:
+                serie = self._series[etiquetas] = [[0] * (len(self.limites) + 1), 0.0]
+            serie[0][cubeta] += 1
+            serie[1] += valor
+
+    def lineas(self) -> Iterable[str]:
+        with self._lock:
+            series = [(e, list(s[0]), s[1]) for e, s in self._series.items()]
+        nombres_le = self.etiquetas + ("le",)
+        for etiquetas, cubetas, suma in series:
+            acumulado = 0
+            for limite, n in zip(self.limites + (float("inf"),), cubetas):
+                acumulado += n
+                le = _formato_etiquetas(nombres_le, etiquetas + (_formato_numero(limite),))
+                yield f"{self.nombre}_bucket{le} {acumulado}"
+            base = _formato_etiquetas(self.etiquetas, etiquetas)
+            yield f"{self.nombre}_sum{base} {_formato_numero(suma)}"
+            yield f"{self.nombre}_count{base} {acumulado}"
+
+
+class Medidor(_Metrica):
+    """
+    Valor calculado al exponer. 'leer' regresa [(valores de etiquetas, valor), ...].
+    tipo='counter' para totales que ya lleva otro componente (p. ej. aciertos de caché).
+    """
+
+    def __init__(
+        self,
+        nombre: str,
+        ayuda: str,
+        etiquetas: Sequence[str],
+        leer: Callable[[], Iterable[Tuple[Etiquetas, float]]],
+        tipo: str = "gauge",
+    ):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.tipo = tipo
+        self._leer = leer
+
+    def lineas(self) -> Iterable[str]:
+        try:
+            valores = list(self._leer())
+        except Exception:
+            # Una fuente con error no debe tumbar el resto de /metrics
+            return
+        for etiquetas, valor in valores:
+            yield f"{self.nombre}{_formato_etiquetas(self.etiquetas, etiquetas)} {_formato_numero(valor)}"
+
+
+# --- Métricas de la API ---
+
+http_duracion = Histograma(
+    "http_peticion_duracion_segundos", "Duración de las peticiones HTTP por ruta.",
+    ("metodo", "ruta", "estado"),
+)
+
+sql_duracion = Histograma(
+    "reportes_sql_duracion_segundos", "Duración de las consultas de reportes por tipo.", ("tipo",),
+)
+sql_filas = Contador("reportes_sql_filas_total", "Filas leídas de SQL Server por tipo de consulta.", ("tipo",))
+sql_errores = Contador("reportes_sql_errores_total", "Consultas de reportes que terminaron en error.", ("tipo",))
+
+conexion_espera = Histograma(
+    "bd_conexion_espera_segundos", "Tiempo para obtener una conexión del pool.", ("motor",),
+)
+conexiones_entregadas = Contador("bd_conexiones_entregadas_total", "Conexiones tomadas del pool.", ("motor",))
+conexiones_agotadas = Contador(
+    "bd_pool_agotado_total", "Peticiones de conexión que vencieron esperando el pool (pool_timeout).", ("motor",),
+)
+
+export_duracion = Histograma(
+    "exportaciones_duracion_segundos", "Duración de las exportaciones.", ("formato",),
+)
+export_bytes = Histograma(
+    "exportaciones_bytes", "Tamaño de las exportaciones.", ("formato",), limites=LIMITES_BYTES,
+)
+
+
+def _filas_de(valor: Any) -> int:
+    if isinstance(valor, list):
+        return len(valor)
+    if isinstance(valor, dict) and isinstance(valor.get("items"), list):
+        return len(valor["items"])
+    if isinstance(valor, dict) and isinstance(valor.get("length"), int):
+        # Página en formato de columnas
+        return valor["length"]
+    return 1
+
+
+def medir_sql(tipo: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Decorador para las funciones que consultan SQL Server: registra duración, filas
+    (largo de la lista, de 'items' o 'length') y errores. Va debajo de @cacheado para medir
+    solo las consultas reales.
+    """
+    def decorador(fn: Callable[..., Any]) -> Callable[..., Any]:
+        @wraps(fn)
+        def envoltura(*args: Any, **kwargs: Any) -> Any:
+            inicio = time.perf_counter()
+            try:
+                valor = fn(*args, **kwargs)
+            except Exception:
+                sql_errores.inc(tipo)
+                raise
+            finally:
+                sql_duracion.observar(time.perf_counter() - inicio, tipo)
+            sql_filas.inc(tipo, valor=_filas_de(valor))
+            return valor
+        return envoltura
+    return decorador
+
+
+def registrar_exportacion(formato: str, segundos: float, tamano: Optional[int]) -> None:
+    export_duracion.observar(segundos, formato)
+    if tamano is not None:
+        export_bytes.observar(float(tamano), formato)
@@ -1,8 +1,14 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple
 from jose import jwt
 from passlib.context import CryptContext
 
+from app.core.config import settings
+
 # --- CONFIGURACIÓN DE SEGURIDAD ---
 # IMPORTANTE: En un entorno de producción real, SECRET_KEY debe estar en el archivo .env
 # y no hardcodeada aquí.
@@ -10,7 +16,13 @@ SECRET_KEY = "LA_TRASQUILA_SECRET_KEY_2025"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 12 # Duración de la sesión: 12 horas
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# min_rounds: needs_update() marca los hashes con un costo menor al configurado
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+)
 
 def verify_password(plain_password, hashed_password):
     """
@@ -24,6 +36,85 @@ def get_password_hash(password):
     """
     return pwd_context.hash(password)
 
+def verify_and_rehash(plain_password, hashed_password) -> Tuple[bool, Optional[str]]:
+    """
+    Verifica la contraseña y, si el hash tiene un costo menor al configurado
+    (BCRYPT_ROUNDS), regresa también un hash nuevo para guardarlo.
+    Regresa (coincide, hash_nuevo_o_None).
+    """
+    if not pwd_context.verify(plain_password, hashed_password):
+        return False, None
+    if pwd_context.needs_update(hashed_password):
+        return True, pwd_context.hash(plain_password)
+    return True, None
+
+
+# --- EJECUTOR DEDICADO PARA BCRYPT ---
+# bcrypt es deliberadamente lento (~0.2 s por operación). Si corre en el pool de
+# hilos general, un arranque de turno con muchos logins a la vez deja sin hilos a
+# los reportes. Aquí tiene su propio pool acotado y una cola máxima: si se llena,
+# se responde 503 en lugar de acumular esperas.
+
+class ColaBcryptLlena(Exception):
+    """Hay demasiadas operaciones de contraseña pendientes."""
+
+_ejecutor_bcrypt = ThreadPoolExecutor(max_workers=settings.BCRYPT_HILOS, thread_name_prefix="bcrypt")
+_metricas_lock = threading.Lock()
+_metricas: Dict[str, Any] = {
+    "pendientes": 0,
+    "completadas": 0,
+    "rechazadas": 0,
+    "rehash": 0,
+    "espera_ms_total": 0.0,
+    "trabajo_ms_total": 0.0,
+    "trabajo_ms_max": 0.0,
+}
+
+def _medido(encolado: float, fn, *args):
+    inicio = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        fin = time.perf_counter()
+        with _metricas_lock:
+            _metricas["pendientes"] -= 1
+            _metricas["completadas"] += 1
+            _metricas["espera_ms_total"] += (inicio - encolado) * 1000
+            trabajo = (fin - inicio) * 1000
+            _metricas["trabajo_ms_total"] += trabajo
+            _metricas["trabajo_ms_max"] = max(_metricas["trabajo_ms_max"], trabajo)
+
+async def _en_ejecutor_bcrypt(fn, *args):
+    with _metricas_lock:
+        if _metricas["pendientes"] >= settings.BCRYPT_MAX_COLA:
+            _metricas["rechazadas"] += 1
+            raise ColaBcryptLlena("Demasiados inicios de sesión simultáneos. Intenta de nuevo en unos segundos.")
+        _metricas["pendientes"] += 1
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_ejecutor_bcrypt, _medido, time.perf_counter(), fn, *args)
+
+async def verify_password_async(plain_password, hashed_password) -> Tuple[bool, Optional[str]]:
+    """verify_and_rehash en el ejecutor de bcrypt. Lanza ColaBcryptLlena si la cola está llena."""
+    ok, nuevo = await _en_ejecutor_bcrypt(verify_and_rehash, plain_password, hashed_password)
+    if nuevo:
+        with _metricas_lock:
+            _metricas["rehash"] += 1
+    return ok, nuevo
+
+async def get_password_hash_async(password) -> str:
+    """get_password_hash en el ejecutor de bcrypt. Lanza ColaBcryptLlena si la cola está llena."""
+    return await _en_ejecutor_bcrypt(get_password_hash, password)
+
+def estadisticas_bcrypt() -> Dict[str, Any]:
+    with _metricas_lock:
+        datos = dict(_metricas)
+    n = datos["completadas"]
+    datos["espera_ms_promedio"] = round(datos.pop("espera_ms_total") / n, 2) if n else 0.0
+    datos["trabajo_ms_promedio"] = round(datos.pop("trabajo_ms_total") / n, 2) if n else 0.0
+    datos["trabajo_ms_max"] = round(datos["trabajo_ms_max"], 2)
+    datos.update({"hilos": settings.BCRYPT_HILOS, "max_cola": settings.BCRYPT_MAX_COLA, "costo": settings.BCRYPT_ROUNDS})
+    return datos
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """
     Genera un Token JWT (JSON Web Token) que sirve como credencial temporal.
@@ -35,6 +126,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     
-    to_encode.update({"exp": expire})
+    # 'iat' identifica la emisión del token (llave de la caché de usuarios)
+    to_encode.update({"exp": expire, "iat": datetime.utcnow()})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
\ No newline at end of file
@@ -0,0 +1,107 @@
+import copy
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from app.core.cancelacion import consulta_actual
+
+# ----------------- Consultas idénticas en vuelo ("single flight") -----------------
+#
+# A inicio de mes o con un enlace compartido, varios usuarios piden exactamente
+# los mismos filtros a la vez y cada petición lanzaba su propio recorrido de la
+# vista. Aquí la primera petición con una llave ejecuta la consulta y las que
+# llegan mientras tanto esperan su resultado en lugar de repetirla.
+#
+# La llave es la de la caché (tipo de consulta + filtros normalizados), que ya
+# incluye la sucursal después del candado por usuario: dos usuarios restringidos
+# a sucursales distintas nunca comparten resultado.
+#
+# Las funciones son síncronas y corren en el ejecutor de reportes, así que la
+# espera es con threading.Event. Quien espera no tiene conexión tomada.
+
+# Cada cuánto revisa quien espera si su propia petición se canceló
+INTERVALO_ESPERA = 0.5
+
+
+class _Vuelo:
+    __slots__ = ("listo", "valor", "error", "abandonado", "esperando")
+
+    def __init__(self) -> None:
+        self.listo = threading.Event()
+        self.valor: Any = None
+        self.error: Optional[BaseException] = None
+        self.abandonado = False
+        self.esperando = 0
+
+
+class VueloUnico:
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+        self._vuelos: Dict[Hashable, _Vuelo] = {}
+        self._lock = threading.Lock()
+        self.ejecuciones = 0
+        self.coalescidas = 0
+        self.reintentos = 0
+
+    def ejecutar(self, llave: Hashable, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Ejecuta fn(*args, **kwargs) o, si ya hay una ejecución en curso con la misma
+        llave, espera su resultado. Quien espera recibe una copia, igual que de la caché.
+
+        Si la petición que ejecutaba se canceló (el cliente se fue), las que esperan
+        no heredan el error: una de ellas vuelve a ejecutar.
+        """
+        while True:
+            with self._lock:
+                vuelo = self._vuelos.get(llave)
+                if vuelo is None:
+                    vuelo = self._vuelos[llave] = _Vuelo()
+                    self.ejecuciones += 1
+                    lider = True
+                else:
+                    vuelo.esperando += 1
+                    self.coalescidas += 1
+                    lider = False
+
+            if lider:
+                return self._ejecutar_como_lider(llave, vuelo, fn, args, kwargs)
+
+            propia = consulta_actual.get()
+            while not vuelo.listo.wait(INTERVALO_ESPERA):
+                if propia is not None:
+                    propia.verificar()
+            if vuelo.abandonado:
+                with self._lock:
+                    self.reintentos += 1
+                continue
+            if vuelo.error is not None:
+                raise vuelo.error
+            return copy.deepcopy(vuelo.valor)
+
+    def _ejecutar_como_lider(self, llave: Hashable, vuelo: _Vuelo, fn: Callable[..., Any], args: Any, kwargs: Any) -> Any:
+        try:
+            vuelo.valor = fn(*args, **kwargs)
+            return vuelo.valor
+        except BaseException as e:
+            consulta = consulta_actual.get()
+            if consulta is not None and consulta.cancelada:
+                vuelo.abandonado = True
+            else:
+                vuelo.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._vuelos[llave]
+            vuelo.listo.set()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.ejecuciones + self.coalescidas
+            return {
+                "nombre": self.nombre,
+                "en_vuelo": len(self._vuelos),
+                "esperando": sum(v.esperando for v in self._vuelos.values()),
+                "ejecuciones": self.ejecuciones,
+                "coalescidas": self.coalescidas,
+                "reintentos": self.reintentos,
+                "tasa_coalescencia": round(self.coalescidas / total, 4) if total else 0.0,
+            }
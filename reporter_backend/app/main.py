@@ -1,15 +1,34 @@
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, FileResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import traceback
 import os
+import secrets
+import time
+from contextlib import asynccontextmanager
 
 # Importación de routers (controladores) de la API
-from app.api.v1 import ventas_producto, dashboard, auth, users
+from app.api.v1 import ventas_producto, dashboard, auth, users, admin
+from app.reports import catalogo_sucursales, export_jobs, indice_productos
+from app.core.security import ColaBcryptLlena
+from app.core.admision import SaturacionReportes
+from app.core import metricas
+from app.core.config import settings
+from app.api.deps import get_current_active_admin
+
+# --- ARRANQUE Y APAGADO ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Catálogos en memoria, cargados en segundo plano (nunca dentro de una petición)
+    catalogo_sucursales.iniciar()
+    indice_productos.iniciar()
+    yield
+    # Detiene el pool de procesos de exportación
+    export_jobs.apagar()
 
 # Inicialización de la aplicación FastAPI
-app = FastAPI(title="Reportes Ventas Producto", version="1.0.0")
+app = FastAPI(title="Reportes Ventas Producto", version="1.0.0", lifespan=lifespan)
 
 # --- CONFIGURACIÓN CORS ---
 origins = [
@@ -47,17 +66,60 @@ async def catch_exceptions_middleware(request: Request, call_next):
             content={"detail": f"Error interno del servidor: {str(e)}"}
         )
 
+# --- MÉTRICAS DE PETICIONES ---
+# Se registra la plantilla de la ruta (/rows, /export/jobs/{job_id}) y no la URL,
+# para no crear una serie por cada valor de parámetro.
+@app.middleware("http")
+async def medir_peticiones(request: Request, call_next):
+    inicio = time.perf_counter()
+    estado = 500
+    try:
+        response = await call_next(request)
+        estado = response.status_code
+        return response
+    finally:
+        ruta = request.scope.get("route")
+        metricas.http_duracion.observar(
+            time.perf_counter() - inicio, request.method, getattr(ruta, "path", "sin_ruta"), str(estado)
+        )
+
+# Cola de bcrypt llena (muchos logins simultáneos): 503 para que el cliente reintente
+@app.exception_handler(ColaBcryptLlena)
+async def cola_bcrypt_llena_handler(request: Request, exc: ColaBcryptLlena):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "2"})
+
+# Sin turno para consultas de reportes (cola llena o espera agotada)
+@app.exception_handler(SaturacionReportes)
+async def saturacion_reportes_handler(request: Request, exc: SaturacionReportes):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": str(exc.retry_after)})
+
 # --- REGISTRO DE ROUTERS ---
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["Autenticación"])
 app.include_router(users.router, prefix="/api/v1/users", tags=["Usuarios"])
 app.include_router(ventas_producto.router, prefix="/api/v1/ventas-producto", tags=["Ventas Producto"])
 app.include_router(dashboard.router, prefix="/api/v1/dashboard", tags=["Dashboard"])
+app.include_router(admin.router, prefix="/api/v1/admin", tags=["Administración"])
 
 # --- ENDPOINT DE SALUD ---
 @app.get("/health", tags=["General"])
 def health():
     return {"status": "ok"}
 
+# --- MÉTRICAS (PROMETHEUS) ---
+# Nunca quedan abiertas: con METRICAS_TOKEN se pide ese token (para Prometheus);
+# sin él, la sesión de un administrador.
+def _token_metricas(request: Request):
+    esperado = f"Bearer {settings.METRICAS_TOKEN}"
+    if not secrets.compare_digest(request.headers.get("Authorization", ""), esperado):
+        raise HTTPException(status_code=401, detail="Token de métricas inválido", headers={"WWW-Authenticate": "Bearer"})
+
+if settings.METRICAS_HABILITADAS:
+    _acceso_metricas = _token_metricas if settings.METRICAS_TOKEN else get_current_active_admin
+
+    @app.get("/metrics", tags=["General"], include_in_schema=False, dependencies=[Depends(_acceso_metricas)])
+    def exponer_metricas():
+        return PlainTextResponse(metricas.registro.exponer(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # --- SERVIR FRONTEND ---
 # Ruta al directorio dist del frontend
 # app/main.py -> app -> reporter_backend -> ReportesWeb -> reporter_frontend/dist
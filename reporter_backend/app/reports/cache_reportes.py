@@ -0,0 +1,80 @@
+from datetime import date
+from functools import wraps
+from typing import Any, Callable, Optional
+
+from app.core.cache import CacheLRU
+from app.core.config import settings
+from app.core.metricas import Medidor
+from app.core.vuelo_unico import VueloUnico
+from app.reports.filtros import FiltrosNormalizados
+
+# ----------------- Caché de resultados de reportes -----------------
+#
+# Llave: (tipo de consulta, filtros normalizados). Así "mes=11&anio=2024" y
+# "fecha_desde=2024-11-01&fecha_hasta=2024-11-30" comparten la misma entrada.
+# El TTL depende del periodo: lo que ya cerró casi no cambia, lo de hoy sí.
+
+cache_reportes = CacheLRU("reportes", settings.REPORTES_CACHE_MAX_MB * 1024 * 1024)
+
+# Fallos de caché con la misma llave que llegan juntos ejecutan una sola consulta
+vuelos_reportes = VueloUnico("reportes")
+
+Medidor("reportes_consultas_ejecutadas_total", "Consultas que se ejecutaron (no esperaron a otra idéntica).", (),
+        lambda: [((), vuelos_reportes.ejecuciones)], tipo="counter")
+Medidor("reportes_consultas_coalescidas_total", "Consultas que esperaron el resultado de otra idéntica en curso.", (),
+        lambda: [((), vuelos_reportes.coalescidas)], tipo="counter")
+
+
+def clasificar_periodo(filtros: FiltrosNormalizados, hoy: Optional[date] = None) -> str:
+    """Regresa 'abierto', 'reciente' o 'cerrado' según qué tan vivos están los datos del periodo."""
+    hoy = hoy or date.today()
+    inicio_mes = hoy.replace(day=1)
+
+    if filtros.mes is not None:
+        # "Todos los <mes>": incluye el del año en curso
+        return "abierto" if filtros.mes == hoy.month else "reciente"
+    if filtros.hasta is None or filtros.hasta > hoy:
+        # El rango llega hasta hoy o después ('hasta' es exclusivo)
+        if filtros.desde is None or filtros.desde <= hoy:
+            return "abierto"
+        return "reciente"
+    if filtros.hasta <= inicio_mes:
+        return "cerrado"
+    return "reciente"
+
+
+def ttl_para(filtros: FiltrosNormalizados) -> Optional[float]:
+    periodo = clasificar_periodo(filtros)
+    if periodo == "abierto":
+        return settings.REPORTES_CACHE_TTL_ABIERTO
+    if periodo == "reciente":
+        return settings.REPORTES_CACHE_TTL_RECIENTE
+    return settings.REPORTES_CACHE_TTL_CERRADO or None
+
+
+def cacheado(tipo: str, clave_de: Callable[..., FiltrosNormalizados]):
+    """
+    Decorador: guarda el resultado de la función con llave (tipo, clave_de(*args)).
+    Solo se guardan resultados exitosos; las excepciones pasan tal cual.
+    Si otra petición ya está calculando la misma llave, se espera su resultado.
+    """
+    def decorador(fn: Callable[..., Any]) -> Callable[..., Any]:
+        def calcular(llave: Any, filtros: FiltrosNormalizados, args: Any, kwargs: Any) -> Any:
+            # Pudo haberse guardado mientras se llegaba aquí
+            encontrado, valor = cache_reportes.obtener(llave)
+            if encontrado:
+                return valor
+            valor = fn(*args, **kwargs)
+            cache_reportes.guardar(llave, valor, ttl_para(filtros))
+            return valor
+
+        @wraps(fn)
+        def envoltura(*args: Any, **kwargs: Any) -> Any:
+            filtros = clave_de(*args, **kwargs)
+            llave = (tipo, filtros)
+            encontrado, valor = cache_reportes.obtener(llave)
+            if encontrado:
+                return valor
+            return vuelos_reportes.ejecutar(llave, calcular, llave, filtros, args, kwargs)
+        return envoltura
+    return decorador
@@ -0,0 +1,168 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.database import get_connection
+
+logger = logging.getLogger("uvicorn.error")
+
+# ----------------- Catálogo de sucursales -----------------
+#
+# Las vistas guardan el nombre de la sucursal tal como viene de CONTPAQi (a veces
+# con espacios o mayúsculas distintas). Filtrar con LTRIM(RTRIM(col)) = ? obliga a
+# recorrer toda la vista. Aquí se arma, una vez por hora, el mapa de cada nombre
+# visible al valor (o valores) exactos que hay en cada vista, para filtrar con
+# igualdad o IN sobre la columna tal cual.
+#
+# Armarlo recorre las dos vistas (SELECT DISTINCT), así que nunca se hace dentro de
+# una petición: se carga al arrancar la API y se recarga en segundo plano. Mientras
+# no hay catálogo, o si un nombre no tiene valores conocidos (sucursal o grafía
+# nueva desde la última carga), el filtro usa la comparación recortada, que siempre
+# es correcta, y se pide una recarga.
+
+# Sin catálogo (p. ej. la BD no respondía al arrancar) se reintenta cada minuto;
+# por un nombre sin valores conocidos, a lo más cada cinco
+REINTENTO_SEG = 60
+RECARGA_POR_FALTANTE_SEG = 300
+
+# Vista -> columna de sucursal
+COLUMNAS = {
+    "zzVentasResumen": "sucursal",
+    "zzVentasPorProducto": "CNOMBREALMACEN",
+}
+
+
+def canonico(nombre: Optional[str]) -> str:
+    """Forma de comparación: sin espacios en los extremos y sin distinguir mayúsculas."""
+    return (nombre or "").strip().casefold()
+
+
+class CatalogoSucursales:
+    def __init__(self, nombres: List[str], valores: Dict[str, List[Any]]):
+        self.cargado = time.time()
+        # Nombres visibles (zz_SucursalesReporte), en su orden
+        self.nombres = nombres
+        # vista -> nombre canónico -> valores exactos en la columna
+        self.valores: Dict[str, Dict[str, List[str]]] = {}
+        conocidos = {canonico(n) for n in nombres}
+        for vista, crudos in valores.items():
+            mapa: Dict[str, List[str]] = defaultdict(list)
+            for crudo in crudos:
+                if crudo is not None:
+                    mapa[canonico(crudo)].append(crudo)
+                    conocidos.add(canonico(crudo))
+            self.valores[vista] = dict(mapa)
+        self.conocidos = conocidos
+
+    def existe(self, nombre: str) -> bool:
+        return canonico(nombre) in self.conocidos
+
+    def valores_en(self, vista: str, nombre: str) -> List[str]:
+        return self.valores.get(vista, {}).get(canonico(nombre), [])
+
+
+_catalogo: Optional[CatalogoSucursales] = None
+_lock = threading.Lock()
+_recargando = False
+_ultimo_intento: Optional[float] = None
+_habilitado = True
+
+
+def _cargar() -> CatalogoSucursales:
+    conn = None
+    try:
+        conn = get_connection()
+        cur = conn.cursor()
+        cur.execute("SELECT nombre FROM zz_SucursalesReporte WITH (NOLOCK) ORDER BY nombre")
+        nombres = [r[0] for r in cur.fetchall()]
+        valores = {}
+        for vista, columna in COLUMNAS.items():
+            cur.execute(f"SELECT DISTINCT {columna} FROM {vista} WITH (NOLOCK)")
+            valores[vista] = [r[0] for r in cur.fetchall()]
+    finally:
+        if conn: conn.close()
+    return CatalogoSucursales(nombres, valores)
+
+
+def _recargar_en_segundo_plano() -> None:
+    global _catalogo, _recargando
+    try:
+        _catalogo = _cargar()
+    except Exception as e:
+        logger.error(f"CATALOGO SUCURSALES CARGA ERROR: {e}")
+    finally:
+        _recargando = False
+
+
+def _pedir_recarga(intervalo: float) -> None:
+    """Arranca una recarga en segundo plano: una a la vez y no antes de 'intervalo' desde la última."""
+    global _recargando, _ultimo_intento
+    ahora = time.time()
+    with _lock:
+        if not _habilitado or _recargando:
+            return
+        if _ultimo_intento is not None and ahora - _ultimo_intento < intervalo:
+            return
+        _recargando = True
+        _ultimo_intento = ahora
+    threading.Thread(target=_recargar_en_segundo_plano, name="catalogo-sucursales", daemon=True).start()
+
+
+def iniciar() -> None:
+    """Primera carga, en segundo plano (al arrancar la API)."""
+    _pedir_recarga(0)
+
+
+def deshabilitar() -> None:
+    """Deja el proceso sin catálogo (procesos de exportación): los filtros usan la comparación recortada."""
+    global _habilitado
+    _habilitado = False
+
+
+def obtener_catalogo() -> Optional[CatalogoSucursales]:
+    """
+    Regresa el catálogo vigente sin tocar la BD. Al vencer se recarga en segundo
+    plano mientras se sigue usando el anterior.
+    Regresa None si todavía no se ha podido cargar.
+    """
+    if not _habilitado:
+        return None
+    catalogo = _catalogo
+    if catalogo is None or time.time() - catalogo.cargado >= settings.SUCURSALES_CATALOGO_TTL_SEG:
+        _pedir_recarga(REINTENTO_SEG)
+    return catalogo
+
+
+def disponible() -> bool:
+    """True si ya hay un catálogo cargado."""
+    return _catalogo is not None
+
+
+def sucursal_valida(nombre: str) -> Optional[bool]:
+    """True/False si la sucursal existe; None si el catálogo no está disponible."""
+    catalogo = obtener_catalogo()
+    if catalogo is None:
+        return None
+    if catalogo.existe(nombre):
+        return True
+    # Puede ser una sucursal dada de alta después de la carga
+    _pedir_recarga(RECARGA_POR_FALTANTE_SEG)
+    return False
+
+
+def valores_sucursal(vista: str, nombre: str) -> Optional[List[str]]:
+    """
+    Valores exactos de la sucursal en la vista.
+    None si no se conocen (catálogo no disponible o nombre sin valores en la última carga).
+    """
+    catalogo = obtener_catalogo()
+    if catalogo is None:
+        return None
+    valores = catalogo.valores_en(vista, nombre)
+    if not valores:
+        _pedir_recarga(RECARGA_POR_FALTANTE_SEG)
+        return None
+    return valores
@@ -1,11 +1,16 @@
 from openpyxl import Workbook
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from openpyxl.drawing.image import Image
 from openpyxl.utils import get_column_letter
-from typing import List, Dict, Any
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Sequence, Tuple
 from io import BytesIO
 from pathlib import Path
+from xml.sax.saxutils import escape
 import os
+import shutil
+import tempfile
+import zipfile
 
 # ==========================================
 # SECCIÓN DE PERSONALIZACIÓN DE COLORES
@@ -267,4 +272,256 @@ def generar_excel_ventas_producto(items: List[Dict[str, Any]], filtros_info: str
     output = BytesIO()
     wb.save(output)
     output.seek(0)
-    return output
\ No newline at end of file
+    return output
+
+
+# ==========================================
+# VERSIÓN STREAMING (ALTO RENDIMIENTO)
+# ==========================================
+# Misma presentación que generar_excel_ventas_producto, pensada para cientos de miles
+# de filas. openpyxl crea un objeto por celda y registra sus estilos uno por uno, lo que
+# cuesta más que los datos. Aquí se separa el trabajo:
+#
+# 1. El "esqueleto" del reporte (títulos, logo, encabezados, totales, anchos, filtros)
+#    se sigue armando con openpyxl, igual que antes.
+# 2. Los estilos de las filas de detalle se registran una sola vez en una fila plantilla
+#    (la 7) y se usan sus ids ya resueltos.
+# 3. Las filas de detalle se escriben directo como XML a un archivo temporal, conforme
+#    llegan los lotes, y al final se insertan en la hoja en lugar de la fila plantilla.
+#
+# Recibe lotes de tuplas con las 9 columnas del reporte:
+# (código, producto, cantidad, unidad, precio, importe, descuento, impuesto, total)
+
+_HOJA_XML = "xl/worksheets/sheet1.xml"
+_FILA_DATOS = 7
+_TAMANO_COPIA = 1024 * 1024
+
+
+def _estilos_reporte() -> Dict[str, Any]:
+    """Estilos del reporte (mismos que generar_excel_ventas_producto)."""
+    lado = Side(style='thin', color='000000')
+    return {
+        "font_white_bold": Font(color=COLOR_WHITE, bold=True, size=12, name='Arial'),
+        "font_header_table": Font(color=COLOR_WHITE, bold=True, size=11, name='Arial'),
+        "font_normal": Font(name='Arial', size=10),
+        "font_bold": Font(bold=True, name='Arial'),
+        "font_total_label": Font(color=COLOR_TOTAL_TEXT, bold=True, size=12, name='Arial'),
+        "font_total_value": Font(color=COLOR_TOTAL_TEXT, bold=True, name='Arial'),
+        "fill_orange": PatternFill(start_color=COLOR_HEADER_ORANGE, end_color=COLOR_HEADER_ORANGE, fill_type="solid"),
+        "fill_green": PatternFill(start_color=COLOR_SUBHEADER_GREEN, end_color=COLOR_SUBHEADER_GREEN, fill_type="solid"),
+        "fill_total": PatternFill(start_color=COLOR_TOTAL_BG, end_color=COLOR_TOTAL_BG, fill_type="solid"),
+        "border_table": Border(left=lado, right=lado, top=lado, bottom=lado),
+        "border_header": Border(right=Side(style='thin', color='FFFFFF')),
+        "align_left_center": Alignment(horizontal='left', vertical='center'),
+    }
+
+
+def _nuevo_esqueleto(filtros_info: str, periodo_texto: str) -> Tuple[Workbook, Any, Dict[str, Any], List[int]]:
+    """
+    Arma las filas 1-6 del reporte y la fila plantilla de detalle.
+    Regresa (libro, hoja, estilos, ids de estilo de las 9 columnas de detalle).
+    """
+    e = _estilos_reporte()
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Reporte Ventas"
+
+    # --- ENCABEZADOS (FILAS 1-4) ---
+    textos = [
+        ("COMERCIALIZADORA LA TRASQUILA SA DE CV", e["fill_orange"]),
+        ("RFC: CTR2506114T9", e["fill_orange"]),
+        (f"SUCURSAL: {filtros_info}", e["fill_green"]),
+        (f"REPORTE DE VENTA POR PRODUCTO {periodo_texto}", e["fill_green"]),
+    ]
+    for fila, (texto, fill) in enumerate(textos, 1):
+        ws.merge_cells(f"A{fila}:G{fila}")
+        c = ws.cell(row=fila, column=1, value=texto)
+        c.font = e["font_white_bold"]
+        c.fill = fill
+        c.alignment = e["align_left_center"]
+
+    # --- LOGO ---
+    ws.merge_cells("H1:I4")
+    ruta_logo = Path(__file__).resolve().parent.parent.parent / "logo.png"
+    if ruta_logo.exists():
+        try:
+            img = Image(str(ruta_logo))
+            img.height = 65
+            img.width = 180 
+            ws.add_image(img, 'H1')
+        except Exception:
+            pass
+
+    # --- COLUMNAS (FILA 6) ---
+    headers = ["Código", "Producto", "Cantidad", "Unidad", "Precio", "Importe", "Descuento", "Impuesto", "Total"]
+    for col_num, header in enumerate(headers, 1):
+        c = ws.cell(row=6, column=col_num, value=header)
+        c.font = e["font_header_table"]
+        c.fill = e["fill_orange"]
+        c.alignment = e["align_left_center"]
+        c.border = e["border_header"]
+
+    # --- FILA PLANTILLA DE DETALLE (FILA 7) ---
+    # (font, number_format) por columna; todas llevan border_table
+    plantilla = [
+        (e["font_normal"], None),
+        (e["font_normal"], None),
+        (e["font_normal"], '#,##0.00'),
+        (e["font_normal"], None),
+        (None, '$#,##0.00'),
+        (None, '$#,##0.00'),
+        (None, '$#,##0.00'),
+        (None, '$#,##0.00'),
+        (e["font_bold"], '$#,##0.00'),
+    ]
+    ids_estilo = []
+    for col_num, (font, number_format) in enumerate(plantilla, 1):
+        c = ws.cell(row=_FILA_DATOS, column=col_num)
+        if font is not None:
+            c.font = font
+        if number_format is not None:
+            c.number_format = number_format
+        c.border = e["border_table"]
+        ids_estilo.append(c.style_id)
+
+    return wb, ws, e, ids_estilo
+
+
+def _cerrar_esqueleto(ws, e: Dict[str, Any], row_idx: int, totales: Sequence[float]) -> None:
+    """Agrega la fila de totales en 'row_idx', los anchos, el autofiltro y el panel congelado."""
+    total_cantidad, total_importe, total_descuento, total_impuesto, total_general = totales
+
+    ws.merge_cells(f'A{row_idx}:B{row_idx}')
+    c = ws.cell(row=row_idx, column=1, value="Total General")
+    c.font = e["font_total_label"]
+    c.fill = e["fill_total"]
+    c.alignment = Alignment(horizontal='left')
+
+    for col in (2, 4, 5):
+        c = ws.cell(row=row_idx, column=col)
+        c.fill = e["fill_total"]
+        c.border = e["border_table"]
+
+    valores = [(3, total_cantidad, '#,##0.00'), (6, total_importe, '$#,##0.00'),
+               (7, total_descuento, '$#,##0.00'), (8, total_impuesto, '$#,##0.00'),
+               (9, total_general, '$#,##0.00')]
+    for col, valor, number_format in valores:
+        c = ws.cell(row=row_idx, column=col, value=valor)
+        c.font = e["font_total_value"]
+        c.fill = e["fill_total"]
+        c.number_format = number_format
+        c.border = e["border_table"]
+
+    column_widths = [15, 50, 12, 10, 12, 15, 12, 12, 15]
+    for i, width in enumerate(column_widths, 1):
+        ws.column_dimensions[get_column_letter(i)].width = width
+
+    ws.auto_filter.ref = f"A6:I{row_idx-1}"
+    ws.freeze_panes = "A7"
+
+
+def _celda_texto(ref: str, estilo: int, valor: Any) -> str:
+    if valor is None:
+        return f'<c r="{ref}" s="{estilo}"/>'
+    texto = ILLEGAL_CHARACTERS_RE.sub("", valor if isinstance(valor, str) else str(valor))
+    if not texto:
+        return f'<c r="{ref}" s="{estilo}"/>'
+    espacio = ' xml:space="preserve"' if texto != texto.strip() else ""
+    return f'<c r="{ref}" s="{estilo}" t="inlineStr"><is><t{espacio}>{escape(texto)}</t></is></c>'
+
+
+def generar_excel_ventas_producto_stream(
+    lotes: Iterable[Iterable[Sequence[Any]]],
+    filtros_info: str,
+    periodo_texto: str,
+    destino: BinaryIO,
+) -> int:
+    """
+    Escribe el reporte de ventas en 'destino' (archivo binario abierto) por lotes.
+    
+    Args:
+        lotes: Iterable de lotes (p. ej. cursor.fetchmany) con las 9 columnas del reporte.
+        filtros_info: Texto que describe los filtros aplicados (ej. "Sucursal Centro").
+        periodo_texto: Texto del periodo (ej. "Enero 2023").
+        destino: Archivo donde se guarda el .xlsx.
+        
+    Returns:
+        int: Número de filas de detalle escritas.
+    """
+    wb, ws, estilos, ids = _nuevo_esqueleto(filtros_info, periodo_texto)
+    s_cod, s_prod, s_cant, s_uni, s_precio, s_imp, s_desc, s_impu, s_tot = ids
+
+    total_cantidad = 0.0
+    total_importe = 0.0
+    total_descuento = 0.0
+    total_impuesto = 0.0
+    total_general = 0.0
+    n = _FILA_DATOS
+
+    with tempfile.TemporaryFile() as filas_xml:
+        # --- DATOS: XML de las filas de detalle, lote por lote ---
+        for lote in lotes:
+            partes = []
+            for r in lote:
+                cant = float(r[2] or 0)
+                precio = float(r[4] or 0)
+                importe = float(r[5] or 0)
+                desc = float(r[6] or 0)
+                imp = float(r[7] or 0)
+                tot = float(r[8] or 0)
+                partes.append(
+                    f'<row r="{n}">'
+                    f'{_celda_texto(f"A{n}", s_cod, r[0])}'
+                    f'{_celda_texto(f"B{n}", s_prod, r[1])}'
+                    f'<c r="C{n}" s="{s_cant}" t="n"><v>{cant:.16g}</v></c>'
+                    f'{_celda_texto(f"D{n}", s_uni, r[3])}'
+                    f'<c r="E{n}" s="{s_precio}" t="n"><v>{precio:.16g}</v></c>'
+                    f'<c r="F{n}" s="{s_imp}" t="n"><v>{importe:.16g}</v></c>'
+                    f'<c r="G{n}" s="{s_desc}" t="n"><v>{desc:.16g}</v></c>'
+                    f'<c r="H{n}" s="{s_impu}" t="n"><v>{imp:.16g}</v></c>'
+                    f'<c r="I{n}" s="{s_tot}" t="n"><v>{tot:.16g}</v></c>'
+                    '</row>'
+                )
+                total_cantidad += cant
+                total_importe += importe
+                total_descuento += desc
+                total_impuesto += imp
+                total_general += tot
+                n += 1
+            if partes:
+                filas_xml.write("".join(partes).encode("utf-8"))
+
+        filas = n - _FILA_DATOS
+        if not filas:
+            ws.delete_rows(_FILA_DATOS)
+
+        # --- TOTALES Y ARMADO DEL LIBRO ---
+        _cerrar_esqueleto(ws, estilos, n, (total_cantidad, total_importe, total_descuento, total_impuesto, total_general))
+        esqueleto = BytesIO()
+        wb.save(esqueleto)
+
+        filas_xml.seek(0)
+        _ensamblar_xlsx(esqueleto, filas_xml if filas else None, n, destino)
+
+    return filas
+
+
+def _ensamblar_xlsx(esqueleto: BytesIO, filas_xml: Optional[BinaryIO], fila_totales: int, destino: BinaryIO) -> None:
+    """
+    Copia el libro esqueleto a 'destino' sustituyendo, en la hoja, la fila plantilla
+    por el XML de las filas de detalle.
+    """
+    with zipfile.ZipFile(esqueleto) as origen, \
+            zipfile.ZipFile(destino, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as salida:
+        for info in origen.infolist():
+            contenido = origen.read(info.filename)
+            if info.filename != _HOJA_XML or filas_xml is None:
+                salida.writestr(info.filename, contenido)
+                continue
+
+            inicio = contenido.index(f'<row r="{_FILA_DATOS}"'.encode())
+            fin = contenido.index(f'<row r="{fila_totales}"'.encode())
+            with salida.open(info.filename, "w", force_zip64=True) as hoja:
+                hoja.write(contenido[:inicio])
+                shutil.copyfileobj(filas_xml, hoja, _TAMANO_COPIA)
+                hoja.write(contenido[fin:])
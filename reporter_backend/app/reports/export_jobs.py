@@ -0,0 +1,210 @@
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.metricas import registrar_exportacion
+
+logger = logging.getLogger("uvicorn.error")
+
+# ----------------- Exportaciones en segundo plano -----------------
+#
+# Generar el Excel es trabajo de CPU (openpyxl). En lugar de hacerlo dentro de la
+# petición, se manda a un pool de procesos acotado: la API solo encola, consulta el
+# avance y entrega el archivo cuando está listo. Cada proceso abre su propia
+# conexión a SQL Server.
+
+DIRECTORIO = settings.EXPORT_JOBS_DIR or os.path.join(tempfile.gettempdir(), "reportes_export")
+INTERVALO_LIMPIEZA = 60
+
+ESTADOS_ACTIVOS = ("en_cola", "ejecutando")
+
+
+class LimiteTrabajosExcedido(Exception):
+    """Se alcanzó el máximo de exportaciones activas (por usuario o global)."""
+
+
+@dataclass
+class TrabajoExport:
+    id: str
+    usuario: str
+    filtros: Dict[str, Any]
+    creado: datetime = field(default_factory=datetime.now)
+    estado: str = "en_cola"
+    filas: int = 0
+    terminado: Optional[datetime] = None
+    error: Optional[str] = None
+    future: Optional[Future] = None
+
+    @property
+    def ruta(self) -> str:
+        return os.path.join(DIRECTORIO, f"{self.id}.xlsx")
+
+    @property
+    def ruta_progreso(self) -> str:
+        return os.path.join(DIRECTORIO, f"{self.id}.progreso")
+
+    def a_dict(self) -> Dict[str, Any]:
+        estado = self.estado
+        if estado == "en_cola" and self.future is not None and self.future.running():
+            estado = "ejecutando"
+        filas = self.filas if self.terminado else _leer_progreso(self.ruta_progreso)
+        tamano = os.path.getsize(self.ruta) if estado == "terminado" and os.path.exists(self.ruta) else None
+        return {
+            "id": self.id,
+            "estado": estado,
+            "filas": filas,
+            "creado": self.creado,
+            "terminado": self.terminado,
+            "error": self.error,
+            "tamano_bytes": tamano,
+        }
+
+
+_trabajos: Dict[str, TrabajoExport] = {}
+_lock = threading.Lock()
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+# --- Código que corre dentro del proceso hijo ---
+
+def _iniciar_proceso() -> None:
+    # Cada trabajo es una sola consulta: cargar el catálogo de sucursales y el índice de
+    # productos (con sus hilos de refresco) cuesta más de lo que ahorra. Sin ellos el
+    # servicio filtra por sus caminos en SQL.
+    from app.reports import catalogo_sucursales, indice_productos
+
+    catalogo_sucursales.deshabilitar()
+    indice_productos.deshabilitar()
+
+def _escribir_progreso(ruta: str, filas: int) -> None:
+    temporal = ruta + ".tmp"
+    with open(temporal, "w") as f:
+        f.write(str(filas))
+    os.replace(temporal, ruta)
+
+def _leer_progreso(ruta: str) -> int:
+    try:
+        with open(ruta) as f:
+            return int(f.read() or 0)
+    except (OSError, ValueError):
+        return 0
+
+def _generar_en_proceso(ruta: str, ruta_progreso: str, filtros: Dict[str, Any]) -> int:
+    from app.reports.ventas_producto_service import escribir_excel_ventas
+
+    with open(ruta, "wb") as destino:
+        return escribir_excel_ventas(
+            destino, progreso=lambda n: _escribir_progreso(ruta_progreso, n), **filtros
+        )
+
+
+# --- Administración de trabajos (proceso de la API) ---
+
+def _asegurar_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        os.makedirs(DIRECTORIO, exist_ok=True)
+        # 'spawn' para no heredar conexiones ni hilos del proceso de la API
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.EXPORT_JOBS_PROCESOS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_iniciar_proceso,
+        )
+        threading.Thread(target=_ciclo_limpieza, name="export-jobs-limpieza", daemon=True).start()
+    return _pool
+
+def _al_terminar(trabajo: TrabajoExport, future: Future) -> None:
+    with _lock:
+        trabajo.terminado = datetime.now()
+        try:
+            trabajo.filas = future.result()
+            trabajo.estado = "terminado"
+            registrar_exportacion(
+                "xlsx_segundo_plano",
+                (trabajo.terminado - trabajo.creado).total_seconds(),
+                os.path.getsize(trabajo.ruta) if os.path.exists(trabajo.ruta) else None,
+            )
+        except Exception as e:
+            logger.error(f"EXPORT JOB {trabajo.id} ERROR: {e}")
+            trabajo.estado = "error"
+            trabajo.error = str(e) or type(e).__name__
+            # El .xlsx a medio escribir no se puede descargar; no se espera a la limpieza
+            _borrar_archivo(trabajo.ruta)
+    _borrar_archivo(trabajo.ruta_progreso)
+
+def enviar_trabajo(usuario: str, filtros: Dict[str, Any]) -> TrabajoExport:
+    """
+    Encola una exportación a Excel.
+    Lanza LimiteTrabajosExcedido si el usuario o el servidor ya tienen el máximo de trabajos activos.
+    """
+    limpiar_vencidos()
+    with _lock:
+        pool = _asegurar_pool()
+        activos = [t for t in _trabajos.values() if t.estado in ESTADOS_ACTIVOS]
+        if len(activos) >= settings.EXPORT_JOBS_MAX_GLOBAL:
+            raise LimiteTrabajosExcedido("El servidor está procesando demasiadas exportaciones. Intenta en unos minutos.")
+        if sum(1 for t in activos if t.usuario == usuario) >= settings.EXPORT_JOBS_MAX_POR_USUARIO:
+            raise LimiteTrabajosExcedido("Ya tienes exportaciones en proceso. Espera a que terminen.")
+
+        trabajo = TrabajoExport(id=uuid.uuid4().hex, usuario=usuario, filtros=filtros)
+        _trabajos[trabajo.id] = trabajo
+
+    trabajo.future = pool.submit(_generar_en_proceso, trabajo.ruta, trabajo.ruta_progreso, filtros)
+    trabajo.future.add_done_callback(lambda f: _al_terminar(trabajo, f))
+    return trabajo
+
+def obtener_trabajo(job_id: str) -> Optional[TrabajoExport]:
+    limpiar_vencidos()
+    with _lock:
+        return _trabajos.get(job_id)
+
+def listar_trabajos(usuario: Optional[str] = None) -> List[TrabajoExport]:
+    limpiar_vencidos()
+    with _lock:
+        return [t for t in _trabajos.values() if usuario is None or t.usuario == usuario]
+
+def limpiar_vencidos() -> None:
+    """Elimina los trabajos terminados (y sus archivos) que excedieron el tiempo de retención."""
+    limite = time.time() - settings.EXPORT_JOBS_RETENCION_MIN * 60
+    with _lock:
+        vencidos = [t for t in _trabajos.values() if t.terminado and t.terminado.timestamp() < limite]
+        for t in vencidos:
+            del _trabajos[t.id]
+    for t in vencidos:
+        _borrar_archivo(t.ruta)
+
+def _ciclo_limpieza() -> None:
+    # Incluye archivos huérfanos de ejecuciones anteriores del servidor
+    while True:
+        limpiar_vencidos()
+        limite = time.time() - settings.EXPORT_JOBS_RETENCION_MIN * 60
+        with _lock:
+            vigentes = {t.id for t in _trabajos.values()}
+        try:
+            for nombre in os.listdir(DIRECTORIO):
+                ruta = os.path.join(DIRECTORIO, nombre)
+                if nombre.split(".")[0] not in vigentes and os.path.getmtime(ruta) < limite:
+                    _borrar_archivo(ruta)
+        except OSError:
+            pass
+        time.sleep(INTERVALO_LIMPIEZA)
+
+def _borrar_archivo(ruta: str) -> None:
+    try:
+        os.remove(ruta)
+    except OSError:
+        pass
+
+def apagar() -> None:
+    """Detiene el pool de procesos (al apagar la API)."""
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,67 @@
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Optional
+
+# ----------------- Forma canónica de los filtros -----------------
+#
+# Los mismos datos se pueden pedir de varias formas (mes+anio, rango explícito,
+# fechas como texto o como date). Aquí se reducen a una sola representación
+# para usarla como llave de caché y como firma de paginación.
+
+
+@dataclass(frozen=True)
+class FiltrosNormalizados:
+    """
+    Filtros reducidos a su forma canónica.
+
+    - desde / hasta: rango semiabierto [desde, hasta). Cualquiera puede ser None.
+    - mes: solo se usa cuando se pidió un mes sin año ("todos los noviembres").
+    """
+    sucursal: Optional[str] = None
+    producto: Optional[str] = None
+    desde: Optional[date] = None
+    hasta: Optional[date] = None
+    mes: Optional[int] = None
+
+
+def _a_fecha(valor: Any) -> Optional[date]:
+    if not valor:
+        return None
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    return datetime.strptime(str(valor).strip(), "%Y-%m-%d").date()
+
+
+def normalizar_filtros(
+    sucursal: Optional[str] = None,
+    producto: Optional[str] = None,
+    fecha_desde: Optional[Any] = None,
+    fecha_hasta: Optional[Any] = None,
+    mes: Optional[int] = None,
+    anio: Optional[int] = None,
+) -> FiltrosNormalizados:
+    """
+    Aplica las mismas reglas de precedencia que el constructor del WHERE:
+    el rango de fechas explícito gana sobre mes/año.
+    """
+    sucursal_n = sucursal.strip().upper() if sucursal and sucursal.strip() else None
+    producto_n = producto.strip().casefold() if producto and producto.strip() else None
+
+    desde = _a_fecha(fecha_desde)
+    hasta = _a_fecha(fecha_hasta)
+    if desde or hasta:
+        return FiltrosNormalizados(
+            sucursal_n, producto_n, desde, hasta + timedelta(days=1) if hasta else None
+        )
+
+    if mes and anio:
+        inicio = date(int(anio), int(mes), 1)
+        fin = date(int(anio) + 1, 1, 1) if int(mes) == 12 else date(int(anio), int(mes) + 1, 1)
+        return FiltrosNormalizados(sucursal_n, producto_n, inicio, fin)
+    if anio:
+        return FiltrosNormalizados(sucursal_n, producto_n, date(int(anio), 1, 1), date(int(anio) + 1, 1, 1))
+    if mes:
+        return FiltrosNormalizados(sucursal_n, producto_n, mes=int(mes))
+    return FiltrosNormalizados(sucursal_n, producto_n)
@@ -0,0 +1,222 @@
+import logging
+import threading
+import time
+import unicodedata
+from array import array
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.core.database import get_connection
+
+logger = logging.getLogger("uvicorn.error")
+
+# ----------------- Índice de búsqueda de productos -----------------
+#
+# El autocompletado de productos pega en cada tecla. En lugar de un LIKE '%q%'
+# sobre admProductos, el catálogo completo se mantiene en memoria con un índice
+# de trigramas (sin acentos y sin distinguir mayúsculas). Un hilo en segundo plano
+# revisa una firma barata del catálogo y lo recarga solo cuando cambió.
+#
+# La primera carga también corre en ese hilo (se arranca con la API), nunca dentro
+# de una petición: mientras no hay índice, los llamadores usan su camino por SQL.
+
+SQL_FIRMA = """
+    SELECT COUNT(*), MAX(CIDPRODUCTO),
+           CHECKSUM_AGG(BINARY_CHECKSUM(CIDPRODUCTO, CCODIGOPRODUCTO, CNOMBREPRODUCTO))
+    FROM admProductos WITH (NOLOCK)
+    WHERE CIDPRODUCTO <> 0
+"""
+
+SQL_CATALOGO = """
+    SELECT CIDPRODUCTO, CCODIGOPRODUCTO, CNOMBREPRODUCTO
+    FROM admProductos WITH (NOLOCK)
+    WHERE CIDPRODUCTO <> 0
+    ORDER BY CCODIGOPRODUCTO
+"""
+
+# Separador entre código y nombre en el texto indexado (nunca aparece en una búsqueda)
+_SEPARADOR = "\x00"
+
+
+def normalizar_texto(texto: Optional[str]) -> str:
+    """Quita acentos y pasa a minúsculas ('Piña' -> 'pina')."""
+    descompuesto = unicodedata.normalize("NFKD", texto or "")
+    return "".join(c for c in descompuesto if not unicodedata.combining(c)).casefold()
+
+
+def _trigramas(texto: str) -> set:
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class IndiceProductos:
+    """
+    Catálogo de productos en el orden de CCODIGOPRODUCTO con un índice de trigramas.
+
+    La búsqueda es por subcadena en el código o en el nombre (como el LIKE '%q%'
+    anterior). Con 3 caracteres o más solo se revisan los productos que tienen el
+    trigrama menos común de la búsqueda; con menos se recorre el catálogo en orden,
+    lo que es rápido porque casi todo coincide y se corta al llegar a 'top'.
+    """
+
+    def __init__(self, filas: Sequence[Tuple[Any, Any, Any]], firma: Any = None):
+        self.firma = firma
+        self.cargado = time.time()
+        self.ids: List[int] = []
+        self.codigos: List[str] = []
+        self.nombres: List[str] = []
+        self._textos: List[str] = []
+
+        listas: Dict[str, List[int]] = defaultdict(list)
+        for pos, (id_pro, codigo, nombre) in enumerate(filas):
+            self.ids.append(int(id_pro))
+            self.codigos.append(codigo)
+            self.nombres.append(nombre)
+            texto = normalizar_texto(codigo) + _SEPARADOR + normalizar_texto(nombre)
+            self._textos.append(texto)
+            for g in _trigramas(texto):
+                listas[g].append(pos)
+        # array('I') ocupa 4 bytes por entrada en lugar de un objeto int por posición
+        self._indice: Dict[str, array] = {g: array("I", p) for g, p in listas.items()}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def posiciones(self, q: Optional[str]) -> Iterator[int]:
+        """Posiciones (en orden de código) de los productos que contienen 'q'."""
+        consulta = normalizar_texto(q.strip()) if q else ""
+        if not consulta:
+            yield from range(len(self._textos))
+            return
+
+        if len(consulta) < 3:
+            candidatos: Sequence[int] = range(len(self._textos))
+        else:
+            # Se recorre la lista más corta (ya viene en orden de código) y cada
+            # candidato se confirma contra el texto: así se corta al llegar a 'top'
+            # sin tener que intersectar listas completas.
+            candidatos = None
+            for g in _trigramas(consulta):
+                lista = self._indice.get(g)
+                if lista is None:
+                    return
+                if candidatos is None or len(lista) < len(candidatos):
+                    candidatos = lista
+
+        textos = self._textos
+        for pos in candidatos:
+            if consulta in textos[pos]:
+                yield pos
+
+    def buscar(self, q: Optional[str], top: int) -> List[Dict[str, Any]]:
+        """Misma forma que ProductoOpcion: id_pro, codigo, nombre."""
+        resultado = []
+        for pos in self.posiciones(q):
+            resultado.append({"id_pro": self.ids[pos], "codigo": self.codigos[pos], "nombre": self.nombres[pos]})
+            if len(resultado) >= top:
+                break
+        return resultado
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "productos": len(self.ids),
+            "trigramas": len(self._indice),
+            "posiciones": sum(len(p) for p in self._indice.values()),
+            "cargado": self.cargado,
+        }
+
+
+# --- Carga y refresco ---
+
+_indice: Optional[IndiceProductos] = None
+_lock = threading.Lock()
+_hilo: Optional[threading.Thread] = None
+_recargas = 0
+_habilitado = True
+
+
+def _consultar_firma(cur: Any) -> Tuple[Any, ...]:
+    cur.execute(SQL_FIRMA)
+    return tuple(cur.fetchone())
+
+
+def _cargar() -> IndiceProductos:
+    conn = None
+    try:
+        conn = get_connection()
+        cur = conn.cursor()
+        firma = _consultar_firma(cur)
+        cur.execute(SQL_CATALOGO)
+        filas = cur.fetchall()
+    finally:
+        if conn: conn.close()
+    t0 = time.perf_counter()
+    indice = IndiceProductos(filas, firma)
+    logger.info(f"INDICE PRODUCTOS: {len(indice)} productos indexados en {time.perf_counter() - t0:.2f}s")
+    return indice
+
+
+def refrescar() -> bool:
+    """Recarga el índice si la firma del catálogo cambió. Regresa True si se recargó."""
+    global _indice, _recargas
+    actual = _indice
+    if actual is not None:
+        conn = None
+        try:
+            conn = get_connection()
+            firma = _consultar_firma(conn.cursor())
+        finally:
+            if conn: conn.close()
+        if firma == actual.firma:
+            return False
+    nuevo = _cargar()
+    with _lock:
+        _indice = nuevo
+        _recargas += 1
+    return True
+
+
+def _ciclo_refresco() -> None:
+    # Sin índice, refrescar() hace la carga completa; si falla se reintenta en la siguiente vuelta
+    while True:
+        try:
+            refrescar()
+        except Exception as e:
+            logger.error(f"INDICE PRODUCTOS REFRESCO ERROR: {e}")
+        time.sleep(settings.PRODUCTOS_INDICE_REFRESCO_SEG)
+
+
+def iniciar() -> None:
+    """Arranca en segundo plano la primera carga y el hilo de refresco (al arrancar la API)."""
+    global _hilo
+    with _lock:
+        if _hilo is None and _habilitado:
+            _hilo = threading.Thread(target=_ciclo_refresco, name="indice-productos", daemon=True)
+            _hilo.start()
+
+
+def deshabilitar() -> None:
+    """Deja el proceso sin índice ni hilo de refresco (procesos de exportación): se filtra por SQL."""
+    global _habilitado
+    _habilitado = False
+
+
+def obtener_indice() -> Optional[IndiceProductos]:
+    """
+    Regresa el índice vigente sin tocar la BD.
+    Regresa None mientras no se haya cargado (el llamador debe usar SQL).
+    """
+    if not _habilitado:
+        return None
+    if _hilo is None:
+        # Procesos que no pasaron por el arranque de la API (scripts, benchmarks)
+        iniciar()
+    return _indice
+
+
+def estadisticas() -> Dict[str, Any]:
+    indice = _indice
+    datos: Dict[str, Any] = {"disponible": indice is not None, "recargas": _recargas}
+    if indice is not None:
+        datos.update(indice.estadisticas())
+    return datos
@@ -1,9 +1,22 @@
-from typing import Any, Dict, List, Optional, Tuple
-from datetime import date, datetime, timedelta
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from datetime import date, datetime, time
+from functools import wraps
+import asyncio
+import base64
+import hashlib
+import json
 import logging
+import threading
+import time as reloj
 import traceback
 
-from app.core.database import get_connection
+from app.core.cancelacion import consulta_actual
+from app.core.config import settings
+from app.core.database import ejecutar_en_bd, ejecutor_reportes, get_connection
+from app.core.metricas import medir_sql, registrar_exportacion, sql_duracion, sql_errores, sql_filas
+from app.reports import catalogo_sucursales, indice_productos
+from app.reports.cache_reportes import cache_reportes, cacheado, ttl_para, vuelos_reportes
+from app.reports.filtros import FiltrosNormalizados, normalizar_filtros
 from app.schemas.reports import VentasProductoFiltros
 
 # Configuración de Bitácora
@@ -24,58 +37,457 @@ def _build_filtros_where(
     filtros = ["1=1"]
     params: List[Any] = []
 
-    col_sucursal = "sucursal" if es_vista_resumen else "CNOMBREALMACEN"
+    vista = "zzVentasResumen" if es_vista_resumen else "zzVentasPorProducto"
+    col_sucursal = catalogo_sucursales.COLUMNAS[vista]
     
-    if sucursal:
-        filtros.append(f"LTRIM(RTRIM({col_sucursal})) = ?")
-        params.append(sucursal.strip())
+    if sucursal and sucursal.strip():
+        # Valores exactos de la columna (sin funciones, para que pueda buscar por índice)
+        valores = catalogo_sucursales.valores_sucursal(vista, sucursal)
+        if valores is None:
+            # Catálogo no disponible o sucursal sin valores conocidos (nueva desde la
+            # última carga): comparación recortada, correcta aunque más lenta
+            filtros.append(f"LTRIM(RTRIM({col_sucursal})) = ?")
+            params.append(sucursal.strip())
+        elif len(valores) == 1:
+            filtros.append(f"{col_sucursal} = ?")
+            params.append(valores[0])
+        else:
+            filtros.append(f"{col_sucursal} IN ({','.join('?' * len(valores))})")
+            params.extend(valores)
 
-    if producto and not es_vista_resumen:
-        filtros.append("(CCODIGOPRODUCTO LIKE ? OR CNOMBREPRODUCTO LIKE ?)")
-        like = f"%{producto}%"
-        params.extend([like, like])
+    if producto and producto.strip() and not es_vista_resumen:
+        producto_sql, producto_params = _predicado_producto(producto)
+        filtros.append(producto_sql)
+        params.extend(producto_params)
 
-    usando_rango = False
+    # Fechas: siempre como rangos semiabiertos sobre la columna desnuda (sargables)
+    periodo = normalizar_filtros(
+        fecha_desde=fecha_desde, fecha_hasta=fecha_hasta, mes=mes, anio=anio
+    )
+    limites = None
+    if periodo.mes:
+        limites = _limites_fechas(vista)
+    fechas_sql, fechas_params = _predicados_fecha(periodo, limites)
+    filtros.extend(fechas_sql)
+    params.extend(fechas_params)
 
-    if fecha_desde:
-        usando_rango = True
-        filtros.append("fecha >= ?")
-        if isinstance(fecha_desde, str):
-            fecha_desde = datetime.strptime(fecha_desde, "%Y-%m-%d").date()
-        params.append(fecha_desde)
+    where_sql = " WHERE " + " AND ".join(filtros)
+    return where_sql, params
+
+
+# ----------------- Filtro de producto -----------------
+#
+# El texto del filtro se resuelve primero contra el catálogo de productos (índice en
+# memoria) y las ventas se filtran por id_pro, en lugar de un LIKE '%texto%' sobre la
+# vista grande, que no puede usar ningún índice.
+
+def _predicado_producto(producto: str) -> Tuple[str, List[Any]]:
+    indice = indice_productos.obtener_indice()
+    if indice is not None:
+        limite = settings.PRODUCTOS_FILTRO_MAX_IDS
+        ids = []
+        for pos in indice.posiciones(producto):
+            ids.append(indice.ids[pos])
+            if len(ids) > limite:
+                break
+        if not ids:
+            return "1=0", []
+        if len(ids) <= limite:
+            return f"id_pro IN ({','.join('?' * len(ids))})", ids
+
+    # Demasiadas coincidencias (o índice no disponible): se filtra el catálogo en el
+    # servidor, que es mucho más chico que la vista de ventas
+    like = f"%{producto.strip()}%"
+    sql = (
+        "id_pro IN (SELECT CIDPRODUCTO FROM admProductos WITH (NOLOCK) "
+        "WHERE CIDPRODUCTO <> 0 AND (CCODIGOPRODUCTO LIKE ? OR CNOMBREPRODUCTO LIKE ?))"
+    )
+    return sql, [like, like]
+
+
+# ----------------- Predicados de fecha -----------------
+#
+# Nunca se envuelve 'fecha' en funciones (MONTH, YEAR...): así SQL Server puede usar
+# el índice de la columna. "Todos los noviembres" se convierte en un rango por año,
+# acotado por las fechas mínima y máxima que existen en la vista.
+
+LIMITES_FECHAS_TTL = 3600
+
+def _limites_fechas(vista: str) -> Optional[Tuple[Optional[date], Optional[date]]]:
+    """
+    (MIN(fecha), MAX(fecha)) de la vista, en caché por una hora.
+    Regresa None si no se pudo consultar.
+    """
+    encontrado, limites = cache_reportes.obtener(("limites_fechas", vista))
+    if encontrado:
+        return limites
+    conn = None
+    try:
+        conn = get_connection()
+        cur = conn.cursor()
+        cur.execute(f"SELECT MIN(fecha), MAX(fecha) FROM {vista} WITH (NOLOCK)")
+        minimo, maximo = cur.fetchone()
+        limites = (_solo_fecha(minimo), _solo_fecha(maximo))
+        cache_reportes.guardar(("limites_fechas", vista), limites, LIMITES_FECHAS_TTL)
+        return limites
+    except Exception as e:
+        logger.error(f"LIMITES FECHAS {vista} ERROR: {e}")
+        return None
+    finally:
+        if conn: conn.close()
+
+def _solo_fecha(valor: Any) -> Optional[date]:
+    if isinstance(valor, datetime):
+        return valor.date()
+    return valor
+
+def _predicados_fecha(
+    periodo: FiltrosNormalizados,
+    limites: Optional[Tuple[Optional[date], Optional[date]]] = None,
+) -> Tuple[List[str], List[Any]]:
+    """
+    Traduce el periodo normalizado a condiciones sobre 'fecha'.
+    'limites' solo se usa para un mes sin año; si es None (no se pudo consultar)
+    se recurre a MONTH(fecha), que es correcto aunque no use el índice.
+    """
+    filtros: List[str] = []
+    params: List[Any] = []
 
-    if fecha_hasta:
-        usando_rango = True
+    if periodo.desde:
+        filtros.append("fecha >= ?")
+        params.append(periodo.desde)
+    if periodo.hasta:
         filtros.append("fecha < ?")
-        if isinstance(fecha_hasta, str):
-            fecha_hasta = datetime.strptime(fecha_hasta, "%Y-%m-%d").date()
-        fecha_fin_corte = fecha_hasta + timedelta(days=1)
-        params.append(fecha_fin_corte)
-
-    if not usando_rango:
-        if mes and anio:
-            start_date = date(int(anio), int(mes), 1)
-            if mes == 12:
-                end_date = date(int(anio) + 1, 1, 1)
-            else:
-                end_date = date(int(anio), int(mes) + 1, 1)
-            filtros.append("fecha >= ?")
-            params.append(start_date)
-            filtros.append("fecha < ?")
-            params.append(end_date)
-        elif anio:
-            start_date = date(int(anio), 1, 1)
-            end_date = date(int(anio) + 1, 1, 1)
-            filtros.append("fecha >= ?")
-            params.append(start_date)
-            filtros.append("fecha < ?")
-            params.append(end_date)
-        elif mes:
+        params.append(periodo.hasta)
+
+    if periodo.mes:
+        if limites is None:
             filtros.append("MONTH(fecha) = ?")
-            params.append(int(mes))
+            params.append(periodo.mes)
+            return filtros, params
 
-    where_sql = " WHERE " + " AND ".join(filtros)
-    return where_sql, params
+        minimo, maximo = limites
+        if minimo is None:
+            # La vista está vacía
+            filtros.append("1=0")
+            return filtros, params
+
+        # Se incluye el año en curso aunque todavía no tenga datos (el límite está en caché)
+        ultimo_anio = max(maximo.year, date.today().year)
+        rangos = []
+        for anio in range(minimo.year, ultimo_anio + 1):
+            inicio = date(anio, periodo.mes, 1)
+            fin = date(anio + 1, 1, 1) if periodo.mes == 12 else date(anio, periodo.mes + 1, 1)
+            rangos.append("(fecha >= ? AND fecha < ?)")
+            params.extend([inicio, fin])
+        filtros.append("(" + " OR ".join(rangos) + ")")
+
+    return filtros, params
+
+
+# ----------------- Llaves de caché -----------------
+
+def _clave_filtros(filtros: "VentasProductoFiltros") -> FiltrosNormalizados:
+    return normalizar_filtros(
+        filtros.sucursal, filtros.producto, filtros.fecha_desde,
+        filtros.fecha_hasta, filtros.mes, filtros.anio,
+    )
+
+def _clave_filtros_sin_producto(filtros: "VentasProductoFiltros") -> FiltrosNormalizados:
+    # Top productos no filtra por producto
+    return normalizar_filtros(
+        filtros.sucursal, None, filtros.fecha_desde,
+        filtros.fecha_hasta, filtros.mes, filtros.anio,
+    )
+
+def _clave_resumen(mes: Optional[int] = None, anio: Optional[int] = None) -> FiltrosNormalizados:
+    now = datetime.now()
+    return normalizar_filtros(mes=mes or now.month, anio=anio or now.year)
+
+
+# ----------------- Cursor de paginación (keyset) -----------------
+#
+# El token es opaco para el cliente: JSON en base64 con la última llave de orden
+# vista (fecha, hora, id_venta, id_movimiento) y una firma de los filtros, para que
+# no se pueda reutilizar un cursor con otra combinación de filtros.
+#
+# La llave tiene que ser única por renglón o el seek estricto se salta partidas: el
+# mismo producto puede aparecer dos veces en un ticket, así que el desempate es
+# id_movimiento (CIDMOVIMIENTO, la partida). Esa columna es opcional en la vista:
+# si no existe, el orden sigue siendo el anterior (desempate por id_pro) y el
+# cursor solo guarda el OFFSET de la página siguiente.
+#
+# El orden y el seek van sobre las columnas desnudas para que el índice de fecha
+# sirva. En orden DESC SQL Server deja los NULL al final; el seek los cubre con
+# ramas "IS NULL" explícitas (ver _predicado_seek).
+
+_ORDEN_CON_LLAVE = "fecha DESC, hora DESC, id_venta DESC, id_movimiento DESC"
+_ORDEN_SIN_LLAVE = "fecha DESC, hora DESC, id_venta DESC, id_pro DESC"
+
+# Cambia si cambia el significado de la llave (los cursores anteriores dejan de valer)
+_VERSION_CURSOR = 2
+
+def _llave_unica(cur: Any) -> bool:
+    """True si zzVentasPorProducto tiene id_movimiento (se revisa una vez por hora)."""
+    encontrado, existe = cache_reportes.obtener(("llave_unica_detalle",))
+    if encontrado:
+        return existe
+    cur.execute("SELECT COL_LENGTH('zzVentasPorProducto', 'id_movimiento')")
+    existe = cur.fetchone()[0] is not None
+    if not existe:
+        logger.warning("zzVentasPorProducto sin id_movimiento: el cursor de /rows pagina por OFFSET")
+    cache_reportes.guardar(("llave_unica_detalle",), existe, LIMITES_FECHAS_TTL)
+    return existe
+
+def paginacion_por_llave() -> bool:
+    """Si el cursor pagina por llave (ya se sabe que la vista tiene id_movimiento). No toca la BD."""
+    encontrado, existe = cache_reportes.obtener(("llave_unica_detalle",))
+    return bool(encontrado and existe)
+
+def _predicado_seek(f: Any, h: Any, v: Any, m: Any) -> Tuple[str, List[Any]]:
+    """
+    "(fecha, hora, id_venta, id_movimiento) después de la llave" en orden DESC,
+    expandido y con NULL al final. Con fecha conocida lleva un 'fecha <= ?' al
+    frente para que el optimizador pueda buscar por el índice de fecha.
+    """
+    desempate = "(id_venta < ? OR (id_venta = ? AND id_movimiento < ?))"
+    params: List[Any] = [v, v, m]
+    if h is None:
+        hora_sql = f"hora IS NULL AND {desempate}"
+    else:
+        hora_sql = f"hora < ? OR hora IS NULL OR (hora = ? AND {desempate})"
+        params = [h, h] + params
+    if f is None:
+        return f" AND fecha IS NULL AND ({hora_sql})", params
+    sql = f" AND (fecha <= ? OR fecha IS NULL) AND (fecha < ? OR fecha IS NULL OR (fecha = ? AND ({hora_sql})))"
+    return sql, [f, f, f] + params
+
+def _valor_a_token(valor: Any) -> Any:
+    """Serializa un valor de la llave conservando su tipo (para reenviarlo a pyodbc tal cual)."""
+    if isinstance(valor, datetime):
+        return ["dt", valor.isoformat()]
+    if isinstance(valor, date):
+        return ["d", valor.isoformat()]
+    if isinstance(valor, time):
+        return ["t", valor.isoformat()]
+    return ["v", valor]
+
+def _token_a_valor(dato: Any) -> Any:
+    tipo, valor = dato
+    if tipo == "dt":
+        return datetime.fromisoformat(valor)
+    if tipo == "d":
+        return date.fromisoformat(valor)
+    if tipo == "t":
+        return time.fromisoformat(valor)
+    return valor
+
+def _firma_filtros(filtros: FiltrosNormalizados) -> str:
+    return hashlib.sha1(f"{_VERSION_CURSOR}|{filtros!r}".encode("utf-8")).hexdigest()[:16]
+
+def _codificar_cursor(fila: Any, firma: str, siguiente_offset: Optional[int] = None) -> str:
+    """Llave de la última fila o, sin llave única, el OFFSET de la página siguiente."""
+    if siguiente_offset is not None:
+        datos: Dict[str, Any] = {"o": siguiente_offset, "f": firma}
+    else:
+        llave = [_valor_a_token(fila[0]), _valor_a_token(fila[2]), _valor_a_token(fila[14]), _valor_a_token(fila[15])]
+        datos = {"k": llave, "f": firma}
+    crudo = json.dumps(datos, separators=(",", ":"))
+    return base64.urlsafe_b64encode(crudo.encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decodificar_cursor(cursor: str, firma: str) -> Tuple[Optional[List[Any]], Optional[int]]:
+    """
+    Devuelve (llave, None) con [fecha, hora, id_venta, id_movimiento], o (None, offset).
+    Lanza ValueError si el token está dañado o pertenece a otros filtros.
+    """
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        datos = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        firma_token = datos["f"]
+        if "o" in datos:
+            llave, offset = None, int(datos["o"])
+        else:
+            llave, offset = [_token_a_valor(d) for d in datos["k"]], None
+    except Exception:
+        raise ValueError("Cursor de paginación inválido")
+    if firma_token != firma or (llave is not None and len(llave) != 4) or (offset is not None and offset < 0):
+        raise ValueError("El cursor no corresponde a los filtros actuales")
+    return llave, offset
+
+
+# ----------------- Caché de conteos (total_items) -----------------
+#
+# El COUNT sobre la vista completa suele costar más que la página misma y no cambia
+# al pasar de página, así que se guarda por firma normalizada de filtros.
+
+def _conteo_en_cache(clave: FiltrosNormalizados) -> Optional[int]:
+    encontrado, total = cache_reportes.obtener(("conteo", clave))
+    return total if encontrado else None
+
+def _guardar_conteo(clave: FiltrosNormalizados, total: int) -> None:
+    cache_reportes.guardar(("conteo", clave), total, ttl_para(clave))
+
+def _ejecutar_conteo(cur: Any, where_sql: str, params: List[Any]) -> int:
+    sql_count = f"SELECT COUNT(1) FROM zzVentasPorProducto WITH (NOLOCK) {where_sql} OPTION (RECOMPILE);"
+    cur.execute(sql_count, params)
+    return int(cur.fetchone()[0])
+
+def contar_ventas_producto(
+    sucursal: Optional[str] = None,
+    producto: Optional[str] = None,
+    fecha_desde: Optional[date] = None,
+    fecha_hasta: Optional[date] = None,
+    mes: Optional[int] = None,
+    anio: Optional[int] = None,
+) -> int:
+    """
+    Conteo exacto de filas del detalle (reutiliza la caché si ya se calculó).
+    Pensado para completar el total cuando /rows se pidió con conteo diferido.
+    """
+    clave = normalizar_filtros(sucursal, producto, fecha_desde, fecha_hasta, mes, anio)
+    total = _conteo_en_cache(clave)
+    if total is not None:
+        return total
+
+    return vuelos_reportes.ejecutar(
+        ("conteo", clave), _consultar_conteo,
+        clave, sucursal, producto, fecha_desde, fecha_hasta, mes, anio,
+    )
+
+@medir_sql("count")
+def _consultar_conteo(
+    clave: FiltrosNormalizados,
+    sucursal: Optional[str],
+    producto: Optional[str],
+    fecha_desde: Optional[date],
+    fecha_hasta: Optional[date],
+    mes: Optional[int],
+    anio: Optional[int],
+) -> int:
+    total = _conteo_en_cache(clave)
+    if total is not None:
+        return total
+    where_sql, params = _build_filtros_where(
+        sucursal, producto, fecha_desde, fecha_hasta, mes, anio, es_vista_resumen=False
+    )
+    conn = None
+    try:
+        conn = get_connection()
+        total = _ejecutar_conteo(conn.cursor(), where_sql, params)
+        _guardar_conteo(clave, total)
+        return total
+    except Exception as e:
+        logger.error(f"!!! ERROR CONTEO !!!: {e}")
+        raise e
+    finally:
+        if conn: conn.close()
+
+
+# ----------------- Renglones del detalle -----------------
+#
+# La conversión de cada columna del SELECT del detalle se declara una sola vez y
+# se aplica columna por columna: int/float con map() (corren en C) y los textos
+# (fecha, hora, mes) una sola vez por valor distinto, porque en una página
+# ordenada por fecha se repiten mucho. Las claves van en el orden de
+# VentasProductoRow: el JSON sale idéntico al que producía el response_model.
+
+def _texto_o_vacio(valor: Any) -> str:
+    return str(valor) if valor else ""
+
+def _texto_no_nulo(valor: Any) -> str:
+    return str(valor) if valor is not None else ""
+
+# (clave en la respuesta, posición en el SELECT, conversión; None = tal cual)
+COLUMNAS_DETALLE: Tuple[Tuple[str, int, Optional[Callable[[Any], Any]]], ...] = (
+    ("fecha", 0, _texto_o_vacio),
+    ("hora", 2, _texto_o_vacio),
+    ("Mes", 1, _texto_no_nulo),
+    ("id_pro", 3, int),
+    ("CCODIGOPRODUCTO", 4, None),
+    ("CNOMBREPRODUCTO", 5, None),
+    ("cantidad", 6, float),
+    ("CNOMBREUNIDAD", 7, None),
+    ("precio", 8, float),
+    ("Importe", 9, float),
+    ("descuento", 10, float),
+    ("impuesto", 11, float),
+    ("Total", 12, float),
+    ("CNOMBREALMACEN", 13, None),
+)
+
+def _convertir_columna(valores: Tuple[Any, ...], conversion: Optional[Callable[[Any], Any]]) -> List[Any]:
+    if conversion is None:
+        return list(valores)
+    if conversion is int or conversion is float:
+        return list(map(conversion, valores))
+    convertidos = {v: conversion(v) for v in set(valores)}
+    return list(map(convertidos.__getitem__, valores))
+
+def _columnas_detalle(rows: List[Any]) -> List[List[Any]]:
+    """Valores ya convertidos, una lista por cada columna de COLUMNAS_DETALLE."""
+    crudas = list(zip(*rows)) if rows else [()] * (len(COLUMNAS_DETALLE) + 1)
+    return [_convertir_columna(crudas[pos], conversion) for _, pos, conversion in COLUMNAS_DETALLE]
+
+def _items_detalle(rows: List[Any]) -> List[Dict[str, Any]]:
+    # Diccionario literal por renglón: la mitad del costo de dict(zip(claves, valores)).
+    # Folio no existe en la vista; el frontend lo espera vacío.
+    return [
+        {
+            "fecha": fecha, "hora": hora, "Mes": mes, "id_pro": id_pro,
+            "CCODIGOPRODUCTO": codigo, "CNOMBREPRODUCTO": nombre, "cantidad": cantidad,
+            "CNOMBREUNIDAD": unidad, "precio": precio, "Importe": importe,
+            "descuento": descuento, "impuesto": impuesto, "Total": total,
+            "CNOMBREALMACEN": almacen, "Folio": "",
+        }
+        for (fecha, hora, mes, id_pro, codigo, nombre, cantidad, unidad, precio,
+             importe, descuento, impuesto, total, almacen) in zip(*_columnas_detalle(rows))
+    ]
+
+# --- Formato en columnas (format=columns) ---
+#
+# En la forma de siempre cada renglón repite las 15 claves y en páginas grandes
+# la mayor parte del JSON son nombres de columna. En columnas va un arreglo por
+# columna, en el orden del 'schema'; las columnas de texto que se repiten mucho
+# (fecha, mes, producto, unidad, sucursal) mandan sus valores distintos una vez
+# en 'dictionary' y en la columna solo el índice. Folio no se manda.
+
+COLUMNAS_CON_DICCIONARIO = {"fecha", "Mes", "CCODIGOPRODUCTO", "CNOMBREPRODUCTO", "CNOMBREUNIDAD", "CNOMBREALMACEN"}
+_TIPOS_COLUMNA = {int: "int", float: "float"}
+
+def _columnas_compactas(rows: List[Any]) -> Tuple[List[Dict[str, Any]], List[List[Any]]]:
+    """(schema, columns) de la página en formato de columnas."""
+    esquema: List[Dict[str, Any]] = []
+    columnas: List[List[Any]] = []
+    for (clave, _, conversion), valores in zip(COLUMNAS_DETALLE, _columnas_detalle(rows)):
+        campo: Dict[str, Any] = {"name": clave, "type": _TIPOS_COLUMNA.get(conversion, "string")}
+        if clave in COLUMNAS_CON_DICCIONARIO:
+            posiciones: Dict[Any, int] = {}
+            valores = [posiciones.setdefault(v, len(posiciones)) for v in valores]
+            campo["dictionary"] = list(posiciones)
+        esquema.append(campo)
+        columnas.append(valores)
+    return esquema, columnas
+
+def _armar_pagina(
+    rows: List[Any],
+    formato: str,
+    total_items: int,
+    page: int,
+    page_size: int,
+    next_cursor: Optional[str],
+    total_exacto: bool,
+) -> Dict[str, Any]:
+    # Mismo orden de claves que VentasProductoPage / VentasProductoColumnas
+    # (la ruta lo serializa sin pasar por el modelo)
+    pagina: Dict[str, Any] = {"total_items": int(total_items), "page": page, "page_size": page_size}
+    if formato == "columns":
+        pagina["length"] = len(rows)
+        pagina["schema"], pagina["columns"] = _columnas_compactas(rows)
+    else:
+        pagina["items"] = _items_detalle(rows)
+    pagina["next_cursor"] = next_cursor
+    pagina["total_exacto"] = total_exacto
+    return pagina
 
 
 # ----------------- Listado (PANTALLA DETALLES) -----------------
@@ -90,71 +502,122 @@ def listar_ventas_producto(
     mes: Optional[int] = None,
     anio: Optional[int] = None,
     ejecutar: bool = False,
+    cursor: Optional[str] = None,
+    conteo: str = "exacto",
+    formato: str = "items",
 ) -> Dict[str, Any]:
+    """
+    Listado paginado del detalle de ventas.
+
+    Dos modos de paginación sobre el mismo orden (fecha, hora, id_venta, id_movimiento DESC):
+    - page/page_size: OFFSET clásico (compatibilidad).
+    - cursor: búsqueda por llave (keyset) a partir del 'next_cursor' de la página
+      anterior; cuesta lo mismo en la página 1 que en la 400.
+    Si la vista no tiene id_movimiento se ordena por (fecha, hora, id_venta, id_pro DESC)
+    y el cursor solo lleva el OFFSET de la página siguiente (mismo costo que 'page').
+
+    Conteo (total_items):
+    - "exacto": usa el conteo en caché o lo calcula.
+    - "diferido": no ejecuta el COUNT; si no está en caché devuelve una cota
+      inferior (total_exacto=False) y el exacto se pide aparte a /rows/count.
+
+    formato: "items" (un objeto por renglón) o "columns" (un arreglo por columna,
+    ver _columnas_compactas).
+    """
     
     if not ejecutar:
-        return {"items": [], "total_items": 0, "page": page, "page_size": page_size}
+        return _armar_pagina([], formato, 0, page, page_size, None, True)
 
+    # Mismos filtros y misma página pedidos a la vez (p. ej. un enlace compartido):
+    # una sola consulta
+    llave = (
+        "pagina", normalizar_filtros(sucursal, producto, fecha_desde, fecha_hasta, mes, anio),
+        page, page_size, cursor, conteo, formato,
+    )
+    return vuelos_reportes.ejecutar(
+        llave, _consultar_pagina, page, page_size, sucursal, producto,
+        fecha_desde, fecha_hasta, mes, anio, cursor, conteo, formato,
+    )
+
+@medir_sql("rows")
+def _consultar_pagina(
+    page: int,
+    page_size: int,
+    sucursal: Optional[str],
+    producto: Optional[str],
+    fecha_desde: Optional[date],
+    fecha_hasta: Optional[date],
+    mes: Optional[int],
+    anio: Optional[int],
+    cursor: Optional[str],
+    conteo: str,
+    formato: str,
+) -> Dict[str, Any]:
     page = max(page, 1)
     page_size = max(1, min(page_size, 500))
     offset = (page - 1) * page_size
+    filas_previas = offset
 
     where_sql, params = _build_filtros_where(
         sucursal, producto, fecha_desde, fecha_hasta, mes, anio, es_vista_resumen=False
     )
+    clave = normalizar_filtros(sucursal, producto, fecha_desde, fecha_hasta, mes, anio)
+    firma = _firma_filtros(clave)
+    total_items = _conteo_en_cache(clave)
 
-    sql_count = f"SELECT COUNT(1) FROM zzVentasPorProducto WITH (NOLOCK) {where_sql} OPTION (RECOMPILE);"
-
-    sql_rows = f"""
-        SELECT
-            fecha, Mes, hora, id_pro, CCODIGOPRODUCTO, CNOMBREPRODUCTO,
-            cantidad, CNOMBREUNIDAD, precio, Importe, descuento,
-            impuesto, Total, CNOMBREALMACEN
-        FROM zzVentasPorProducto WITH (NOLOCK)
-        {where_sql}
-        ORDER BY fecha DESC, hora DESC
-        OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
-        OPTION (RECOMPILE);
-    """
+    llave, offset_cursor = _decodificar_cursor(cursor, firma) if cursor else (None, None)
+    if offset_cursor is not None:
+        offset = filas_previas = offset_cursor
 
     conn = None
     try:
         conn = get_connection()
-        cursor = conn.cursor()
+        cursor_db = conn.cursor()
+        por_llave = _llave_unica(cursor_db)
 
-        cursor.execute(sql_count, params)
-        total_items = cursor.fetchone()[0]
+        where_pagina = where_sql
+        params_pagina = list(params)
+        if llave is not None:
+            if not por_llave:
+                raise ValueError("El cursor ya no es válido; vuelve a la primera página")
+            seek_sql, seek_params = _predicado_seek(*llave)
+            where_pagina += seek_sql
+            params_pagina += seek_params
+            offset = 0
 
-        params_rows = params + [offset, page_size]
-        cursor.execute(sql_rows, params_rows)
-        rows = cursor.fetchall()
-        
-        items: List[Dict[str, Any]] = []
-        for r in rows:
-            items.append({
-                "fecha": str(r[0]) if r[0] else "", 
-                "Mes": str(r[1]) if r[1] is not None else "",
-                "hora": str(r[2]) if r[2] else "",
-                "id_pro": int(r[3]),
-                "CCODIGOPRODUCTO": r[4],
-                "CNOMBREPRODUCTO": r[5],
-                "cantidad": float(r[6]),
-                "CNOMBREUNIDAD": r[7],
-                "precio": float(r[8]),
-                "Importe": float(r[9]),
-                "descuento": float(r[10]),
-                "impuesto": float(r[11]),
-                "Total": float(r[12]),
-                "CNOMBREALMACEN": r[13],
-                "Folio": "" 
-            })
+        # Se pide una fila extra para saber si existe página siguiente.
+        sql_rows = f"""
+            SELECT
+                fecha, Mes, hora, id_pro, CCODIGOPRODUCTO, CNOMBREPRODUCTO,
+                cantidad, CNOMBREUNIDAD, precio, Importe, descuento,
+                impuesto, Total, CNOMBREALMACEN, id_venta{", id_movimiento" if por_llave else ""}
+            FROM zzVentasPorProducto WITH (NOLOCK)
+            {where_pagina}
+            ORDER BY {_ORDEN_CON_LLAVE if por_llave else _ORDEN_SIN_LLAVE}
+            OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
+            OPTION (RECOMPILE);
+        """
 
-        return {
-            "items": items,
-            "total_items": int(total_items),
-            "page": page,
-            "page_size": page_size,
-        }
+        if total_items is None and conteo != "diferido":
+            total_items = _ejecutar_conteo(cursor_db, where_sql, params)
+            _guardar_conteo(clave, total_items)
+
+        params_rows = params_pagina + [offset, page_size + 1]
+        cursor_db.execute(sql_rows, params_rows)
+        rows = cursor_db.fetchall()
+
+        next_cursor = None
+        hay_mas = len(rows) > page_size
+        if hay_mas:
+            rows = rows[:page_size]
+            next_cursor = _codificar_cursor(rows[-1], firma, None if por_llave else offset + page_size)
+
+        total_exacto = total_items is not None
+        if not total_exacto:
+            # Cota inferior: lo ya recorrido + esta página (+1 si hay más).
+            total_items = filas_previas + len(rows) + (1 if hay_mas else 0)
+        
+        return _armar_pagina(rows, formato, total_items, page, page_size, next_cursor, total_exacto)
 
     except Exception as e:
         logger.error(f"!!! ERROR TABLA !!!: {e}")
@@ -166,13 +629,32 @@ def listar_ventas_producto(
 
 # ----------------- KPIs MEJORADOS (INTELIGENTES) -----------------
 
-def calcular_kpis(filtros: "VentasProductoFiltros") -> Dict[str, Any]:
+def _top_sucursal(filas: List[Any]) -> Tuple[Optional[str], Optional[float]]:
+    """Elige la sucursal con más venta de las filas por sucursal de un GROUPING SETS."""
+    mejor = None
+    for f in filas:
+        if mejor is None or float(f[1]) > float(mejor[1]):
+            mejor = f
+    return (mejor[0], float(mejor[1])) if mejor else (None, None)
+
+@cacheado("kpis", _clave_filtros)
+@medir_sql("kpis")
+def _consultar_kpis(filtros: "VentasProductoFiltros") -> Dict[str, Any]:
+    """
+    Calcula los KPIs en un solo viaje a la base de datos.
+
+    - Vista rápida (sin producto): un lote con dos result sets. El primero recorre
+      zzVentasResumen una vez con GROUPING SETS ((sucursal), ()) para sacar el total
+      general y el total por sucursal; el segundo obtiene unidades y productos
+      distintos de zzVentasPorProducto. Se leen con nextset().
+    - Vista lenta (con producto): una sola sentencia sobre zzVentasPorProducto con
+      GROUPING SETS ((CNOMBREALMACEN), ()), un solo recorrido de los datos filtrados.
+
+    GROUPING(col) = 1 marca la fila del total general.
+    """
     conn = None
     try:
         usar_vista_resumen = (filtros.producto is None or filtros.producto.strip() == "")
-        
-        conn = get_connection()
-        cur = conn.cursor()
 
         total_vendido = 0.0
         unidades = 0.0
@@ -181,80 +663,74 @@ def calcular_kpis(filtros: "VentasProductoFiltros") -> Dict[str, Any]:
         distintos_prods = 0
         top_suc = (None, None)
 
+        where_sql_pesado, params_pesado = _build_filtros_where(
+            filtros.sucursal, filtros.producto, filtros.fecha_desde, 
+            filtros.fecha_hasta, filtros.mes, filtros.anio, 
+            es_vista_resumen=False
+        )
         if usar_vista_resumen:
-            # VISTA RÁPIDA
             where_sql, params = _build_filtros_where(
                 filtros.sucursal, None, filtros.fecha_desde, 
                 filtros.fecha_hasta, filtros.mes, filtros.anio, 
                 es_vista_resumen=True
             )
-            
-            sql_totales = f"""
-                SELECT COUNT(*), ISNULL(SUM(total_venta), 0)
+
+        # La conexión se pide ya con los WHERE armados (armarlos puede requerir otra conexión)
+        conn = get_connection()
+        cur = conn.cursor()
+
+        if usar_vista_resumen:
+            # VISTA RÁPIDA
+            sql_lote = f"""
+                SET NOCOUNT ON;
+                SELECT GROUPING(sucursal), sucursal, COUNT(*), ISNULL(SUM(total_venta), 0)
                 FROM zzVentasResumen WITH (NOLOCK) 
                 {where_sql}
-            """
-            cur.execute(sql_totales, params)
-            row = cur.fetchone()
-            tickets_unicos = int(row[0]) if row else 0
-            total_vendido = float(row[1]) if row else 0.0
+                GROUP BY GROUPING SETS ((sucursal), ());
 
-            # Unidades (Pesado)
-            where_sql_pesado, params_pesado = _build_filtros_where(
-                filtros.sucursal, filtros.producto, filtros.fecha_desde, 
-                filtros.fecha_hasta, filtros.mes, filtros.anio, 
-                es_vista_resumen=False
-            )
-            sql_unidades = f"""
                 SELECT ISNULL(SUM(cantidad), 0), COUNT(DISTINCT id_pro)
                 FROM zzVentasPorProducto WITH (NOLOCK)
-                {where_sql_pesado}
-            """
-            cur.execute(sql_unidades, params_pesado)
-            row_u = cur.fetchone()
-            unidades = float(row_u[0]) if row_u else 0.0
-            distintos_prods = int(row_u[1]) if row_u else 0
-
-            # Top Sucursal
-            sql_top = f"""
-                SELECT TOP 1 sucursal, SUM(total_venta) 
-                FROM zzVentasResumen WITH (NOLOCK) 
-                {where_sql} 
-                GROUP BY sucursal 
-                ORDER BY 2 DESC
+                {where_sql_pesado};
             """
-            cur.execute(sql_top, params)
-            row_t = cur.fetchone()
-            top_suc = (row_t[0], float(row_t[1])) if row_t else (None, None)
+            cur.execute(sql_lote, params + params_pesado)
 
-        else:
-            # VISTA LENTA
-            where_sql, params = _build_filtros_where(
-                filtros.sucursal, filtros.producto, filtros.fecha_desde, 
-                filtros.fecha_hasta, filtros.mes, filtros.anio, 
-                es_vista_resumen=False
-            )
+            filas_suc = []
+            for r in cur.fetchall():
+                if r[0] == 1:
+                    tickets_unicos = int(r[2])
+                    total_vendido = float(r[3])
+                else:
+                    filas_suc.append((r[1], r[3]))
+            top_suc = _top_sucursal(filas_suc)
+
+            if cur.nextset():
+                row_u = cur.fetchone()
+                unidades = float(row_u[0]) if row_u else 0.0
+                distintos_prods = int(row_u[1]) if row_u else 0
 
-            sql_totales = f"""
-                SELECT COUNT(DISTINCT id_venta), ISNULL(SUM(Total), 0), ISNULL(SUM(cantidad), 0)
+        else:
+            # VISTA DE DETALLE (filtro de producto ya resuelto a id_pro)
+            sql = f"""
+                SELECT
+                    GROUPING(CNOMBREALMACEN), CNOMBREALMACEN,
+                    COUNT(DISTINCT id_venta), ISNULL(SUM(Total), 0),
+                    ISNULL(SUM(cantidad), 0), COUNT(DISTINCT id_pro)
                 FROM zzVentasPorProducto WITH (NOLOCK) 
-                {where_sql}
+                {where_sql_pesado}
+                GROUP BY GROUPING SETS ((CNOMBREALMACEN), ())
             """
-            cur.execute(sql_totales, params)
-            row = cur.fetchone()
-            tickets_unicos = int(row[0]) if row else 0
-            total_vendido = float(row[1]) if row else 0.0
-            unidades = float(row[2]) if row else 0.0
-
-            sql_distinct = f"SELECT COUNT(DISTINCT id_pro) FROM zzVentasPorProducto WITH (NOLOCK) {where_sql}"
-            cur.execute(sql_distinct, params)
-            row_d = cur.fetchone()
-            distintos_prods = int(row_d[0]) if row_d else 0
-
-            sql_top = f"SELECT TOP 1 CNOMBREALMACEN, SUM(Total) FROM zzVentasPorProducto WITH (NOLOCK) {where_sql} GROUP BY CNOMBREALMACEN ORDER BY 2 DESC"
-            cur.execute(sql_top, params)
-            row_t = cur.fetchone()
-            top_suc = (row_t[0], float(row_t[1])) if row_t else (None, None)
+            cur.execute(sql, params_pesado)
+
+            filas_suc = []
+            for r in cur.fetchall():
+                if r[0] == 1:
+                    tickets_unicos = int(r[2])
+                    total_vendido = float(r[3])
+                    unidades = float(r[4])
+                    distintos_prods = int(r[5])
+                else:
+                    filas_suc.append((r[1], r[3]))
+            top_suc = _top_sucursal(filas_suc)
 
         if tickets_unicos > 0:
             ticket_promedio = total_vendido / tickets_unicos
@@ -267,23 +743,29 @@ def calcular_kpis(filtros: "VentasProductoFiltros") -> Dict[str, Any]:
             "sucursal_top": top_suc[0],
             "sucursal_top_total": top_suc[1],
         }
+    finally:
+        if conn: conn.close()
 
+def _kpis_vacios() -> Dict[str, Any]:
+    return {"total_vendido": 0, "unidades_vendidas": 0, "productos_distintos": 0, "ticket_promedio": 0}
+
+def calcular_kpis(filtros: "VentasProductoFiltros") -> Dict[str, Any]:
+    try:
+        return _consultar_kpis(filtros)
     except Exception as e:
         logger.error(f"KPI ERROR: {e}")
-        return {"total_vendido": 0, "unidades_vendidas": 0, "productos_distintos": 0, "ticket_promedio": 0}
-    finally:
-        if conn: conn.close()
+        return _kpis_vacios()
 
 
 # ----------------- GRÁFICA: HORAS PICO -----------------
 
-def obtener_ventas_por_hora(filtros: "VentasProductoFiltros") -> List[Dict[str, Any]]:
+@cacheado("horas", _clave_filtros)
+@medir_sql("horas")
+def _consultar_ventas_por_hora(filtros: "VentasProductoFiltros") -> List[Dict[str, Any]]:
     conn = None
     try:
         usar_vista_resumen = (filtros.producto is None or filtros.producto.strip() == "")
         resultados = []
-        conn = get_connection()
-        cur = conn.cursor()
 
         if usar_vista_resumen:
             where_sql, params = _build_filtros_where(
@@ -312,6 +794,9 @@ def obtener_ventas_por_hora(filtros: "VentasProductoFiltros") -> List[Dict[str,
                 ORDER BY HoraDelDia
             """
 
+        # La conexión se pide ya con el WHERE armado (armarlo puede requerir otra conexión)
+        conn = get_connection()
+        cur = conn.cursor()
         cur.execute(sql, params)
         rows = cur.fetchall()
         
@@ -323,16 +808,21 @@ def obtener_ventas_por_hora(filtros: "VentasProductoFiltros") -> List[Dict[str,
             })
             
         return resultados
+    finally:
+        if conn: conn.close()
 
+def obtener_ventas_por_hora(filtros: "VentasProductoFiltros") -> List[Dict[str, Any]]:
+    try:
+        return _consultar_ventas_por_hora(filtros)
     except Exception as e:
         logger.error(f"HORAS PICO ERROR: {e}")
         return []
-    finally:
-        if conn: conn.close()
 
 
 # ----------------- TOP PRODUCTOS -----------------
-def top_productos(filtros: "VentasProductoFiltros") -> List[Dict[str, Any]]:
+@cacheado("top", _clave_filtros_sin_producto)
+@medir_sql("top")
+def _consultar_top_productos(filtros: "VentasProductoFiltros") -> List[Dict[str, Any]]:
     conn = None
     try:
         where_sql, params = _build_filtros_where(
@@ -352,16 +842,24 @@ def top_productos(filtros: "VentasProductoFiltros") -> List[Dict[str, Any]]:
         cur.execute(sql, params)
         rows = cur.fetchall()
         return [{"codigo": r[0], "producto": r[1], "total_vendido": float(r[2]), "cantidad_vendida": float(r[3])} for r in rows]
+    finally:
+        if conn: conn.close()
+
+def top_productos(filtros: "VentasProductoFiltros") -> List[Dict[str, Any]]:
+    try:
+        return _consultar_top_productos(filtros)
     except Exception as e:
         logger.error(f"TOP PRODUCTOS ERROR: {e}")
         return []
-    finally:
-        if conn: conn.close()
 
 
 # ----------------- CATÁLOGOS Y EXPORTACIÓN -----------------
 
 def obtener_sucursales() -> List[str]:
+    catalogo = catalogo_sucursales.obtener_catalogo()
+    if catalogo is not None:
+        return list(catalogo.nombres)
+
     conn = None
     try:
         sql = "SELECT nombre FROM zz_SucursalesReporte WITH (NOLOCK) ORDER BY nombre"
@@ -375,9 +873,14 @@ def obtener_sucursales() -> List[str]:
         if conn: conn.close()
 
 def obtener_productos(q: Optional[str] = None, top: int = 50) -> List[Dict[str, Any]]:
+    top = max(1, min(int(top), 200))
+    indice = indice_productos.obtener_indice()
+    if indice is not None:
+        return indice.buscar(q, top)
+
+    # Sin índice (catálogo aún no cargado): búsqueda directa en SQL
     conn = None
     try:
-        top = max(1, min(int(top), 200))
         sql = f"SELECT TOP {top} CIDPRODUCTO, CCODIGOPRODUCTO, CNOMBREPRODUCTO FROM admProductos WITH (NOLOCK) WHERE CIDPRODUCTO <> 0"
         params = []
         if q:
@@ -395,31 +898,194 @@ def obtener_productos(q: Optional[str] = None, top: int = 50) -> List[Dict[str,
     finally:
         if conn: conn.close()
 
-def resumen_por_sucursal_mes_actual(mes: Optional[int] = None, anio: Optional[int] = None) -> List[Dict[str, Any]]:
+@cacheado("sucursales_mes", _clave_resumen)
+@medir_sql("sucursales_mes")
+def _consultar_resumen_sucursales(mes: Optional[int] = None, anio: Optional[int] = None) -> List[Dict[str, Any]]:
     conn = None
     try:
-        now = datetime.now()
-        mes = mes or now.month
-        anio = anio or now.year
+        periodo = _clave_resumen(mes=mes, anio=anio)
         sql = """
             SELECT ISNULL(sucursal, 'SIN SUCURSAL'), ISNULL(SUM(total_venta), 0) 
             FROM zzVentasResumen WITH (NOLOCK) 
-            WHERE YEAR(fecha) = ? AND MONTH(fecha) = ? 
+            WHERE fecha >= ? AND fecha < ? 
             GROUP BY sucursal
             ORDER BY 2 DESC
         """
         conn = get_connection()
         cur = conn.cursor()
-        cur.execute(sql, [anio, mes])
+        cur.execute(sql, [periodo.desde, periodo.hasta])
         rows = cur.fetchall()
         return [{"sucursal": r[0], "total_vendido": float(r[1])} for r in rows]
-    except Exception:
-        return []
     finally:
         if conn: conn.close()
 
-from app.reports.excel_generator import generar_excel_ventas_producto
-from io import BytesIO
+def resumen_por_sucursal_mes_actual(mes: Optional[int] = None, anio: Optional[int] = None) -> List[Dict[str, Any]]:
+    try:
+        return _consultar_resumen_sucursales(mes=mes, anio=anio)
+    except Exception as e:
+        logger.error(f"RESUMEN SUCURSALES ERROR: {e}")
+        return []
+
+
+# ----------------- DASHBOARD EN UNA SOLA LLAMADA (BUNDLE) -----------------
+#
+# Los cuatro widgets del dashboard se consultan en paralelo en el ejecutor de
+# reportes, cada uno con su propia conexión del pool. Un widget que falla no tumba
+# a los demás: regresa el mismo valor vacío que su endpoint individual y un aviso
+# genérico (el detalle del driver solo va a la bitácora).
+
+ERROR_WIDGET = "No se pudo consultar este indicador. Intenta de nuevo."
+
+def _medir_widget(nombre: str, fn: Callable[..., Any], vacio: Any, *args: Any, **kwargs: Any) -> Dict[str, Any]:
+    t0 = reloj.perf_counter()
+    try:
+        data, error = fn(*args, **kwargs), None
+    except Exception as e:
+        logger.error(f"BUNDLE {nombre.upper()} ERROR: {e}")
+        data, error = vacio, ERROR_WIDGET
+    return {"data": data, "ms": round((reloj.perf_counter() - t0) * 1000, 1), "error": error}
+
+async def obtener_dashboard_bundle(filtros: "VentasProductoFiltros") -> Dict[str, Any]:
+    """
+    Ejecuta KPIs, horas pico, top productos y venta por sucursal de forma concurrente.
+
+    Cada entrada del resultado trae 'data', 'ms' (tiempo del widget) y 'error'.
+    El filtro de sucursal por usuario se aplica en la capa de la API.
+    """
+    t0 = reloj.perf_counter()
+    nombres = ["kpis", "horas_pico", "top_productos", "ventas_por_sucursal"]
+    datos = await asyncio.gather(
+        ejecutar_en_bd(_medir_widget, "kpis", _consultar_kpis, _kpis_vacios(), filtros),
+        ejecutar_en_bd(_medir_widget, "horas_pico", _consultar_ventas_por_hora, [], filtros),
+        ejecutar_en_bd(_medir_widget, "top_productos", _consultar_top_productos, [], filtros),
+        ejecutar_en_bd(
+            _medir_widget, "ventas_por_sucursal", _consultar_resumen_sucursales, [],
+            mes=filtros.mes, anio=filtros.anio,
+        ),
+    )
+    resultado: Dict[str, Any] = dict(zip(nombres, datos))
+    resultado["ms_total"] = round((reloj.perf_counter() - t0) * 1000, 1)
+    return resultado
+
+from app.reports.excel_generator import generar_excel_ventas_producto_stream
+from contextlib import closing
+from typing import BinaryIO, Iterator
+import csv
+import io
+import tempfile
+import zlib
+
+# ----------------- EXPORTACIÓN (STREAMING) -----------------
+#
+# El detalle se lee del cursor en lotes (fetchmany) y se escribe directo al libro,
+# que a su vez se guarda en un archivo temporal. Nada del resultado
+# completo vive en memoria, sin importar cuántas filas tenga la exportación.
+
+EXPORT_TAMANO_LOTE = 5000
+EXPORT_TAMANO_BLOQUE = 64 * 1024
+
+_MESES = ["", "ENERO", "FEBRERO", "MARZO", "ABRIL", "MAYO", "JUNIO", 
+          "JULIO", "AGOSTO", "SEPTIEMBRE", "OCTUBRE", "NOVIEMBRE", "DICIEMBRE"]
+
+def _texto_periodo(
+    fecha_desde: Optional[date], fecha_hasta: Optional[date], mes: Optional[int], anio: Optional[int]
+) -> str:
+    if mes and anio: return f"{_MESES[int(mes)]} {anio}"
+    if mes: return f"{_MESES[int(mes)]}"
+    if anio: return f"DEL AÑO {anio}"
+    if fecha_desde and fecha_hasta: return f"DEL {fecha_desde} AL {fecha_hasta}"
+    return "HISTÓRICO GENERAL"
+
+class _LotesConsulta:
+    """
+    Ejecuta la consulta al crearse (los errores de SQL salen aquí, antes de escribir
+    nada) y luego entrega las filas en lotes de 'tamano_lote' con fetchmany.
+    La conexión vuelve al pool al agotarse los lotes o al llamar close().
+    """
+
+    def __init__(self, sql: str, params: List[Any], tamano_lote: int = EXPORT_TAMANO_LOTE):
+        self.tamano_lote = tamano_lote
+        self.filas = 0
+        self._inicio = reloj.perf_counter()
+        self.conn = get_connection()
+        try:
+            self.cur = self.conn.cursor()
+            self.cur.execute(sql, params)
+        except Exception:
+            sql_errores.inc("export")
+            self.close()
+            raise
+
+    def __iter__(self) -> "_LotesConsulta":
+        return self
+
+    def __next__(self) -> List[Any]:
+        if self.conn is None:
+            raise StopIteration
+        lote = self.cur.fetchmany(self.tamano_lote)
+        if not lote:
+            self.close()
+            raise StopIteration
+        self.filas += len(lote)
+        return lote
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+            sql_duracion.observar(reloj.perf_counter() - self._inicio, "export")
+            sql_filas.inc("export", valor=self.filas)
+
+def leer_en_bloques(archivo: BinaryIO, tamano: int = EXPORT_TAMANO_BLOQUE) -> Iterator[bytes]:
+    """Lee un archivo por bloques (para StreamingResponse) y lo cierra al terminar."""
+    try:
+        while True:
+            bloque = archivo.read(tamano)
+            if not bloque:
+                break
+            yield bloque
+    finally:
+        archivo.close()
+
+def escribir_excel_ventas(
+    destino: BinaryIO,
+    sucursal: Optional[str] = None,
+    producto: Optional[str] = None,
+    fecha_desde: Optional[date] = None,
+    fecha_hasta: Optional[date] = None,
+    mes: Optional[int] = None,
+    anio: Optional[int] = None,
+    progreso: Optional[Callable[[int], None]] = None,
+) -> int:
+    """
+    Escribe el Excel del detalle en 'destino' leyendo la consulta por lotes.
+    'progreso', si se indica, recibe el número de filas escritas después de cada lote.
+    Regresa el total de filas de detalle.
+    """
+    where_sql, params = _build_filtros_where(
+        sucursal, producto, fecha_desde, fecha_hasta, mes, anio, es_vista_resumen=False
+    )
+    sql = f"""
+        SELECT
+            CCODIGOPRODUCTO, CNOMBREPRODUCTO, cantidad, CNOMBREUNIDAD,
+            precio, Importe, descuento, impuesto, Total
+        FROM zzVentasPorProducto WITH (NOLOCK)
+        {where_sql}
+        ORDER BY id_pro
+    """
+    sucursal_texto = sucursal if sucursal else "TODAS LAS SUCURSALES"
+    periodo = _texto_periodo(fecha_desde, fecha_hasta, mes, anio)
+
+    with closing(_LotesConsulta(sql, params)) as lotes:
+        fuente = _con_progreso(lotes, progreso) if progreso else lotes
+        return generar_excel_ventas_producto_stream(fuente, sucursal_texto, periodo, destino)
+
+def _con_progreso(lotes: Iterator[List[Any]], progreso: Callable[[int], None]) -> Iterator[List[Any]]:
+    filas = 0
+    for lote in lotes:
+        yield lote
+        filas += len(lote)
+        progreso(filas)
 
 def exportar_ventas_excel(
     sucursal: Optional[str] = None,
@@ -428,56 +1094,180 @@ def exportar_ventas_excel(
     fecha_hasta: Optional[date] = None,
     mes: Optional[int] = None,
     anio: Optional[int] = None,
-) -> BytesIO:
-    conn = None
+) -> BinaryIO:
+    """
+    Genera el Excel del detalle en un archivo temporal y lo regresa abierto y
+    posicionado al inicio. El archivo se borra solo al cerrarlo.
+    """
+    archivo = tempfile.TemporaryFile(suffix=".xlsx")
+    inicio = reloj.perf_counter()
     try:
-        where_sql, params = _build_filtros_where(
-            sucursal, producto, fecha_desde, fecha_hasta, mes, anio, es_vista_resumen=False
+        escribir_excel_ventas(
+            archivo, sucursal=sucursal, producto=producto, fecha_desde=fecha_desde,
+            fecha_hasta=fecha_hasta, mes=mes, anio=anio,
         )
-        sql = f"""
-            SELECT
-                fecha, Mes, hora, id_pro, CCODIGOPRODUCTO, CNOMBREPRODUCTO,
-                cantidad, CNOMBREUNIDAD, precio, Importe, descuento,
-                impuesto, Total, CNOMBREALMACEN
-            FROM zzVentasPorProducto WITH (NOLOCK)
-            {where_sql}
-            ORDER BY id_pro
-        """
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute(sql, params)
-        rows = cur.fetchall()
-        items = []
-        for r in rows:
-            items.append({
-                "fecha": str(r[0]) if r[0] else "", 
-                "Mes": str(r[1]) if r[1] is not None else "",
-                "hora": str(r[2]) if r[2] else "",
-                "id_pro": int(r[3]),
-                "CCODIGOPRODUCTO": r[4],
-                "CNOMBREPRODUCTO": r[5],
-                "cantidad": float(r[6]),
-                "CNOMBREUNIDAD": r[7],
-                "precio": float(r[8]),
-                "Importe": float(r[9]),
-                "descuento": float(r[10]),
-                "impuesto": float(r[11]),
-                "Total": float(r[12]),
-                "CNOMBREALMACEN": r[13],
-                "Folio": ""
-            })
-        
-        sucursal_texto = sucursal if sucursal else "TODAS LAS SUCURSALES"
-        meses = ["", "ENERO", "FEBRERO", "MARZO", "ABRIL", "MAYO", "JUNIO", 
-                 "JULIO", "AGOSTO", "SEPTIEMBRE", "OCTUBRE", "NOVIEMBRE", "DICIEMBRE"]
-        
-        periodo = ""
-        if mes and anio: periodo = f"{meses[int(mes)]} {anio}"
-        elif mes: periodo = f"{meses[int(mes)]}"
-        elif anio: periodo = f"DEL AÑO {anio}"
-        elif fecha_desde and fecha_hasta: periodo = f"DEL {fecha_desde} AL {fecha_hasta}"
-        else: periodo = "HISTÓRICO GENERAL"
-        
-        return generar_excel_ventas_producto(items, sucursal_texto, periodo)
+        registrar_exportacion("xlsx", reloj.perf_counter() - inicio, archivo.tell())
+        archivo.seek(0)
+        return archivo
+    except Exception as e:
+        archivo.close()
+        logger.error(f"!!! ERROR EXPORTACIÓN EXCEL !!!: {e}")
+        raise e
+
+
+# ----------------- EXPORTACIÓN CRUDA (CSV / NDJSON) -----------------
+#
+# Para Power BI / pandas: las filas salen del cursor y se codifican lote por lote,
+# sin estilos ni libro intermedio. Opcionalmente comprimidas con gzip.
+
+COLUMNAS_EXPORT = [
+    "fecha", "Mes", "hora", "id_pro", "CCODIGOPRODUCTO", "CNOMBREPRODUCTO",
+    "cantidad", "CNOMBREUNIDAD", "precio", "Importe", "descuento",
+    "impuesto", "Total", "CNOMBREALMACEN",
+]
+_COLUMNAS_NUMERICAS = {6, 8, 9, 10, 11, 12}
+
+def _texto_csv(valor: Any) -> Any:
+    if valor is None:
+        return ""
+    if isinstance(valor, (date, time)):
+        return valor.isoformat()
+    return valor
+
+def _fila_json(r: Any) -> Dict[str, Any]:
+    fila = {}
+    for i, nombre in enumerate(COLUMNAS_EXPORT):
+        v = r[i]
+        if v is None:
+            fila[nombre] = None
+        elif i in _COLUMNAS_NUMERICAS:
+            fila[nombre] = float(v)
+        elif i == 3:
+            fila[nombre] = int(v)
+        elif isinstance(v, (date, time)):
+            fila[nombre] = v.isoformat()
+        else:
+            fila[nombre] = v if isinstance(v, str) else str(v)
+    return fila
+
+def exportar_ventas_texto(
+    formato: str,
+    comprimir: bool = False,
+    sucursal: Optional[str] = None,
+    producto: Optional[str] = None,
+    fecha_desde: Optional[date] = None,
+    fecha_hasta: Optional[date] = None,
+    mes: Optional[int] = None,
+    anio: Optional[int] = None,
+) -> Iterator[bytes]:
+    """
+    Genera el detalle como CSV ('csv') o JSON por línea ('ndjson'), en bloques de bytes.
+
+    No lleva ORDER BY para que las primeras filas salgan en cuanto el servidor
+    las produce. La conexión se libera al terminar de consumir el generador.
+    """
+    where_sql, params = _build_filtros_where(
+        sucursal, producto, fecha_desde, fecha_hasta, mes, anio, es_vista_resumen=False
+    )
+    sql = f"""
+        SELECT {", ".join(COLUMNAS_EXPORT)}
+        FROM zzVentasPorProducto WITH (NOLOCK)
+        {where_sql}
+    """
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31) if comprimir else None
+    inicio = reloj.perf_counter()
+    enviados = 0
+
+    def salida(texto: str) -> bytes:
+        nonlocal enviados
+        crudo = texto.encode("utf-8")
+        bloque = gz.compress(crudo) if gz else crudo
+        enviados += len(bloque)
+        return bloque
+
+    if formato == "csv":
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer, lineterminator="\n")
+        escritor.writerow(COLUMNAS_EXPORT)
+        yield salida(buffer.getvalue())
+        with closing(_LotesConsulta(sql, params)) as lotes:
+            for lote in lotes:
+                buffer.seek(0)
+                buffer.truncate()
+                escritor.writerows([_texto_csv(v) for v in r] for r in lote)
+                bloque = salida(buffer.getvalue())
+                if bloque:
+                    yield bloque
+    else:
+        with closing(_LotesConsulta(sql, params)) as lotes:
+            for lote in lotes:
+                texto = "".join(json.dumps(_fila_json(r), ensure_ascii=False) + "\n" for r in lote)
+                bloque = salida(texto)
+                if bloque:
+                    yield bloque
+
+    if gz:
+        final = gz.flush()
+        enviados += len(final)
+        yield final
+
+    registrar_exportacion(formato + (".gz" if comprimir else ""), reloj.perf_counter() - inicio, enviados)
+
+
+# ----------------- API ASÍNCRONA (PARA LAS RUTAS) -----------------
+#
+# Las rutas hacen 'await' de estas versiones: la función síncrona corre en el
+# ejecutor de reportes (ver app.core.database) y no ocupa hilos del pool general.
+
+def _asincrona(fn: Callable[..., Any]) -> Callable[..., Any]:
+    @wraps(fn)
+    async def envoltura(*args: Any, **kwargs: Any) -> Any:
+        return await ejecutar_en_bd(fn, *args, **kwargs)
+    return envoltura
+
+listar_ventas_producto_async = _asincrona(listar_ventas_producto)
+contar_ventas_producto_async = _asincrona(contar_ventas_producto)
+calcular_kpis_async = _asincrona(calcular_kpis)
+obtener_ventas_por_hora_async = _asincrona(obtener_ventas_por_hora)
+top_productos_async = _asincrona(top_productos)
+resumen_por_sucursal_mes_actual_async = _asincrona(resumen_por_sucursal_mes_actual)
+obtener_sucursales_async = _asincrona(obtener_sucursales)
+obtener_productos_async = _asincrona(obtener_productos)
+exportar_ventas_excel_async = _asincrona(exportar_ventas_excel)
+
+async def iterar_en_bd(generador: Iterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Recorre un generador de exportación pidiendo cada bloque en el ejecutor de
+    reportes (cada bloque puede implicar un fetchmany a SQL Server).
+    """
+    fin = object()
+    # Un 'next' cancelado sigue corriendo en su hilo; el candado evita cerrar el
+    # generador mientras todavía está ejecutándose.
+    candado = threading.Lock()
+
+    def paso() -> Any:
+        with candado:
+            return next(generador, fin)
+
+    def cerrar() -> None:
+        with candado:
+            generador.close()
+
+    terminado = False
+    try:
+        while True:
+            bloque = await ejecutar_en_bd(paso)
+            if bloque is fin:
+                terminado = True
+                break
+            yield bloque
     finally:
-        if conn: conn.close()
\ No newline at end of file
+        if not terminado:
+            # Descarga interrumpida (cliente desconectado): se cancela la sentencia
+            # para que el cierre no espere a que SQL Server termine de enviar filas.
+            consulta = consulta_actual.get()
+            if consulta is not None:
+                consulta.cancelar()
+        # Cerrar el generador devuelve la conexión al pool; se hace en el ejecutor,
+        # sin esperar, para que también funcione si la petición se canceló.
+        ejecutor_reportes.submit(cerrar)
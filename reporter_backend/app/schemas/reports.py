@@ -1,5 +1,8 @@
-from typing import List, Optional
-from pydantic import BaseModel
+from datetime import datetime
+from typing import Any, Generic, List, Optional, TypeVar
+from pydantic import BaseModel, Field
+
+T = TypeVar("T")
 
 class VentasProductoRow(BaseModel):
     fecha: Optional[str] = None
@@ -28,6 +31,30 @@ class VentasProductoPage(BaseModel):
     page: int
     page_size: int
     items: List[VentasProductoRow]
+    # Token opaco para pedir la siguiente página por llave (None si no hay más)
+    next_cursor: Optional[str] = None
+    # False cuando total_items es una estimación (conteo diferido)
+    total_exacto: bool = True
+
+# Misma página con format=columns: un arreglo por columna en el orden de 'schema'.
+# Las columnas con 'dictionary' traen índices a esa lista en lugar del valor.
+class ColumnaEsquema(BaseModel):
+    name: str
+    type: str  # "string" | "int" | "float"
+    dictionary: Optional[List[Any]] = None
+
+class VentasProductoColumnas(BaseModel):
+    total_items: int
+    page: int
+    page_size: int
+    length: int
+    schema_: List[ColumnaEsquema] = Field(alias="schema")
+    columns: List[List[Any]]
+    next_cursor: Optional[str] = None
+    total_exacto: bool = True
+
+class VentasProductoConteo(BaseModel):
+    total_items: int
 
 class VentasProductoFiltros(BaseModel):
     sucursal: Optional[str] = None
@@ -61,4 +88,30 @@ class VentasProductoKpis(BaseModel):
     # Nuevo campo agregado
     ticket_promedio: float = 0.0
     sucursal_top: Optional[str] = None
-    sucursal_top_total: Optional[float] = None
\ No newline at end of file
+    sucursal_top_total: Optional[float] = None
+
+# --- DASHBOARD EN UNA SOLA LLAMADA ---
+
+class WidgetResultado(BaseModel, Generic[T]):
+    data: Optional[T] = None
+    ms: float               # Tiempo que tardó el widget (milisegundos)
+    error: Optional[str] = None
+
+class DashboardBundle(BaseModel):
+    kpis: WidgetResultado[VentasProductoKpis]
+    horas_pico: WidgetResultado[List[VentaPorHoraItem]]
+    top_productos: WidgetResultado[List[TopProducto]]
+    ventas_por_sucursal: WidgetResultado[List[VentasPorSucursalItem]]
+    ms_total: float
+
+
+# --- EXPORTACIONES EN SEGUNDO PLANO ---
+
+class TrabajoExportEstado(BaseModel):
+    id: str
+    estado: str                 # en_cola | ejecutando | terminado | error
+    filas: int                  # Filas escritas hasta el momento
+    creado: datetime
+    terminado: Optional[datetime] = None
+    error: Optional[str] = None
+    tamano_bytes: Optional[int] = None
@@ -0,0 +1,130 @@
+"""
+Benchmark del generador de Excel de ventas por producto.
+
+Compara el generador original en memoria (generar_excel_ventas_producto) contra la
+versión por lotes (generar_excel_ventas_producto_stream) con filas sintéticas.
+Cada caso corre en un proceso aparte para que la memoria pico no se mezcle.
+
+Uso (desde reporter_backend):
+    python -m benchmarks.bench_excel
+    python -m benchmarks.bench_excel --filas 10000 100000 --sin-original
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TAMANO_LOTE = 5000
+UNIDADES = ["PIEZA", "KILO", "CAJA", "LITRO"]
+
+
+def _fila_sintetica(i: int, rnd: random.Random) -> Tuple[Any, ...]:
+    # Mismos tipos que regresa pyodbc para la consulta del reporte (DECIMAL -> Decimal)
+    cantidad = Decimal(rnd.randint(1, 50))
+    precio = Decimal(rnd.randint(500, 150000)) / 100
+    importe = cantidad * precio
+    descuento = Decimal(0) if i % 7 else importe / 10
+    impuesto = (importe - descuento) * Decimal("0.16")
+    return (
+        f"P{i % 20000:06d}",
+        f"PRODUCTO SINTÉTICO {i % 20000} & CÍA",
+        cantidad,
+        UNIDADES[i % len(UNIDADES)],
+        precio,
+        importe,
+        descuento,
+        impuesto,
+        importe - descuento + impuesto,
+    )
+
+
+def _lotes(filas: int) -> Iterator[List[Tuple[Any, ...]]]:
+    rnd = random.Random(filas)
+    for inicio in range(0, filas, TAMANO_LOTE):
+        yield [_fila_sintetica(i, rnd) for i in range(inicio, min(inicio + TAMANO_LOTE, filas))]
+
+
+def _items(filas: int) -> List[Dict[str, Any]]:
+    # El generador original recibe la lista completa de diccionarios (como /rows)
+    claves = ["CCODIGOPRODUCTO", "CNOMBREPRODUCTO", "cantidad", "CNOMBREUNIDAD",
+              "precio", "Importe", "descuento", "impuesto", "Total"]
+    return [dict(zip(claves, r)) for lote in _lotes(filas) for r in lote]
+
+
+def _memoria_pico_mb() -> float:
+    try:
+        import resource
+    except ImportError:  # Windows
+        import tracemalloc
+        return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB, macOS bytes
+    return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+
+
+def _correr_caso(generador: str, filas: int, cola) -> None:
+    try:
+        import resource  # noqa: F401
+    except ImportError:  # Windows: se mide con tracemalloc
+        import tracemalloc
+        tracemalloc.start()
+
+    from app.reports.excel_generator import (
+        generar_excel_ventas_producto,
+        generar_excel_ventas_producto_stream,
+    )
+
+    inicio = time.perf_counter()
+    if generador == "original":
+        salida = generar_excel_ventas_producto(_items(filas), "BENCHMARK", "ENERO 2025")
+        tamano = len(salida.getbuffer())
+    else:
+        with tempfile.TemporaryFile() as destino:
+            generar_excel_ventas_producto_stream(_lotes(filas), "BENCHMARK", "ENERO 2025", destino)
+            tamano = destino.tell()
+    segundos = time.perf_counter() - inicio
+    cola.put((segundos, _memoria_pico_mb(), tamano))
+
+
+def medir(generador: str, filas: int) -> Dict[str, Any]:
+    ctx = multiprocessing.get_context("spawn")
+    cola = ctx.Queue()
+    proceso = ctx.Process(target=_correr_caso, args=(generador, filas, cola))
+    proceso.start()
+    segundos, pico_mb, tamano = cola.get()
+    proceso.join()
+    return {
+        "generador": generador,
+        "filas": filas,
+        "segundos": segundos,
+        "filas_por_seg": filas / segundos if segundos else 0.0,
+        "memoria_pico_mb": pico_mb,
+        "tamano_mb": tamano / (1024 * 1024),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark del generador de Excel de ventas")
+    parser.add_argument("--filas", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--sin-original", action="store_true",
+                        help="Omite el generador original (en memoria); con 1M de filas tarda mucho y usa varios GB")
+    args = parser.parse_args()
+
+    generadores = ["stream"] if args.sin_original else ["original", "stream"]
+    print(f"{'generador':<10} {'filas':>10} {'segundos':>10} {'filas/seg':>12} {'mem. pico MB':>13} {'archivo MB':>11}")
+    for filas in args.filas:
+        for generador in generadores:
+            r = medir(generador, filas)
+            print(f"{r['generador']:<10} {r['filas']:>10,} {r['segundos']:>10.2f} "
+                  f"{r['filas_por_seg']:>12,.0f} {r['memoria_pico_mb']:>13.1f} {r['tamano_mb']:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Micro-benchmark del armado y serialización de una página de /rows.
+
+Compara, por página, el CPU de:
+- original: diccionario literal por renglón con sus float()/str(), validación
+  contra VentasProductoPage y serialización con el json estándar (lo que hace
+  FastAPI con response_model y JSONResponse).
+- rapida: conversiones declaradas por columna (_items_detalle) y RespuestaJSONRapida
+  (orjson, sin validar renglón por renglón).
+
+Los renglones son los mismos tipos que regresa pyodbc (date, time, Decimal),
+generados con benchmarks.dataset_sintetico. Antes de medir verifica que los dos
+caminos produzcan exactamente los mismos bytes. Como referencia también mide la
+misma página con format=columns (tiempo y tamaño).
+
+Uso (desde reporter_backend):
+    python -m benchmarks.bench_serializacion
+    python -m benchmarks.bench_serializacion --filas 50 500 --repeticiones 500
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+from datetime import date
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# La configuración exige el DSN aunque aquí no se abre ninguna conexión
+os.environ.setdefault("SQLSERVER_REPORTING_DSN", "DRIVER={ODBC Driver 18 for SQL Server};SERVER=benchmark")
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from app.core.json_rapido import RespuestaJSONRapida
+from app.reports.ventas_producto_service import _armar_pagina, _items_detalle
+from app.schemas.reports import VentasProductoPage
+from benchmarks.dataset_sintetico import Catalogo, generar_ventas
+
+_modelo_pagina = TypeAdapter(VentasProductoPage)
+
+
+def _renglones(filas: int) -> List[tuple]:
+    rnd = random.Random(filas)
+    catalogo = Catalogo(2000, 8, rnd)
+    renglones: List[tuple] = []
+    for partidas, _ in generar_ventas(filas, catalogo, date(2025, 1, 1), date(2025, 10, 31), rnd):
+        renglones.extend(partidas)
+    return renglones
+
+
+def _items_original(rows: List[Any]) -> List[Dict[str, Any]]:
+    # Armado anterior de _consultar_pagina, renglón por renglón
+    items: List[Dict[str, Any]] = []
+    for r in rows:
+        items.append({
+            "fecha": str(r[0]) if r[0] else "",
+            "Mes": str(r[1]) if r[1] is not None else "",
+            "hora": str(r[2]) if r[2] else "",
+            "id_pro": int(r[3]),
+            "CCODIGOPRODUCTO": r[4],
+            "CNOMBREPRODUCTO": r[5],
+            "cantidad": float(r[6]),
+            "CNOMBREUNIDAD": r[7],
+            "precio": float(r[8]),
+            "Importe": float(r[9]),
+            "descuento": float(r[10]),
+            "impuesto": float(r[11]),
+            "Total": float(r[12]),
+            "CNOMBREALMACEN": r[13],
+            "Folio": "",
+        })
+    return items
+
+
+def _pagina(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"total_items": 123456, "page": 3, "page_size": len(items), "items": items,
+            "next_cursor": "eyJrIjpbXX0", "total_exacto": True}
+
+
+def original(rows: List[Any]) -> bytes:
+    # response_model: validar, volver a tipos JSON (mode="json") y json.dumps en JSONResponse
+    validada = _modelo_pagina.validate_python(_pagina(_items_original(rows)), from_attributes=True)
+    return JSONResponse(_modelo_pagina.dump_python(validada, mode="json")).body
+
+
+def rapida(rows: List[Any]) -> bytes:
+    return RespuestaJSONRapida(_pagina(_items_detalle(rows))).body
+
+
+def columnas(rows: List[Any]) -> bytes:
+    return RespuestaJSONRapida(_armar_pagina(rows, "columns", 123456, 3, len(rows), "eyJrIjpbXX0", True)).body
+
+
+def _medir(fn: Callable[[List[Any]], bytes], rows: List[Any], repeticiones: int) -> float:
+    """Microsegundos por página (mejor de 5 series)."""
+    return min(timeit.repeat(lambda: fn(rows), number=repeticiones, repeat=5)) / repeticiones * 1_000_000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Micro-benchmark de la serialización de /rows")
+    parser.add_argument("--filas", type=int, nargs="+", default=[50, 200, 500])
+    parser.add_argument("--repeticiones", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'renglones':>9} {'original µs':>12} {'rápida µs':>10} {'ahorro µs':>10} {'veces':>6} {'KB':>7} "
+          f"{'columnas µs':>12} {'KB columnas':>12}")
+    for filas in args.filas:
+        rows = _renglones(filas)
+        esperado, obtenido = original(rows), rapida(rows)
+        if esperado != obtenido:
+            # Mismo contenido pero distinto texto también rompería la promesa de formato
+            igual = json.loads(esperado) == json.loads(obtenido)
+            raise SystemExit(f"Las salidas difieren con {filas} renglones (mismo contenido: {igual})")
+        antes = _medir(original, rows, args.repeticiones)
+        ahora = _medir(rapida, rows, args.repeticiones)
+        en_columnas = _medir(columnas, rows, args.repeticiones)
+        print(f"{filas:>9} {antes:>12,.0f} {ahora:>10,.0f} {antes - ahora:>10,.0f} {antes / ahora:>6.1f} "
+              f"{len(obtenido) / 1024:>7.1f} {en_columnas:>12,.0f} {len(columnas(rows)) / 1024:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Benchmark de las funciones del servicio de ventas contra un conjunto sintético.
+
+Para cada tamaño (por defecto 100k, 1M y 10M partidas) carga el conjunto con
+benchmarks.dataset_sintetico en la base de pruebas, si no es ya el cargado, y
+cronometra las funciones que usan las rutas: listar_ventas_producto (página 1,
+página profunda y por cursor), calcular_kpis, obtener_ventas_por_hora,
+top_productos y exportar_ventas_excel. La caché de reportes se vacía antes de
+cada repetición, así que se mide siempre la consulta real.
+
+Cada tamaño corre en un proceso aparte con SQLSERVER_REPORTING_DSN apuntando a la
+base de pruebas. Los resultados se guardan en JSON (con el commit actual) y con
+--comparar se contrastan contra una corrida anterior: las medianas que empeoran
+más que --umbral se marcan como regresión y el proceso termina con código 1.
+
+Cargar 10M partidas con fast_executemany tarda varios minutos; con --sin-cargar
+se mide solo el conjunto que ya esté en la base.
+
+Uso (desde reporter_backend):
+    python -m benchmarks.bench_servicio --dsn "DRIVER={ODBC Driver 18 for SQL Server};SERVER=localhost,14333;DATABASE=bench;UID=sa;PWD=Bench.2025;TrustServerCertificate=yes"
+    python -m benchmarks.bench_servicio --filas 100000 1000000 --repeticiones 3
+    python -m benchmarks.bench_servicio --sin-cargar --comparar benchmarks/resultados/servicio-20251101-120000.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import dataset_sintetico
+
+DIRECTORIO_RESULTADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resultados")
+PAGINA_PROFUNDA = 200
+TAMANO_PAGINA = 50
+
+
+# ----------------- Casos -----------------
+
+def _casos(hasta: date, producto: str) -> List[Tuple[str, str, Dict[str, Any]]]:
+    """(caso, función, filtros). Los periodos son relativos al último mes del conjunto."""
+    mes = dict(mes=hasta.month, anio=hasta.year)
+    anio = dict(anio=hasta.year)
+    return [
+        ("listar pagina 1 (mes)", "listar_ventas_producto", dict(page=1, **mes)),
+        (f"listar pagina {PAGINA_PROFUNDA} (año)", "listar_ventas_producto", dict(page=PAGINA_PROFUNDA, **anio)),
+        ("listar pagina 2 por cursor (año)", "listar_ventas_producto", dict(page=2, cursor=True, **anio)),
+        ("listar con producto (año)", "listar_ventas_producto", dict(page=1, producto=producto, **anio)),
+        ("kpis (mes)", "calcular_kpis", mes),
+        ("kpis (año)", "calcular_kpis", anio),
+        ("kpis con producto (año)", "calcular_kpis", dict(producto=producto, **anio)),
+        ("ventas por hora (mes)", "obtener_ventas_por_hora", mes),
+        ("ventas por hora (todo)", "obtener_ventas_por_hora", {}),
+        ("top productos (año)", "top_productos", anio),
+        ("exportar excel (mes)", "exportar_ventas_excel", mes),
+    ]
+
+
+def _llamada(funcion: str, filtros: Dict[str, Any]) -> Callable[[], int]:
+    """Arma la llamada al servicio; regresa una función que ejecuta y devuelve el tamaño del resultado (filas; bytes en la exportación)."""
+    from app.reports import ventas_producto_service as servicio
+    from app.schemas.reports import VentasProductoFiltros
+
+    filtros = dict(filtros)
+    if funcion == "listar_ventas_producto":
+        page = filtros.pop("page")
+        cursor = None
+        if filtros.pop("cursor", False):
+            # El cursor de la página 1 se obtiene una vez, fuera de la medición
+            cursor = servicio.listar_ventas_producto(1, TAMANO_PAGINA, ejecutar=True, **filtros)["next_cursor"]
+
+        def listar() -> int:
+            r = servicio.listar_ventas_producto(page, TAMANO_PAGINA, ejecutar=True, cursor=cursor, **filtros)
+            return len(r["items"])
+        return listar
+
+    if funcion == "exportar_ventas_excel":
+        def exportar() -> int:
+            archivo = servicio.exportar_ventas_excel(**filtros)
+            try:
+                archivo.seek(0, os.SEEK_END)
+                return archivo.tell()
+            finally:
+                archivo.close()
+        return exportar
+
+    fn = getattr(servicio, funcion)
+    modelo = VentasProductoFiltros(**filtros)
+
+    def widget() -> int:
+        r = fn(modelo)
+        # calcular_kpis regresa ceros en lugar de fallar: se cuenta como vacío
+        return len(r) if isinstance(r, list) else int(bool(r.get("total_vendido")))
+    return widget
+
+
+def _correr_tamano(dsn: str, repeticiones: int, cola) -> None:
+    os.environ["SQLSERVER_REPORTING_DSN"] = dsn
+    try:
+        from app.core.database import get_connection
+        from app.reports.cache_reportes import cache_reportes
+
+        conn = get_connection()
+        try:
+            marca = dataset_sintetico.leer_marca(conn.cursor())
+            cur = conn.cursor()
+            # Un producto de venta media: ni el más vendido ni uno sin ventas
+            cur.execute(
+                "SELECT CCODIGOPRODUCTO FROM (SELECT id_pro, COUNT(*) n FROM zzVentasPorProducto "
+                "GROUP BY id_pro ORDER BY n DESC OFFSET 20 ROWS FETCH NEXT 1 ROWS ONLY) t "
+                "JOIN admProductos p ON p.CIDPRODUCTO = t.id_pro"
+            )
+            producto = cur.fetchone()[0]
+        finally:
+            conn.close()
+        if marca is None:
+            raise RuntimeError("La base no tiene un conjunto de benchmarks.dataset_sintetico")
+
+        resultados = []
+        for caso, funcion, filtros in _casos(marca["hasta"], producto):
+            llamada = _llamada(funcion, filtros)
+            llamada()  # Calentamiento: catálogos en memoria y páginas de datos en el buffer de SQL Server
+            tiempos = []
+            for _ in range(repeticiones):
+                cache_reportes.invalidar()
+                inicio = time.perf_counter()
+                tamano = llamada()
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+            tiempos.sort()
+            resultados.append({
+                "caso": caso,
+                "funcion": funcion,
+                "filtros": {k: v for k, v in filtros.items() if k != "producto"},
+                "tamano_resultado": tamano,
+                "min_ms": round(tiempos[0], 2),
+                "mediana_ms": round(statistics.median(tiempos), 2),
+                "p95_ms": round(tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))], 2),
+                "max_ms": round(tiempos[-1], 2),
+                "tiempos_ms": [round(t, 2) for t in tiempos],
+            })
+        cola.put(({k: str(v) if isinstance(v, (date, datetime)) else v for k, v in marca.items()}, resultados))
+    except BaseException as e:
+        # Los errores del driver no siempre se pueden serializar entre procesos
+        cola.put(f"{type(e).__name__}: {e}")
+        raise
+
+
+def medir(dsn: str, repeticiones: int) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    ctx = multiprocessing.get_context("spawn")
+    cola = ctx.Queue()
+    proceso = ctx.Process(target=_correr_tamano, args=(dsn, repeticiones, cola))
+    proceso.start()
+    resultado = cola.get()
+    proceso.join()
+    if isinstance(resultado, str):
+        raise RuntimeError(resultado)
+    return resultado
+
+
+# ----------------- Resultados -----------------
+
+def _version() -> Dict[str, Optional[str]]:
+    def git(*args: str) -> Optional[str]:
+        try:
+            salida = subprocess.run(["git", *args], capture_output=True, text=True, timeout=10,
+                                    cwd=os.path.dirname(os.path.abspath(__file__)))
+        except (OSError, subprocess.SubprocessError):
+            return None
+        return (salida.stdout.strip() or None) if salida.returncode == 0 else None
+
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "descripcion": git("describe", "--always", "--dirty"),
+        "rama": git("rev-parse", "--abbrev-ref", "HEAD"),
+    }
+
+
+def comparar(actual: Dict[str, Any], anterior: Dict[str, Any], umbral: float) -> int:
+    """Imprime la variación de la mediana por caso. Regresa cuántas regresiones encontró."""
+    previos = {(r["filas"], r["caso"]): r for r in anterior.get("resultados", [])}
+    version = (anterior.get("version") or {}).get("descripcion") or anterior.get("fecha")
+    print(f"\nComparación contra {version} (umbral {umbral:.0%})")
+    print(f"{'filas':>11} {'caso':<36} {'antes ms':>10} {'ahora ms':>10} {'cambio':>8}")
+    regresiones = 0
+    for r in actual["resultados"]:
+        previo = previos.get((r["filas"], r["caso"]))
+        if previo is None or not previo["mediana_ms"]:
+            continue
+        cambio = r["mediana_ms"] / previo["mediana_ms"] - 1
+        marca = ""
+        if cambio > umbral:
+            marca = "  REGRESIÓN"
+            regresiones += 1
+        print(f"{r['filas']:>11,} {r['caso']:<36} {previo['mediana_ms']:>10.1f} {r['mediana_ms']:>10.1f} "
+              f"{cambio:>+8.0%}{marca}")
+    return regresiones
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark de las funciones del servicio de ventas")
+    parser.add_argument("--dsn", default=os.environ.get("BENCH_DSN"),
+                        help="Cadena ODBC de la base de pruebas (o variable BENCH_DSN)")
+    parser.add_argument("--filas", type=int, nargs="+", default=[100_000, 1_000_000, 10_000_000])
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--sucursales", type=int, default=8)
+    parser.add_argument("--productos", type=int, default=5000)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--sin-cargar", action="store_true", help="Mide el conjunto que ya está en la base")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto benchmarks/resultados/)")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior")
+    parser.add_argument("--umbral", type=float, default=0.2, help="Empeoramiento de la mediana que cuenta como regresión")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("falta --dsn (o la variable BENCH_DSN)")
+
+    import pyodbc
+
+    tamanos: List[Optional[int]] = [None] if args.sin_cargar else args.filas
+    todos: List[Dict[str, Any]] = []
+    conjuntos: List[Dict[str, Any]] = []
+    for filas in tamanos:
+        if filas is not None:
+            conn = pyodbc.connect(args.dsn, autocommit=True)
+            try:
+                marca = dataset_sintetico.leer_marca(conn.cursor())
+            finally:
+                conn.close()
+            esperado = dict(filas=filas, sucursales=args.sucursales, productos=args.productos, semilla=args.semilla)
+            if marca is None or any(marca.get(k) != v for k, v in esperado.items()):
+                print(f"Cargando {filas:,} partidas...")
+                dataset_sintetico.cargar(args.dsn, filas, args.sucursales, args.productos, args.semilla)
+
+        marca, resultados = medir(args.dsn, args.repeticiones)
+        conjuntos.append(marca)
+        print(f"\n{marca['filas']:,} partidas, {marca['tickets']:,} tickets, {marca['desde']} a {marca['hasta']}")
+        print(f"{'caso':<36} {'resultado':>12} {'min ms':>10} {'mediana ms':>11} {'p95 ms':>10}")
+        for r in resultados:
+            r["filas"] = marca["filas"]
+            print(f"{r['caso']:<36} {r['tamano_resultado']:>12,} {r['min_ms']:>10.1f} {r['mediana_ms']:>11.1f} {r['p95_ms']:>10.1f}")
+        todos.extend(resultados)
+
+    actual = {
+        "version": _version(),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "repeticiones": args.repeticiones,
+        "conjuntos": conjuntos,
+        "resultados": todos,
+    }
+    salida = args.salida
+    if not salida:
+        os.makedirs(DIRECTORIO_RESULTADOS, exist_ok=True)
+        salida = os.path.join(DIRECTORIO_RESULTADOS, f"servicio-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(actual, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados en {salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anterior = json.load(f)
+        if comparar(actual, anterior, args.umbral):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
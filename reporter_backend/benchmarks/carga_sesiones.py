@@ -0,0 +1,520 @@
+"""
+Prueba de carga con sesiones de usuario simuladas contra la API en ejecución.
+
+Cada usuario virtual repite una sesión como la del frontend: login, catálogos
+(sucursales y productos), dashboard (/dashboard/bundle), detalle paginado (/rows
+junto con /dashboard/kpis, de 1 a --paginas páginas) y, de vez en cuando, la
+exportación a Excel. Entre pasos espera un tiempo de "lectura" aleatorio. Los
+filtros (mes y sucursal) cambian de sesión a sesión para que no todo salga de la
+caché.
+
+La carga sube por etapas (--usuarios 5 10 20 ...). Por etapa se reporta el
+rendimiento (peticiones/s y sesiones/min), p50/p95/p99 por endpoint, rechazos
+por saturación (503), tiempos agotados de SQL Server (504) y otros errores. Si
+la API expone /metrics (con --metricas-token, o con la sesión del usuario de la
+prueba si es administrador), se muestrea cada segundo para sumar también los
+tiempos agotados esperando el pool (bd_pool_agotado_total), el pico de
+conexiones en uso y de la cola de admisión. El punto de saturación es la última
+etapa antes de que el rendimiento deje de crecer o el p95 / los errores pasen
+sus umbrales.
+
+Para afinar REPORTING_POOL_SIZE, REPORTING_POOL_MAX_OVERFLOW, REPORTING_HILOS,
+ADMISION_* o los workers de uvicorn: levantar la API contra la base de
+benchmarks.dataset_sintetico con cada configuración, correr esta prueba con
+--etiqueta y comparar los JSON. Con varios workers /metrics es de un solo
+proceso; los números del lado del cliente siguen siendo completos.
+
+Solo usa la biblioteca estándar (un hilo por usuario virtual).
+
+Uso (desde reporter_backend, con la API levantada):
+    python -m benchmarks.carga_sesiones --usuario admin --password secreto
+    python -m benchmarks.carga_sesiones --url http://127.0.0.1:9000 --usuarios 10 20 40 80 --duracion 120 --etiqueta "pool 10+20"
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_servicio import DIRECTORIO_RESULTADOS, _version
+
+PREFIJO = "/api/v1"
+WIDGETS_BUNDLE = ("kpis", "horas_pico", "top_productos", "ventas_por_sucursal")
+TAMANO_PAGINA = 50
+INTERVALO_METRICAS = 1.0
+
+
+# ----------------- Cliente HTTP -----------------
+
+class RespuestaHttp:
+    __slots__ = ("estado", "cuerpo", "bytes")
+
+    def __init__(self, estado: int, cuerpo: Optional[bytes], tamano: int):
+        self.estado = estado
+        self.cuerpo = cuerpo
+        self.bytes = tamano
+
+    def json(self) -> Any:
+        return json.loads(self.cuerpo) if self.cuerpo else None
+
+
+class Cliente:
+    """Una conexión keep-alive por hilo; si el servidor la cerró, se reabre una vez."""
+
+    def __init__(self, url: str, timeout: float):
+        partes = urlsplit(url)
+        self._https = partes.scheme == "https"
+        self._host = partes.netloc
+        self._timeout = timeout
+        self._local = threading.local()
+
+    def _conexion(self, nueva: bool = False) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or nueva:
+            if conn is not None:
+                conn.close()
+            clase = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+            conn = self._local.conn = clase(self._host, timeout=self._timeout)
+        return conn
+
+    def pedir(
+        self,
+        metodo: str,
+        ruta: str,
+        params: Optional[Dict[str, Any]] = None,
+        cuerpo: Optional[Dict[str, Any]] = None,
+        token: Optional[str] = None,
+        descartar: bool = False,
+    ) -> RespuestaHttp:
+        if params:
+            ruta = f"{ruta}?{urlencode(params)}"
+        cabeceras = {"Accept": "application/json"}
+        datos = None
+        if cuerpo is not None:
+            datos = json.dumps(cuerpo).encode("utf-8")
+            cabeceras["Content-Type"] = "application/json"
+        if token:
+            cabeceras["Authorization"] = f"Bearer {token}"
+
+        for intento in range(2):
+            conn = self._conexion(nueva=intento > 0)
+            try:
+                conn.request(metodo, ruta, body=datos, headers=cabeceras)
+                resp = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                if intento:
+                    raise
+                continue
+            if descartar:
+                # Exportaciones: se lee todo (el servidor trabaja mientras se descarga) sin guardarlo
+                tamano = 0
+                while True:
+                    bloque = resp.read(1024 * 1024)
+                    if not bloque:
+                        break
+                    tamano += len(bloque)
+                return RespuestaHttp(resp.status, None, tamano)
+            contenido = resp.read()
+            return RespuestaHttp(resp.status, contenido, len(contenido))
+        raise RuntimeError("sin respuesta")
+
+
+# ----------------- Registro de muestras -----------------
+
+def _clasificar(estado: Optional[int]) -> str:
+    if estado is None:
+        return "sin_respuesta"
+    if estado < 400:
+        return "ok"
+    if estado == 503:
+        return "rechazada_503"
+    if estado == 504:
+        return "timeout_sql_504"
+    return f"error_{estado}"
+
+
+def percentil(ordenados: List[float], p: float) -> float:
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not ordenados:
+        return 0.0
+    indice = max(0, min(len(ordenados) - 1, math.ceil(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+
+class Muestras:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.latencias: Dict[str, List[float]] = defaultdict(list)
+        self.resultados: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.widgets_con_error = 0
+        self.sesiones = 0
+        self.bytes = 0
+
+    def registrar(self, endpoint: str, ms: float, estado: Optional[int], tamano: int = 0) -> None:
+        with self._lock:
+            self.latencias[endpoint].append(ms)
+            self.resultados[endpoint][_clasificar(estado)] += 1
+            self.bytes += tamano
+
+    def sumar(self, campo: str, n: int = 1) -> None:
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + n)
+
+    def resumen(self, segundos: float) -> Dict[str, Any]:
+        with self._lock:
+            endpoints = {}
+            total = errores = rechazadas = timeouts = 0
+            todas: List[float] = []
+            for endpoint, latencias in sorted(self.latencias.items()):
+                ordenadas = sorted(latencias)
+                todas.extend(ordenadas)
+                resultados = dict(self.resultados[endpoint])
+                n = len(ordenadas)
+                total += n
+                rechazadas += resultados.get("rechazada_503", 0)
+                timeouts += resultados.get("timeout_sql_504", 0)
+                errores += n - resultados.get("ok", 0)
+                endpoints[endpoint] = {
+                    "peticiones": n,
+                    "por_seg": round(n / segundos, 2),
+                    "p50_ms": round(percentil(ordenadas, 50), 1),
+                    "p95_ms": round(percentil(ordenadas, 95), 1),
+                    "p99_ms": round(percentil(ordenadas, 99), 1),
+                    "max_ms": round(ordenadas[-1], 1),
+                    "resultados": resultados,
+                }
+            todas.sort()
+            return {
+                "segundos": round(segundos, 1),
+                "sesiones": self.sesiones,
+                "sesiones_por_min": round(self.sesiones / segundos * 60, 2),
+                "peticiones": total,
+                "peticiones_por_seg": round(total / segundos, 2),
+                "p50_ms": round(percentil(todas, 50), 1),
+                "p95_ms": round(percentil(todas, 95), 1),
+                "p99_ms": round(percentil(todas, 99), 1),
+                "errores": errores,
+                "tasa_errores": round(errores / total, 4) if total else 0.0,
+                "rechazadas_503": rechazadas,
+                "timeouts_sql_504": timeouts,
+                "widgets_con_error": self.widgets_con_error,
+                "mb_recibidos": round(self.bytes / (1024 * 1024), 2),
+                "endpoints": endpoints,
+            }
+
+
+# ----------------- Métricas del servidor -----------------
+
+def _leer_metricas(cliente: Cliente, token: Optional[str]) -> Optional[Dict[str, float]]:
+    try:
+        resp = cliente.pedir("GET", "/metrics", token=token)
+    except (OSError, http.client.HTTPException, RuntimeError):
+        return None
+    if resp.estado != 200 or not resp.cuerpo:
+        return None
+    valores: Dict[str, float] = {}
+    for linea in resp.cuerpo.decode("utf-8").splitlines():
+        if not linea or linea.startswith("#"):
+            continue
+        serie, _, valor = linea.rpartition(" ")
+        try:
+            valores[serie] = float(valor)
+        except ValueError:
+            continue
+    return valores
+
+
+def _suma(metricas: Dict[str, float], nombre: str, filtro: str = "") -> float:
+    return sum(v for k, v in metricas.items() if k.split("{")[0] == nombre and filtro in k)
+
+
+def _token_metricas(cliente: Cliente, args: argparse.Namespace) -> Optional[str]:
+    """Token para /metrics: --metricas-token o, si no se dio, la sesión del usuario de la prueba."""
+    if args.metricas_token:
+        return args.metricas_token
+    try:
+        resp = cliente.pedir("POST", PREFIJO + "/auth/login", cuerpo={"usuario": args.usuario, "password": args.password})
+    except (OSError, http.client.HTTPException, RuntimeError):
+        return None
+    return resp.json()["access_token"] if resp.estado == 200 else None
+
+
+class MuestreoServidor(threading.Thread):
+    """Lee /metrics cada segundo durante la etapa: picos de pool y cola, y diferencias de contadores."""
+
+    def __init__(self, cliente: Cliente, token: Optional[str]):
+        super().__init__(daemon=True)
+        self._cliente = cliente
+        self._token = token
+        self._alto = threading.Event()
+        self.inicial = _leer_metricas(cliente, token)
+        self.final: Optional[Dict[str, float]] = None
+        self.max_pool_en_uso = 0.0
+        self.max_en_cola = 0.0
+
+    def run(self) -> None:
+        while not self._alto.wait(INTERVALO_METRICAS):
+            self._muestrear()
+
+    def _muestrear(self) -> None:
+        actuales = _leer_metricas(self._cliente, self._token)
+        if actuales is None:
+            return
+        self.final = actuales
+        self.max_pool_en_uso = max(self.max_pool_en_uso, _suma(actuales, "bd_pool_conexiones_en_uso", 'motor="reporting"'))
+        self.max_en_cola = max(self.max_en_cola, _suma(actuales, "admision_en_cola"))
+
+    def detener(self) -> Optional[Dict[str, Any]]:
+        self._alto.set()
+        self.join()
+        self._muestrear()
+        if self.inicial is None or self.final is None:
+            return None
+
+        def delta(nombre: str, filtro: str = "") -> float:
+            return _suma(self.final, nombre, filtro) - _suma(self.inicial, nombre, filtro)
+
+        esperas = delta("bd_conexion_espera_segundos_count", 'motor="reporting"')
+        return {
+            "pool_agotado": int(delta("bd_pool_agotado_total")),
+            "max_conexiones_en_uso": int(self.max_pool_en_uso),
+            "tamano_pool": int(_suma(self.final, "bd_pool_tamano", 'motor="reporting"')),
+            "max_en_cola_admision": int(self.max_en_cola),
+            "rechazadas_admision": int(delta("admision_rechazadas_total")),
+            "errores_sql": int(delta("reportes_sql_errores_total")),
+            "espera_conexion_promedio_ms": round(
+                delta("bd_conexion_espera_segundos_sum", 'motor="reporting"') / esperas * 1000, 2
+            ) if esperas else 0.0,
+        }
+
+
+# ----------------- Sesión de usuario -----------------
+
+class UsuarioVirtual:
+    def __init__(self, cliente: Cliente, args: argparse.Namespace, muestras: Muestras,
+                 fin: float, rnd: random.Random):
+        self.cliente = cliente
+        self.args = args
+        self.muestras = muestras
+        self.fin = fin
+        self.rnd = rnd
+        self.token: Optional[str] = None
+        # Peticiones que el frontend lanza a la vez (Promise.all)
+        self.paralelo = ThreadPoolExecutor(max_workers=2)
+
+    def _pedir(self, endpoint: str, ruta: str, **kwargs: Any) -> Optional[RespuestaHttp]:
+        inicio = time.perf_counter()
+        try:
+            resp = self.cliente.pedir(kwargs.pop("metodo", "GET"), PREFIJO + ruta, token=self.token, **kwargs)
+        except (OSError, http.client.HTTPException, RuntimeError):
+            self.muestras.registrar(endpoint, (time.perf_counter() - inicio) * 1000, None)
+            return None
+        self.muestras.registrar(endpoint, (time.perf_counter() - inicio) * 1000, resp.estado, resp.bytes)
+        return resp
+
+    def _a_la_vez(self, *peticiones: Tuple[str, str, Dict[str, Any]]) -> List[Optional[RespuestaHttp]]:
+        futuros = [self.paralelo.submit(self._pedir, e, r, **k) for e, r, k in peticiones]
+        return [f.result() for f in futuros]
+
+    def _pausa(self) -> bool:
+        """Tiempo de lectura entre pasos. False si la etapa ya terminó."""
+        espera = self.rnd.expovariate(1 / self.args.pausa) if self.args.pausa > 0 else 0
+        restante = self.fin - time.monotonic()
+        time.sleep(max(0.0, min(espera, restante)))
+        return time.monotonic() < self.fin
+
+    def _filtros(self, sucursales: List[str]) -> Dict[str, Any]:
+        # Uno de los últimos --meses meses; a veces una sola sucursal
+        base = self.args.hasta.year * 12 + self.args.hasta.month - 1 - self.rnd.randrange(self.args.meses)
+        filtros: Dict[str, Any] = {"anio": base // 12, "mes": base % 12 + 1}
+        if sucursales and self.rnd.random() < 0.5:
+            filtros["sucursal"] = self.rnd.choice(sucursales)
+        return filtros
+
+    def sesion(self) -> None:
+        self.token = None
+        resp = self._pedir("POST /auth/login", "/auth/login", metodo="POST",
+                           cuerpo={"usuario": self.args.usuario, "password": self.args.password})
+        if resp is None or resp.estado != 200:
+            self._pausa()
+            return
+        self.token = resp.json()["access_token"]
+
+        sucs, _ = self._a_la_vez(
+            ("GET /ventas-producto/sucursales", "/ventas-producto/sucursales", {}),
+            ("GET /ventas-producto/productos", "/ventas-producto/productos", {}),
+        )
+        sucursales = sucs.json() if sucs is not None and sucs.estado == 200 else []
+        filtros = self._filtros(sucursales)
+
+        bundle = self._pedir("GET /dashboard/bundle", "/dashboard/bundle", params=filtros)
+        if bundle is not None and bundle.estado == 200:
+            datos = bundle.json()
+            self.muestras.sumar("widgets_con_error", sum(1 for w in WIDGETS_BUNDLE if (datos.get(w) or {}).get("error")))
+        if not self._pausa():
+            return
+
+        for page in range(1, self.rnd.randint(1, self.args.paginas) + 1):
+            self._a_la_vez(
+                ("GET /ventas-producto/rows", "/ventas-producto/rows",
+                 {"params": dict(filtros, page=page, page_size=TAMANO_PAGINA, ejecutar="true")}),
+                ("GET /dashboard/kpis", "/dashboard/kpis", {"params": filtros}),
+            )
+            if not self._pausa():
+                return
+
+        if self.rnd.random() < self.args.prob_export:
+            self._pedir("GET /ventas-producto/export/excel", "/ventas-producto/export/excel",
+                        params=filtros, descartar=True)
+        self.muestras.sumar("sesiones")
+        self._pausa()
+
+    def correr(self) -> None:
+        try:
+            while time.monotonic() < self.fin:
+                self.sesion()
+        finally:
+            self.paralelo.shutdown(wait=True)
+
+
+# ----------------- Etapas -----------------
+
+def correr_etapa(args: argparse.Namespace, usuarios: int, semilla: int) -> Dict[str, Any]:
+    cliente = Cliente(args.url, args.timeout)
+    muestras = Muestras()
+    cliente_metricas = Cliente(args.url, 10)
+    muestreo = MuestreoServidor(cliente_metricas, _token_metricas(cliente_metricas, args))
+    inicio = time.monotonic()
+    fin = inicio + args.duracion
+    muestreo.start()
+
+    hilos = []
+    for i in range(usuarios):
+        usuario = UsuarioVirtual(cliente, args, muestras, fin, random.Random(semilla * 10_000 + i))
+        hilo = threading.Thread(target=usuario.correr, name=f"usuario-{i}", daemon=True)
+        hilos.append(hilo)
+        hilo.start()
+        # Arranque escalonado dentro del primer 10% de la etapa
+        time.sleep(args.duracion * 0.1 / usuarios)
+    for hilo in hilos:
+        hilo.join()
+
+    resumen = muestras.resumen(time.monotonic() - inicio)
+    resumen["usuarios"] = usuarios
+    resumen["servidor"] = muestreo.detener()
+    return resumen
+
+
+def punto_saturacion(etapas: List[Dict[str, Any]], p95_max: float, errores_max: float) -> Dict[str, Any]:
+    """
+    Última etapa sana: el rendimiento todavía crece al menos 10% respecto a la
+    anterior, el p95 no pasa p95_max y los errores no pasan errores_max.
+    """
+    sana = None
+    motivo = "no se alcanzó con las etapas probadas"
+    for anterior, etapa in zip([None] + etapas[:-1], etapas):
+        servidor = etapa.get("servidor") or {}
+        if etapa["tasa_errores"] > errores_max:
+            motivo = f"errores {etapa['tasa_errores']:.1%} > {errores_max:.1%}"
+        elif servidor.get("pool_agotado"):
+            motivo = f"{servidor['pool_agotado']} esperas de pool agotadas"
+        elif etapa["p95_ms"] > p95_max:
+            motivo = f"p95 {etapa['p95_ms']:,.0f} ms > {p95_max:,.0f} ms"
+        elif anterior is not None and etapa["peticiones_por_seg"] < anterior["peticiones_por_seg"] * 1.1:
+            motivo = (f"el rendimiento dejó de crecer ({anterior['peticiones_por_seg']} -> "
+                      f"{etapa['peticiones_por_seg']} pet/s)")
+        else:
+            sana = etapa
+            continue
+        return {"usuarios": sana["usuarios"] if sana else None, "en": etapa["usuarios"], "motivo": motivo}
+    return {"usuarios": sana["usuarios"] if sana else None, "en": None, "motivo": motivo}
+
+
+def _imprimir_etapa(etapa: Dict[str, Any]) -> None:
+    print(f"\n== {etapa['usuarios']} usuarios: {etapa['peticiones_por_seg']} pet/s, "
+          f"{etapa['sesiones_por_min']} sesiones/min, p95 {etapa['p95_ms']:,.0f} ms, "
+          f"errores {etapa['tasa_errores']:.1%} (503: {etapa['rechazadas_503']}, 504: {etapa['timeouts_sql_504']}, "
+          f"widgets: {etapa['widgets_con_error']})")
+    servidor = etapa.get("servidor")
+    if servidor:
+        print(f"   servidor: pool en uso máx {servidor['max_conexiones_en_uso']} (pool_size {servidor['tamano_pool']}), "
+              f"pool agotado {servidor['pool_agotado']}, espera conexión prom. {servidor['espera_conexion_promedio_ms']} ms, "
+              f"cola admisión máx {servidor['max_en_cola_admision']}")
+    print(f"   {'endpoint':<36} {'n':>6} {'pet/s':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'no ok':>6}")
+    for nombre, e in etapa["endpoints"].items():
+        no_ok = e["peticiones"] - e["resultados"].get("ok", 0)
+        print(f"   {nombre:<36} {e['peticiones']:>6} {e['por_seg']:>7.2f} {e['p50_ms']:>9,.0f} "
+              f"{e['p95_ms']:>9,.0f} {e['p99_ms']:>9,.0f} {no_ok:>6}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Prueba de carga con sesiones de dashboard simuladas")
+    parser.add_argument("--url", default="http://127.0.0.1:9000")
+    parser.add_argument("--usuario", default=os.environ.get("BENCH_USUARIO"), help="O variable BENCH_USUARIO")
+    parser.add_argument("--password", default=os.environ.get("BENCH_PASSWORD"), help="O variable BENCH_PASSWORD")
+    parser.add_argument("--usuarios", type=int, nargs="+", default=[5, 10, 20, 40, 80],
+                        help="Usuarios simultáneos de cada etapa")
+    parser.add_argument("--duracion", type=float, default=60, help="Segundos por etapa")
+    parser.add_argument("--pausa", type=float, default=2.0, help="Promedio de segundos de lectura entre pasos")
+    parser.add_argument("--paginas", type=int, default=5, help="Máximo de páginas del detalle por sesión")
+    parser.add_argument("--prob-export", type=float, default=0.05, help="Probabilidad de exportar a Excel por sesión")
+    parser.add_argument("--meses", type=int, default=12, help="Los filtros eligen entre los últimos N meses")
+    parser.add_argument("--hasta", type=date.fromisoformat, default=date.today(), help="Último mes con datos (YYYY-MM-DD)")
+    parser.add_argument("--timeout", type=float, default=300, help="Segundos máximos por petición")
+    parser.add_argument("--metricas-token", default=os.environ.get("METRICAS_TOKEN"))
+    parser.add_argument("--p95-max", type=float, default=3000, help="p95 (ms) a partir del cual la etapa se considera saturada")
+    parser.add_argument("--errores-max", type=float, default=0.01, help="Tasa de errores a partir de la cual se considera saturada")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--etiqueta", default="", help="Descripción de la configuración probada (pool, hilos, workers)")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto benchmarks/resultados/)")
+    args = parser.parse_args()
+    if not args.usuario or not args.password:
+        parser.error("faltan --usuario y --password (o BENCH_USUARIO / BENCH_PASSWORD)")
+
+    etapas = []
+    for n, usuarios in enumerate(args.usuarios):
+        etapa = correr_etapa(args, usuarios, args.semilla + n)
+        _imprimir_etapa(etapa)
+        etapas.append(etapa)
+
+    saturacion = punto_saturacion(etapas, args.p95_max, args.errores_max)
+    if saturacion["en"] is None:
+        print(f"\nSin saturación hasta {etapas[-1]['usuarios']} usuarios")
+    else:
+        print(f"\nSaturación: sano hasta {saturacion['usuarios'] or 0} usuarios; "
+              f"con {saturacion['en']}, {saturacion['motivo']}")
+
+    resultado = {
+        "version": _version(),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "etiqueta": args.etiqueta,
+        "parametros": {
+            "url": args.url, "duracion": args.duracion, "pausa": args.pausa, "paginas": args.paginas,
+            "prob_export": args.prob_export, "meses": args.meses, "hasta": args.hasta.isoformat(),
+            "p95_max": args.p95_max, "errores_max": args.errores_max, "semilla": args.semilla,
+        },
+        "saturacion": saturacion,
+        "etapas": etapas,
+    }
+    salida = args.salida
+    if not salida:
+        os.makedirs(DIRECTORIO_RESULTADOS, exist_ok=True)
+        salida = os.path.join(DIRECTORIO_RESULTADOS, f"carga-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"Resultados en {salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""
+Generador de un conjunto de ventas sintético para pruebas de rendimiento.
+
+Crea en una base de SQL Server local (de pruebas, nunca la de CONTPAQi) tablas con
+los mismos nombres y columnas que leen los reportes: zzVentasPorProducto,
+zzVentasResumen, admProductos y zz_SucursalesReporte. Las consultas del servicio
+usan T-SQL (WITH (NOLOCK), OPTION (RECOMPILE), GROUPING SETS, OFFSET/FETCH), así
+que el sustituto tiene que ser SQL Server; la edición Developer o Express en un
+contenedor basta:
+
+    docker run -d --name reportes-bench -e ACCEPT_EULA=Y -e MSSQL_SA_PASSWORD=Bench.2025 \\
+        -p 14333:1433 mcr.microsoft.com/mssql/server:2022-latest
+
+Los datos imitan la forma de los reales: tickets de 1 a 8 partidas, venta por
+hora con picos a mediodía y en la tarde, más venta en fin de semana y en
+diciembre, sucursales de tamaños distintos y pocos productos concentrando la
+mayor parte de la venta. Con la misma semilla se obtiene exactamente el mismo
+conjunto.
+
+Por seguridad solo se reemplazan tablas creadas por este script (las marca con
+la tabla zzBenchmarkDatos); si encuentra vistas u otras tablas con esos nombres,
+se detiene.
+
+Uso (desde reporter_backend):
+    python -m benchmarks.dataset_sintetico --dsn "DRIVER={ODBC Driver 18 for SQL Server};SERVER=localhost,14333;DATABASE=bench;UID=sa;PWD=Bench.2025;TrustServerCertificate=yes" --filas 1000000
+    python -m benchmarks.dataset_sintetico --filas 100000 --sucursales 4 --productos 800 --semilla 7
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, time as hora_del_dia, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TAMANO_LOTE = 10_000
+IVA = Decimal("0.16")
+CENTAVOS = Decimal("0.01")
+
+MESES = [
+    "ENERO", "FEBRERO", "MARZO", "ABRIL", "MAYO", "JUNIO",
+    "JULIO", "AGOSTO", "SEPTIEMBRE", "OCTUBRE", "NOVIEMBRE", "DICIEMBRE",
+]
+
+# Peso relativo de cada hora (0-23): cerrado de madrugada, pico de comida y de tarde
+PESOS_HORA = [
+    0, 0, 0, 0, 0, 0, 0, 1,
+    3, 5, 7, 8, 10, 12, 11, 8,
+    7, 8, 10, 11, 9, 6, 3, 1,
+]
+# Lunes a domingo
+PESOS_DIA_SEMANA = [0.85, 0.8, 0.85, 0.9, 1.1, 1.4, 1.25]
+# Enero a diciembre: cuesta de enero, repunte en mayo (día de las madres) y diciembre
+PESOS_MES = [0.8, 0.85, 0.95, 0.95, 1.1, 0.95, 1.0, 1.0, 0.95, 1.0, 1.1, 1.5]
+
+UNIDADES = ["PIEZA", "PIEZA", "PIEZA", "KILO", "CAJA", "LITRO", "PAQUETE"]
+FAMILIAS = [
+    "ABARROTES", "BEBIDA", "LÁCTEO", "CARNE", "PANADERÍA", "LIMPIEZA",
+    "BOTANA", "FRUTA", "VERDURA", "CONGELADO", "DULCE", "FARMACIA",
+]
+MARCAS = ["LA GRANJA", "DON PEPE", "SOL", "ÑANDÚ", "MONTAÑA", "EL FARO", "BRISA", "CAMPO & CÍA"]
+PRESENTACIONES = ["250 G", "500 G", "1 KG", "1 L", "2 L", "600 ML", "12 PZ", "CHICO", "GRANDE"]
+NOMBRES_SUCURSAL = [
+    "MATRIZ", "CENTRO", "NORTE", "SUR", "PONIENTE", "ORIENTE", "PLAZA MAYOR",
+    "AEROPUERTO", "COLONIAS", "SAN JOSÉ", "LA PAZ", "PEÑASCO",
+]
+
+TABLAS = ["zzVentasPorProducto", "zzVentasResumen", "admProductos", "zz_SucursalesReporte"]
+TABLA_MARCA = "zzBenchmarkDatos"
+
+DDL = [
+    """
+    CREATE TABLE admProductos (
+        CIDPRODUCTO INT NOT NULL PRIMARY KEY,
+        CCODIGOPRODUCTO VARCHAR(30) NOT NULL,
+        CNOMBREPRODUCTO VARCHAR(60) NOT NULL
+    )
+    """,
+    "CREATE TABLE zz_SucursalesReporte (nombre VARCHAR(60) NOT NULL PRIMARY KEY)",
+    """
+    CREATE TABLE zzVentasPorProducto (
+        fecha DATE NOT NULL,
+        Mes VARCHAR(12) NOT NULL,
+        hora TIME(0) NOT NULL,
+        id_pro INT NOT NULL,
+        CCODIGOPRODUCTO VARCHAR(30) NOT NULL,
+        CNOMBREPRODUCTO VARCHAR(60) NOT NULL,
+        cantidad DECIMAL(18, 4) NOT NULL,
+        CNOMBREUNIDAD VARCHAR(20) NOT NULL,
+        precio DECIMAL(18, 4) NOT NULL,
+        Importe DECIMAL(18, 4) NOT NULL,
+        descuento DECIMAL(18, 4) NOT NULL,
+        impuesto DECIMAL(18, 4) NOT NULL,
+        Total DECIMAL(18, 4) NOT NULL,
+        CNOMBREALMACEN VARCHAR(60) NOT NULL,
+        id_venta INT NOT NULL,
+        id_movimiento INT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE zzVentasResumen (
+        id_venta INT NOT NULL,
+        sucursal VARCHAR(60) NOT NULL,
+        fecha DATE NOT NULL,
+        hora TIME(0) NOT NULL,
+        total_venta DECIMAL(18, 4) NOT NULL
+    )
+    """,
+    f"""
+    CREATE TABLE {TABLA_MARCA} (
+        filas INT NOT NULL, tickets INT NOT NULL, sucursales INT NOT NULL, productos INT NOT NULL,
+        semilla INT NOT NULL, desde DATE NOT NULL, hasta DATE NOT NULL, generado DATETIME2 NOT NULL
+    )
+    """,
+]
+
+# Se crean después de la carga (insertar con índices es varias veces más lento).
+# Solo 'fecha', como la recomendación del reporte (ver benchmarks.verificar_planes).
+INDICES = [
+    "CREATE CLUSTERED INDEX ix_ventas_fecha ON zzVentasPorProducto (fecha)",
+    "CREATE INDEX ix_ventas_id_pro ON zzVentasPorProducto (id_pro)",
+    "CREATE CLUSTERED INDEX ix_resumen_fecha ON zzVentasResumen (fecha)",
+]
+
+
+# ----------------- Generación -----------------
+
+class Catalogo:
+    """Productos y sucursales del conjunto, con sus pesos de venta."""
+
+    def __init__(self, productos: int, sucursales: int, rnd: random.Random):
+        self.productos: List[Tuple[int, str, str, str, Decimal]] = []
+        for i in range(1, productos + 1):
+            familia = FAMILIAS[i % len(FAMILIAS)]
+            nombre = f"{familia} {rnd.choice(MARCAS)} {rnd.choice(PRESENTACIONES)} {i}"
+            # Precios con cola larga: la mayoría baratos, algunos caros
+            precio = Decimal(str(round(min(math.exp(rnd.gauss(3.6, 0.9)), 5000.0), 2)))
+            self.productos.append((i, f"{familia[:3]}{i:06d}", nombre[:60], rnd.choice(UNIDADES), precio))
+        # Popularidad tipo Zipf en un orden aleatorio (el id no dice qué tan vendido es)
+        pesos = [1 / (rango + 1) ** 0.9 for rango in range(productos)]
+        rnd.shuffle(pesos)
+        self.acumulado_productos = _acumular(pesos)
+
+        self.sucursales = [
+            NOMBRES_SUCURSAL[i] if i < len(NOMBRES_SUCURSAL) else f"SUCURSAL {i + 1}"
+            for i in range(sucursales)
+        ]
+        self.acumulado_sucursales = _acumular([1 / (i + 1) ** 0.6 for i in range(sucursales)])
+
+
+def _acumular(pesos: List[float]) -> List[float]:
+    total, acumulado = 0.0, []
+    for p in pesos:
+        total += p
+        acumulado.append(total)
+    return acumulado
+
+
+def _dias_con_peso(desde: date, hasta: date) -> Tuple[List[date], List[float]]:
+    dias = [desde + timedelta(days=n) for n in range((hasta - desde).days + 1)]
+    pesos = [PESOS_DIA_SEMANA[d.weekday()] * PESOS_MES[d.month - 1] for d in dias]
+    return dias, _acumular(pesos)
+
+
+def _partidas_por_ticket(rnd: random.Random) -> int:
+    # Geométrica truncada: promedio cercano a 2.5 partidas
+    n = 1
+    while n < 8 and rnd.random() < 0.6:
+        n += 1
+    return n
+
+
+def generar_ventas(
+    filas: int,
+    catalogo: Catalogo,
+    desde: date,
+    hasta: date,
+    rnd: random.Random,
+) -> Iterator[Tuple[List[Tuple[Any, ...]], List[Tuple[Any, ...]]]]:
+    """
+    Produce lotes (partidas, tickets) hasta juntar 'filas' partidas.
+    Cada partida tiene las columnas de zzVentasPorProducto (id_movimiento es único
+    por partida; un ticket puede repetir producto) y cada ticket las de
+    zzVentasResumen. Los tickets nunca quedan partidos entre lotes.
+    """
+    dias, acumulado_dias = _dias_con_peso(desde, hasta)
+    horas = list(range(24))
+    acumulado_horas = _acumular([float(p) for p in PESOS_HORA])
+    productos = catalogo.productos
+
+    generadas = 0
+    id_venta = 0
+    id_movimiento = 0
+    partidas: List[Tuple[Any, ...]] = []
+    tickets: List[Tuple[Any, ...]] = []
+    while generadas < filas:
+        id_venta += 1
+        dia = rnd.choices(dias, cum_weights=acumulado_dias)[0]
+        hora = hora_del_dia(rnd.choices(horas, cum_weights=acumulado_horas)[0], rnd.randrange(60), rnd.randrange(60))
+        sucursal = rnd.choices(catalogo.sucursales, cum_weights=catalogo.acumulado_sucursales)[0]
+        mes = MESES[dia.month - 1]
+
+        n = min(_partidas_por_ticket(rnd), filas - generadas)
+        total_ticket = Decimal(0)
+        for id_pro, codigo, nombre, unidad, precio_base in rnd.choices(
+            productos, cum_weights=catalogo.acumulado_productos, k=n
+        ):
+            cantidad = Decimal(rnd.randint(1, 3) if rnd.random() < 0.9 else rnd.randint(4, 24))
+            importe = (cantidad * precio_base).quantize(CENTAVOS)
+            descuento = (importe * Decimal("0.10")).quantize(CENTAVOS) if rnd.random() < 0.08 else Decimal(0)
+            impuesto = ((importe - descuento) * IVA).quantize(CENTAVOS)
+            total = importe - descuento + impuesto
+            total_ticket += total
+            id_movimiento += 1
+            partidas.append((
+                dia, mes, hora, id_pro, codigo, nombre, cantidad, unidad,
+                precio_base, importe, descuento, impuesto, total, sucursal, id_venta, id_movimiento,
+            ))
+        tickets.append((id_venta, sucursal, dia, hora, total_ticket))
+        generadas += n
+
+        if len(partidas) >= TAMANO_LOTE:
+            yield partidas, tickets
+            partidas, tickets = [], []
+    if partidas:
+        yield partidas, tickets
+
+
+# ----------------- Carga en SQL Server -----------------
+
+def _existe(cur: Any, nombre: str) -> Optional[str]:
+    """'U' si es tabla, 'V' si es vista, None si no existe."""
+    cur.execute("SELECT type FROM sys.objects WHERE object_id = OBJECT_ID(?)", nombre)
+    fila = cur.fetchone()
+    return fila[0].strip() if fila else None
+
+
+def leer_marca(cur: Any) -> Optional[Dict[str, Any]]:
+    """Parámetros del conjunto cargado, o None si la base no tiene uno generado por este script."""
+    if _existe(cur, TABLA_MARCA) != "U":
+        return None
+    cur.execute(f"SELECT filas, tickets, sucursales, productos, semilla, desde, hasta, generado FROM {TABLA_MARCA}")
+    fila = cur.fetchone()
+    if fila is None:
+        return None
+    claves = ["filas", "tickets", "sucursales", "productos", "semilla", "desde", "hasta", "generado"]
+    return dict(zip(claves, fila))
+
+
+def _preparar_esquema(cur: Any) -> None:
+    propias = _existe(cur, TABLA_MARCA) == "U"
+    for tabla in TABLAS:
+        tipo = _existe(cur, tabla)
+        if tipo is None:
+            continue
+        if tipo != "U" or not propias:
+            raise SystemExit(
+                f"'{tabla}' ya existe en esta base y no la creó este script. "
+                "Use una base de pruebas vacía."
+            )
+    for tabla in TABLAS + [TABLA_MARCA]:
+        if _existe(cur, tabla):
+            cur.execute(f"DROP TABLE {tabla}")
+    for sentencia in DDL:
+        cur.execute(sentencia)
+
+
+def cargar(
+    dsn: str,
+    filas: int,
+    sucursales: int = 8,
+    productos: int = 5000,
+    semilla: int = 0,
+    desde: date = date(2022, 1, 1),
+    hasta: date = date(2025, 10, 31),
+    indices: bool = True,
+) -> Dict[str, Any]:
+    """Reemplaza el conjunto de la base por uno nuevo con 'filas' partidas."""
+    import pyodbc
+
+    rnd = random.Random(semilla)
+    catalogo = Catalogo(productos, sucursales, rnd)
+    inicio = time.perf_counter()
+
+    conn = pyodbc.connect(dsn, autocommit=True)
+    try:
+        cur = conn.cursor()
+        _preparar_esquema(cur)
+        cur.fast_executemany = True
+
+        # CONTPAQi trae un producto 0 "(Ninguno)" que los reportes excluyen
+        cur.executemany(
+            "INSERT INTO admProductos VALUES (?, ?, ?)",
+            [(0, "(Ninguno)", "(Ninguno)")] + [(p[0], p[1], p[2]) for p in catalogo.productos],
+        )
+        cur.executemany("INSERT INTO zz_SucursalesReporte VALUES (?)", [(s,) for s in catalogo.sucursales])
+
+        cargadas = tickets = 0
+        for partidas, resumen in generar_ventas(filas, catalogo, desde, hasta, rnd):
+            cur.executemany(
+                "INSERT INTO zzVentasPorProducto VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", partidas
+            )
+            cur.executemany("INSERT INTO zzVentasResumen VALUES (?, ?, ?, ?, ?)", resumen)
+            cargadas += len(partidas)
+            tickets += len(resumen)
+            if cargadas % (TAMANO_LOTE * 50) < len(partidas):
+                print(f"  {cargadas:>12,} filas ({time.perf_counter() - inicio:,.0f} s)")
+
+        if indices:
+            for sentencia in INDICES:
+                cur.execute(sentencia)
+        cur.execute(
+            f"INSERT INTO {TABLA_MARCA} VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            cargadas, tickets, sucursales, productos, semilla, desde, hasta, datetime.now(),
+        )
+        return leer_marca(cur) or {}
+    finally:
+        conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Genera y carga ventas sintéticas en un SQL Server de pruebas")
+    parser.add_argument("--dsn", default=os.environ.get("BENCH_DSN"),
+                        help="Cadena ODBC de la base de pruebas (o variable BENCH_DSN)")
+    parser.add_argument("--filas", type=int, default=100_000, help="Partidas de zzVentasPorProducto")
+    parser.add_argument("--sucursales", type=int, default=8)
+    parser.add_argument("--productos", type=int, default=5000)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--desde", type=date.fromisoformat, default=date(2022, 1, 1))
+    parser.add_argument("--hasta", type=date.fromisoformat, default=date(2025, 10, 31))
+    parser.add_argument("--sin-indices", action="store_true", help="No crea el índice de 'fecha' (para comparar)")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("falta --dsn (o la variable BENCH_DSN)")
+
+    inicio = time.perf_counter()
+    marca = cargar(
+        args.dsn, args.filas, args.sucursales, args.productos, args.semilla,
+        args.desde, args.hasta, indices=not args.sin_indices,
+    )
+    print(f"Cargadas {marca.get('filas', 0):,} partidas en {marca.get('tickets', 0):,} tickets "
+          f"({time.perf_counter() - inicio:,.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Verifica en SQL Server que los filtros de fecha del reporte usen el índice de 'fecha'.
+
+Trabaja sobre la base de pruebas de benchmarks.dataset_sintetico (mismas tablas,
+índices clustered ix_ventas_fecha e ix_resumen_fecha). Arma los WHERE con el mismo
+helper del servicio (_build_filtros_where), pide el plan estimado con
+SET SHOWPLAN_XML ON (no ejecuta las consultas) y lo lee con el mismo código que la
+bitácora de consultas lentas. Cada combinación debe llegar a la vista solo con
+Index Seek sobre su índice de fecha, nunca con un Scan. Como contraste muestra el
+plan del filtro anterior (MONTH(fecha) = ?).
+
+Los periodos se toman relativos al último mes del conjunto cargado.
+
+Uso (desde reporter_backend):
+    python -m benchmarks.verificar_planes --dsn "DRIVER={ODBC Driver 18 for SQL Server};SERVER=localhost,14333;DATABASE=bench;UID=sa;PWD=Bench.2025;TrustServerCertificate=yes"
+"""
+import argparse
+import os
+import sys
+import xml.etree.ElementTree as ET
+from datetime import date
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import dataset_sintetico
+
+ESPACIO_PLAN = "{http://schemas.microsoft.com/sqlserver/2004/07/showplan}"
+
+# Vista -> (índice de fecha esperado, sentencia con la forma de las del servicio)
+VISTAS = {
+    "zzVentasPorProducto": ("ix_ventas_fecha", "SELECT COUNT(1) FROM zzVentasPorProducto WITH (NOLOCK) {where} OPTION (RECOMPILE);"),
+    "zzVentasResumen": ("ix_resumen_fecha", "SELECT ISNULL(SUM(total_venta), 0) FROM zzVentasResumen WITH (NOLOCK) {where} OPTION (RECOMPILE);"),
+}
+
+
+def _casos(hasta: date) -> List[Tuple[str, Dict[str, Any]]]:
+    inicio_mes = hasta.replace(day=1)
+    return [
+        ("rango explícito", dict(fecha_desde=inicio_mes, fecha_hasta=hasta)),
+        ("solo desde", dict(fecha_desde=date(hasta.year, 1, 1))),
+        ("mes y año", dict(mes=hasta.month, anio=hasta.year)),
+        ("solo año", dict(anio=hasta.year)),
+        ("solo mes (todos los años)", dict(mes=hasta.month)),
+        ("solo mes (diciembre)", dict(mes=12)),
+    ]
+
+
+# ----------------- Lectura del plan -----------------
+
+def _accesos(plan: str) -> List[Tuple[str, str, str]]:
+    """(operador físico, tabla, índice) de cada lectura de tabla o índice del plan."""
+    accesos = []
+    for relop in ET.fromstring(plan).iter(f"{ESPACIO_PLAN}RelOp"):
+        for hijo in relop:
+            if hijo.tag not in (f"{ESPACIO_PLAN}IndexScan", f"{ESPACIO_PLAN}TableScan"):
+                continue
+            objeto = hijo.find(f"{ESPACIO_PLAN}Object")
+            if objeto is not None:
+                accesos.append((
+                    relop.get("PhysicalOp", ""),
+                    objeto.get("Table", "").strip("[]"),
+                    objeto.get("Index", "").strip("[]"),
+                ))
+    return accesos
+
+
+def _filas_estimadas(plan: str) -> float:
+    sentencia = next(ET.fromstring(plan).iter(f"{ESPACIO_PLAN}StmtSimple"), None)
+    return float(sentencia.get("StatementEstRows", 0)) if sentencia is not None else 0.0
+
+
+def _usa_indice(accesos: List[Tuple[str, str, str]], vista: str, indice: str) -> bool:
+    propios = [a for a in accesos if a[1] == vista]
+    return bool(propios) and all("Seek" in op and idx == indice for op, _, idx in propios)
+
+
+def _planes(cur: Any, sentencias: List[Tuple[str, List[Any]]]) -> List[str]:
+    """Plan estimado (XML) de cada sentencia, sin ejecutarla."""
+    from app.core.consultas_lentas import leer_planes
+
+    planes = []
+    cur.execute("SET SHOWPLAN_XML ON")
+    try:
+        for sql, params in sentencias:
+            cur.execute(sql, params)
+            planes.append("".join(leer_planes(cur)))
+    finally:
+        cur.execute("SET SHOWPLAN_XML OFF")
+    return planes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Verifica en SQL Server los planes de los filtros de fecha")
+    parser.add_argument("--dsn", default=os.environ.get("BENCH_DSN"),
+                        help="Cadena ODBC de la base de pruebas (o variable BENCH_DSN)")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("falta --dsn (o la variable BENCH_DSN)")
+
+    # El servicio lee los límites de fechas (filtros solo por mes) de la base configurada
+    os.environ["SQLSERVER_REPORTING_DSN"] = args.dsn
+    import pyodbc
+    from app.reports.ventas_producto_service import _build_filtros_where
+
+    conn = pyodbc.connect(args.dsn, autocommit=True)
+    try:
+        cur = conn.cursor()
+        marca = dataset_sintetico.leer_marca(cur)
+        if marca is None:
+            raise SystemExit("La base no tiene un conjunto de benchmarks.dataset_sintetico")
+        print(f"Conjunto: {marca['filas']:,} partidas entre {marca['desde']} y {marca['hasta']}\n")
+
+        # Los WHERE se arman antes: con SHOWPLAN_XML activo nada se ejecuta
+        sentencias, etiquetas = [], []
+        for nombre, filtros in _casos(marca["hasta"]):
+            for vista, (indice, plantilla) in VISTAS.items():
+                where, params = _build_filtros_where(es_vista_resumen=vista == "zzVentasResumen", **filtros)
+                sentencias.append((plantilla.format(where=where), params))
+                etiquetas.append((f"{nombre} [{vista}]", vista, indice))
+        antes = ("SELECT COUNT(1) FROM zzVentasPorProducto WITH (NOLOCK) WHERE MONTH(fecha) = ? OPTION (RECOMPILE);",
+                 [marca["hasta"].month])
+        planes = _planes(cur, sentencias + [antes])
+    finally:
+        conn.close()
+
+    fallas = 0
+    for (etiqueta, vista, indice), plan in zip(etiquetas, planes):
+        accesos = _accesos(plan)
+        ok = _usa_indice(accesos, vista, indice)
+        fallas += not ok
+        print(f"[{'OK' if ok else 'FALLA'}] {etiqueta}: ~{_filas_estimadas(plan):,.0f} filas estimadas")
+        for op, tabla, idx in accesos:
+            print(f"       {op} {tabla} ({idx or 'heap'})")
+
+    # Contraste: el predicado anterior no puede buscar por el índice
+    print(f"\n[ANTES] MONTH(fecha) = {marca['hasta'].month}: ~{_filas_estimadas(planes[-1]):,.0f} filas estimadas")
+    for op, tabla, idx in _accesos(planes[-1]):
+        print(f"       {op} {tabla} ({idx or 'heap'})")
+
+    sys.exit(1 if fallas else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ import type {
     VentasProductoKpis,
     TopProducto,
     VentasPorSucursal,
+    DashboardBundle,
     // Puedes importar VentaPorHoraItem si lo definiste en types, si no usa any
 } from "../types/reportes";
 
@@ -38,4 +39,13 @@ export async function fetchHorasPico(params?: Record<string, unknown>) {
         { params }
     );
     return res.data;
-}
\ No newline at end of file
+}
+
+// Todos los widgets del dashboard en una sola petición
+export async function fetchDashboardBundle(params?: Record<string, unknown>) {
+    const res = await apiClient.get<DashboardBundle>(
+        "/api/v1/dashboard/bundle",
+        { params }
+    );
+    return res.data;
+}
@@ -1,6 +1,6 @@
 // src/api/ventasProducto.ts
 import { apiClient } from "./client";
-import type { VentasProductoPage, ProductoOpcion } from "../types/reportes";
+import type { VentasProductoPage, VentasProductoColumnas, VentasProductoRow, ProductoOpcion } from "../types/reportes";
 
 export interface VentasProductoQuery {
     page?: number;
@@ -12,18 +12,48 @@ export interface VentasProductoQuery {
     producto?: string;
     anio?: number;
     ejecutar?: boolean;
+    cursor?: string; // 'next_cursor' de la página anterior (paginación por llave)
+    conteo?: "exacto" | "diferido";
+}
+
+// Arma la página de siempre (un objeto por renglón) a partir de format=columns
+export function decodificarColumnas(resp: VentasProductoColumnas): VentasProductoPage {
+    const { length, schema, columns, ...pagina } = resp;
+    const valores = schema.map((campo, i) => {
+        const diccionario = campo.dictionary;
+        return diccionario ? (columns[i] as number[]).map((j) => diccionario[j]) : columns[i];
+    });
+
+    const items = new Array<VentasProductoRow>(length);
+    for (let r = 0; r < length; r++) {
+        const fila: Record<string, unknown> = { Folio: "" };
+        for (let c = 0; c < schema.length; c++) fila[schema[c].name] = valores[c][r];
+        items[r] = fila as unknown as VentasProductoRow;
+    }
+    return { ...pagina, items };
 }
 
 // --- CAMBIO AQUÍ: Agregamos 'signal' ---
+// Se pide en columnas (respuesta más chica en enlaces lentos) y se decodifica aquí:
+// quien llama sigue recibiendo la página con 'items'.
 export async function fetchVentasProductoRows(params?: VentasProductoQuery, signal?: AbortSignal) {
-    const res = await apiClient.get<VentasProductoPage>(
+    const res = await apiClient.get<VentasProductoColumnas>(
         "/api/v1/ventas-producto/rows",
         {
-            params,
+            params: { ...params, format: "columns" },
             signal // <--- Pasamos la señal a axios
         }
     );
-    return res.data;
+    return decodificarColumnas(res.data);
+}
+
+// Total exacto para completar una página pedida con conteo "diferido"
+export async function fetchVentasProductoConteo(params?: VentasProductoQuery, signal?: AbortSignal) {
+    const res = await apiClient.get<{ total_items: number }>(
+        "/api/v1/ventas-producto/rows/count",
+        { params, signal }
+    );
+    return res.data.total_items;
 }
 
 // ... (resto de funciones: fetchSucursales, fetchProductos, fetchVentasExcel siguen igual)
@@ -18,9 +18,7 @@ import type {
 
 import {
     fetchKpis,
-    fetchHorasPico,
-    fetchTopProductos,
-    fetchVentasPorSucursal
+    fetchDashboardBundle
 } from "../api/dashboard";
 
 import {
@@ -101,16 +99,11 @@ export const Dashboard: React.FC = () => {
     const cargarDatosDashboard = async () => {
         try {
             const filtros = buildFilterParams(true);
-            const [kpisResp, horasResp, topResp, sucsResp] = await Promise.all([
-                fetchKpis(filtros),
-                fetchHorasPico(filtros),
-                fetchTopProductos(filtros),
-                fetchVentasPorSucursal(filtros)
-            ]);
-            setKpis(kpisResp);
-            setHorasPico(horasResp);
-            setTopProductos(topResp);
-            setSucursalesMesActual(sucsResp);
+            const bundle = await fetchDashboardBundle(filtros);
+            setKpis(bundle.kpis.data);
+            setHorasPico(bundle.horas_pico.data ?? []);
+            setTopProductos(bundle.top_productos.data ?? []);
+            setSucursalesMesActual(bundle.ventas_por_sucursal.data ?? []);
         } catch (err) { console.error(err); }
     };
 
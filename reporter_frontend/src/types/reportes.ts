@@ -23,6 +23,27 @@ export interface VentasProductoPage {
     total_items: number;
     page: number;
     page_size: number;
+    next_cursor?: string | null; // Token para pedir la siguiente página por llave
+    total_exacto?: boolean; // false si total_items es estimado (conteo diferido)
+}
+
+// Respuesta de /rows con format=columns: un arreglo por columna en el orden de 'schema'.
+// Las columnas con 'dictionary' traen índices a esa lista en lugar del valor.
+export interface ColumnaEsquema {
+    name: keyof VentasProductoRow;
+    type: "string" | "int" | "float";
+    dictionary?: (string | null)[];
+}
+
+export interface VentasProductoColumnas {
+    total_items: number;
+    page: number;
+    page_size: number;
+    length: number;
+    schema: ColumnaEsquema[];
+    columns: unknown[][];
+    next_cursor?: string | null;
+    total_exacto?: boolean;
 }
 
 export interface VentasProductoKpis {
@@ -59,4 +80,18 @@ export interface ProductoOpcion {
     id_pro: number;
     codigo: string;
     nombre: string;
-}
\ No newline at end of file
+}
+// Respuesta de /dashboard/bundle: cada widget trae su dato, su tiempo y su error
+export interface WidgetResultado<T> {
+    data: T | null;
+    ms: number;
+    error: string | null;
+}
+
+export interface DashboardBundle {
+    kpis: WidgetResultado<VentasProductoKpis>;
+    horas_pico: WidgetResultado<VentaPorHoraItem[]>;
+    top_productos: WidgetResultado<TopProducto[]>;
+    ventas_por_sucursal: WidgetResultado<VentasPorSucursal[]>;
+    ms_total: number;
+}